@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of ann_parsing.parse_ann against the former four-pass parser.
+
+Usage: python bench_ann_parsing.py [-n N_FILES] [-a ANNOTS_PER_FILE]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+import ann_parsing
+import synthetic
+
+
+def legacy_parse_one_ann(info, root, filename, relevant_labels, 
+                         ignore_related=False, with_notes=False):
+    '''
+    Former implementation of ann_parsing.parse_one_ann (four passes over the
+    file and list lookups), kept here as reference.
+    '''
+    f = open(os.path.join(root,filename)).readlines()
+    for line in f:
+       splitted = line.split('\t')
+       if len(splitted)<3:
+            return info
+       if len(splitted)>3:
+            return info
+       if (splitted[0][0] == 'T') & (';' in ' '.join(splitted[1].split(' ')[1:])):
+            return info
+    ignore_marks = []    
+    if ignore_related == True:   
+        for line in f:
+            if line[0] != 'R':
+                continue
+            ignore_marks.append(line.split('\t')[1].split(' ')[1].split(':')[1])
+            ignore_marks.append(line.split('\t')[1].split(' ')[2].split(':')[1])
+    mark2code = {}
+    if with_notes == True:
+        for line in f:
+            if line[0] != '#':
+                continue
+            line_split = line.split('\t')
+            mark2code[line_split[1].split(' ')[1]] = line_split[2].strip()
+    for line in f:
+        if line[0] != 'T':
+            continue
+        splitted = line.split('\t')
+        mark = splitted[0]
+        if mark in ignore_marks:
+            continue
+        label_offset = splitted[1]
+        label = label_offset.split(' ')[0]
+        if label not in relevant_labels:
+            continue
+        offset = ' '.join(label_offset.split(' ')[1:])
+        span = splitted[2].strip()
+        if with_notes == False:
+            info.append([filename, mark, label, offset, span])
+            continue
+        if mark in mark2code.keys():
+            code = mark2code[mark]
+            info.append([filename, mark, label, offset, span, code])
+    return info
+
+
+def legacy_parse_ann(datapath, relevant_labels, with_notes=False):
+    info = []
+    for root, dirs, files in os.walk(datapath):
+         for filename in files:
+             if filename[-3:] != 'ann':
+                 continue            
+             info = legacy_parse_one_ann(info, root, filename, relevant_labels,
+                                         ignore_related=True, 
+                                         with_notes=with_notes)
+    columns = ['filename', 'mark', 'label', 'offset', 'span']
+    if with_notes == True:
+        columns.append('code')
+    return pd.DataFrame(info, columns=columns)
+
+
+def timeit(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark ANN parsing')
+    parser.add_argument('-n', '--n_files', type=int, default=2000)
+    parser.add_argument('-a', '--annots_per_file', type=int, default=50)
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    args = parser.parse_args()
+    
+    labels = ['MORFOLOGIA_NEOPLASIA']
+    with tempfile.TemporaryDirectory() as datapath:
+        gs, _ = synthetic.generate_annotations(args.n_files * args.annots_per_file,
+                                               annots_per_file=args.annots_per_file)
+        synthetic.write_ann_files(datapath, gs)
+        for with_notes in [False, True]:
+            t_old, old = timeit(lambda: legacy_parse_ann(datapath, labels, 
+                                                         with_notes),
+                                args.repeat)
+            t_new, new = timeit(lambda: ann_parsing.parse_ann(datapath, labels,
+                                                              with_notes),
+                                args.repeat)
+            if new.equals(old) == False:
+                raise Exception('Parsed annotations differ from the former parser')
+            print('with_notes={}\tlegacy={:.3f}s\tcurrent={:.3f}s\tspeedup={:.2f}x'
+                  .format(with_notes, t_old, t_new, t_old / t_new))
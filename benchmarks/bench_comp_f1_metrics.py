@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Scaling benchmark of comp_f1_diag_proc.calculate_metrics against the former
+per-clinical-case loop.
+
+Usage: python bench_comp_f1_metrics.py [-n 1000 10000 100000]
+"""
+
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+import comp_f1_diag_proc
+
+
+def legacy_calculate_metrics(df_gs, df_pred):
+    '''
+    Former implementation of comp_f1_diag_proc.calculate_metrics (two 
+    boolean masks over the full frames per clinical case), kept here as 
+    reference.
+    '''
+    Pred_Pos_per_cc = df_pred.drop_duplicates(subset=['clinical_case', 
+                                                  "code"]).groupby("clinical_case")["code"].count()
+    Pred_Pos = df_pred.drop_duplicates(subset=['clinical_case', "code"]).shape[0]
+    GS_Pos_per_cc = df_gs.drop_duplicates(subset=['clinical_case', 
+                                               "code"]).groupby("clinical_case")["code"].count()
+    GS_Pos = df_gs.drop_duplicates(subset=['clinical_case', "code"]).shape[0]
+    cc = set(df_gs.clinical_case.tolist())
+    TP_per_cc = pd.Series(dtype=float)
+    for c in cc:
+        pred = set(df_pred.loc[df_pred['clinical_case']==c,'code'].values)
+        gs = set(df_gs.loc[df_gs['clinical_case']==c,'code'].values)
+        TP_per_cc[c] = len(pred.intersection(gs))
+    TP = sum(TP_per_cc.values)
+    P_per_cc =  TP_per_cc / Pred_Pos_per_cc
+    P = TP / Pred_Pos
+    R_per_cc = TP_per_cc / GS_Pos_per_cc
+    R = TP / GS_Pos
+    F1_per_cc = (2 * P_per_cc * R_per_cc) / (P_per_cc + R_per_cc)
+    if (P+R) == 0:
+        return P_per_cc, P, R_per_cc, R, F1_per_cc, 0
+    F1 = (2 * P * R) / (P + R)
+    return P_per_cc, P, R_per_cc, R, F1_per_cc, F1
+
+
+def make_frames(n_cases, seed=0, codes_per_cc=5):
+    '''
+    Build random GS and run frames as returned by comp_f1_diag_proc.read_gs
+    and comp_f1_diag_proc.read_run.
+    '''
+    rnd = np.random.RandomState(seed)
+    codes = np.array(['{}{:02d}.{}'.format(chr(97 + i % 26), i % 100, i % 10)
+                      for i in range(500)])
+    cases = np.array(['S{:07d}'.format(i) for i in range(n_cases)])
+    n = n_cases * codes_per_cc
+    df_gs = pd.DataFrame({'clinical_case': cases[rnd.randint(0, n_cases, n)],
+                          'code': codes[rnd.randint(0, 50, n)]})
+    df_pred = pd.DataFrame({'clinical_case': cases[rnd.randint(0, n_cases, n)],
+                            'code': codes[rnd.randint(0, 50, n)]})
+    return df_gs, df_pred.drop_duplicates()
+
+
+def same_results(a, b):
+    for x, y in zip(a, b):
+        if isinstance(x, pd.Series):
+            if x.sort_index().equals(y.sort_index()) == False:
+                return False
+        elif x != y:
+            return False
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark diag/proc metrics')
+    parser.add_argument('-n', '--n_cases', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    parser.add_argument('--legacy_max', type=int, default=10000,
+                        help='largest number of clinical cases scored with the former implementation')
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+    
+    for n in args.n_cases:
+        df_gs, df_pred = make_frames(n)
+        start = time.perf_counter()
+        new = comp_f1_diag_proc.calculate_metrics(df_gs, df_pred)
+        t_new = time.perf_counter() - start
+        if n > args.legacy_max:
+            print('cases={}\tlegacy=skipped\tcurrent={:.3f}s'.format(n, t_new))
+            continue
+        start = time.perf_counter()
+        old = legacy_calculate_metrics(df_gs, df_pred)
+        t_old = time.perf_counter() - start
+        if same_results(old, new) == False:
+            raise Exception('Metrics differ from the former implementation')
+        print('cases={}\tlegacy={:.3f}s\tcurrent={:.3f}s\tspeedup={:.1f}x'
+              .format(n, t_old, t_new, t_old / t_new))
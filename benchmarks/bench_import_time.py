@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Import-time benchmark of main.py for every subtask (python -X importtime).
+
+For each subtask, main.py is run on the toy data with -X importtime, and the
+total import time and the slowest top-level imports are reported. The
+script exits with an error if a NER/NORM run imports a module of the 
+ranking stack (cantemist_coding, trectools, matplotlib, scipy, sklearn), so
+it can be used as a check in CI.
+
+Usage: python bench_import_time.py [-r REPEAT]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SRC = os.path.join(ROOT, 'src')
+
+COMMANDS = {
+    'ner': ['-g', '../gs-data/', '-p', '../toy-data/', '-s', 'ner'],
+    'norm': ['-g', '../gs-data/', '-p', '../toy-data/', '-s', 'norm'],
+    'coding': ['-g', '../gs-data/gs-coding.tsv', '-p', '../toy-data/pred-coding.tsv',
+               '-c', '../valid-codes.tsv', '-s', 'coding']}
+FORBIDDEN = {'ner': ['cantemist_coding', 'trectools', 'matplotlib', 'scipy', 'sklearn'],
+             'norm': ['cantemist_coding', 'trectools', 'matplotlib', 'scipy', 'sklearn'],
+             'coding': ['trectools', 'matplotlib', 'scipy', 'sklearn']}
+
+
+def import_times(subtask):
+    '''
+    Run main.py with -X importtime.
+
+    Returns
+    -------
+    times : dict
+        Cumulative import time (microseconds) of every imported module.
+    top_level : dict
+        Cumulative import time of the modules imported at top level.
+
+    '''
+    proc = subprocess.run([sys.executable, '-X', 'importtime', 'main.py'] +
+                          COMMANDS[subtask], cwd=SRC, capture_output=True,
+                          text=True)
+    if proc.returncode != 0:
+        raise Exception('main.py failed for subtask {}:\n{}'.format(subtask, 
+                                                                    proc.stderr))
+    times = {}
+    top_level = {}
+    for line in proc.stderr.splitlines():
+        if line.startswith('import time:') == False:
+            continue
+        _, cumulative, name = line.split('|')
+        if cumulative.strip().isdigit() == False:
+            continue
+        times[name.strip()] = int(cumulative)
+        if name.startswith(' ') & (name.startswith('  ') == False):
+            top_level[name.strip()] = int(cumulative)
+    return times, top_level
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark main.py import time')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    args = parser.parse_args()
+    
+    failed = False
+    for subtask in COMMANDS:
+        best = None
+        for _ in range(args.repeat):
+            times, top_level = import_times(subtask)
+            total = sum(top_level.values())
+            if (best is None) or (total < best[0]):
+                best = (total, top_level, times)
+        total, top_level, times = best
+        slowest = sorted(top_level.items(), key=lambda x: -x[1])[:3]
+        print('{}\timports={:.1f}ms\t{}'.format(
+            subtask, total / 1000,
+            ', '.join('{}={:.1f}ms'.format(k, v / 1000) for k, v in slowest)))
+        for module in FORBIDDEN[subtask]:
+            if any((name == module) | name.startswith(module + '.') for name in times):
+                print('ERROR: subtask {} imports {}'.format(subtask, module))
+                failed = True
+    
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of cantemist_ner_norm.calculate_metrics against the former 
+row-wise implementation.
+
+Usage: python bench_ner_norm_metrics.py [-n 10000 100000 1000000]
+"""
+
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+import cantemist_ner_norm
+import multi_codes
+
+# GS annotations with two valid codes that were hard-coded in the former
+# implementation: (clinical case, offset, code that was dropped, other code)
+LEGACY_MULTI_CODES = [('cc_onco838.ann', '2509 2534', '8441/0', '8441/3'),
+                      ('cc_onco1057.ann', '2791 2831', '8803/3', '8803/6')]
+
+
+def legacy_calculate_metrics(gs, pred, subtask):
+    '''
+    Former implementation of cantemist_ner_norm.calculate_metrics (row-wise
+    apply and merge/indicator passes), kept here as reference.
+    '''
+    Pred_Pos_per_cc = \
+        pred.drop_duplicates(subset=['clinical_case', "offset"]).\
+        groupby("clinical_case")["offset"].count()
+    Pred_Pos = pred.drop_duplicates(subset=['clinical_case', "offset"]).shape[0]
+    GS_Pos_per_cc = \
+        gs.drop_duplicates(subset=['clinical_case', "offset"]).\
+        groupby("clinical_case")["offset"].count()
+    GS_Pos = gs.drop_duplicates(subset=['clinical_case', "offset"]).shape[0]
+    df_sel = pd.merge(pred, gs, how="right", on=["clinical_case", "offset"])
+    if subtask=='norm':
+        df_sel["is_valid"] = \
+            df_sel.apply(lambda x: (x["code_gs"] == x["code_pred"]), axis=1)
+    else:
+        is_valid = df_sel.apply(lambda x: x.isnull().any()==False, axis=1)
+        df_sel = df_sel.assign(is_valid=is_valid.values)
+    if subtask=='norm':
+        df_sel = legacy_several_codes_one_annot(df_sel)
+    TP_per_cc = (df_sel[df_sel["is_valid"] == True]
+                 .groupby("clinical_case")["is_valid"].count())
+    TP = df_sel[df_sel["is_valid"] == True].shape[0]
+    cc_not_predicted = (pred.drop_duplicates(subset=["clinical_case"])
+                        .merge(gs.drop_duplicates(subset=["clinical_case"]), 
+                              on='clinical_case',
+                              how='right', indicator=True)
+                        .query('_merge == "right_only"')
+                        .drop(columns='_merge'))['clinical_case'].to_list()
+    for cc in cc_not_predicted:
+        TP_per_cc[cc] = 0
+    cc_not_GS = (gs.drop_duplicates(subset=["clinical_case"])
+                .merge(pred.drop_duplicates(subset=["clinical_case"]), 
+                      on='clinical_case',
+                      how='right', indicator=True)
+                .query('_merge == "right_only"')
+                .drop(columns='_merge'))['clinical_case'].to_list()
+    Pred_Pos_per_cc = Pred_Pos_per_cc.drop(cc_not_GS)
+    P_per_cc =  TP_per_cc / Pred_Pos_per_cc
+    P = TP / Pred_Pos
+    R_per_cc = TP_per_cc / GS_Pos_per_cc
+    R = TP / GS_Pos
+    F1_per_cc = (2 * P_per_cc * R_per_cc) / (P_per_cc + R_per_cc)
+    if (P+R) == 0:
+        return P_per_cc, P, R_per_cc, R, F1_per_cc, 0
+    F1 = (2 * P * R) / (P + R)
+    return P_per_cc, P, R_per_cc, R, F1_per_cc, F1
+
+
+def legacy_several_codes_one_annot(df_sel):
+    '''
+    Former handling of the two GS annotations with two valid codes.
+    '''
+    for clinical_case, offset, dropped_code, _ in LEGACY_MULTI_CODES:
+        rows = (df_sel['clinical_case'] == clinical_case) & (df_sel['offset'] == offset)
+        if any(df_sel.loc[rows]['is_valid']):
+            df_sel.loc[rows, 'is_valid'] = True
+        df_sel.drop(df_sel.loc[rows & (df_sel['code_gs'] == dropped_code)].index,
+                    inplace=True)
+    return df_sel
+
+
+def make_frames(n_annots, subtask, seed=0, annots_per_cc=20):
+    '''
+    Build random GS and prediction frames with the columns used in 
+    cantemist_ner_norm.main. About 60% of the predictions match a GS offset
+    and some clinical cases are only in the GS or only in the predictions.
+    '''
+    rnd = np.random.RandomState(seed)
+    n_cc = max(n_annots // annots_per_cc, 1)
+    codes = np.array(['8000/3', '8000/6', '8041/3', '8140/3', '8140/6'])
+    
+    def frame(cc, start, code, suffix):
+        df = pd.DataFrame({'clinical_case': cc, 'mark': 'T1', 
+                           'label': 'MORFOLOGIA_NEOPLASIA',
+                           'offset': [str(s) + ' ' + str(s + 5) for s in start],
+                           'span': 'xxxxx'})
+        if subtask == 'norm':
+            df['code_' + suffix] = code
+        df['start_pos_' + suffix] = start
+        df['end_pos_' + suffix] = start + 5
+        return df
+    
+    cc_gs = rnd.randint(0, n_cc, n_annots)
+    start_gs = rnd.randint(0, 10 * annots_per_cc, n_annots) * 10
+    gs = frame(np.char.add('cc_onco', cc_gs.astype(str)), start_gs,
+               codes[rnd.randint(0, len(codes), n_annots)], 'gs')
+    
+    match = rnd.rand(n_annots) < 0.6
+    cc_pred = np.where(match, cc_gs, rnd.randint(0, int(n_cc * 1.1) + 1, n_annots))
+    start_pred = np.where(match, start_gs, 
+                          rnd.randint(0, 10 * annots_per_cc, n_annots) * 10 + 1)
+    code_pred = np.where(rnd.rand(n_annots) < 0.8, gs['code_gs'].values 
+                         if subtask == 'norm' else '', 
+                         codes[rnd.randint(0, len(codes), n_annots)])
+    pred = frame(np.char.add('cc_onco', cc_pred.astype(str)), start_pred,
+                 code_pred, 'pred')
+    
+    if subtask == 'norm':
+        # The legacy multi-code annotations, predicted with one of the codes
+        for clinical_case, offset, dropped_code, code in LEGACY_MULTI_CODES:
+            start, end = [int(x) for x in offset.split(' ')]
+            extra_gs = frame([clinical_case] * 2, np.array([start] * 2),
+                             [dropped_code, code], 'gs')
+            extra_gs['end_pos_gs'] = end
+            extra_gs['offset'] = offset
+            extra_pred = frame([clinical_case], np.array([start]), [code], 'pred')
+            extra_pred['end_pos_pred'] = end
+            extra_pred['offset'] = offset
+            gs = pd.concat([gs, extra_gs], ignore_index=True)
+            pred = pd.concat([pred, extra_pred], ignore_index=True)
+    
+    return gs, pred
+
+
+def same_results(a, b):
+    for x, y in zip(a, b):
+        if isinstance(x, pd.Series):
+            if x.equals(y) == False:
+                return False
+        elif x != y:
+            return False
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark NER/NORM metrics')
+    parser.add_argument('-n', '--n_annots', type=int, nargs='+',
+                        default=[10**4, 10**5, 10**6])
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+    
+    for subtask in ['ner', 'norm']:
+        for n in args.n_annots:
+            gs, pred = make_frames(n, subtask)
+            start = time.perf_counter()
+            old = legacy_calculate_metrics(gs, pred, subtask)
+            t_old = time.perf_counter() - start
+            start = time.perf_counter()
+            new = cantemist_ner_norm.calculate_metrics(
+                gs, pred, subtask, multi_code_keys=pd.DataFrame(
+                    [row[:2] for row in LEGACY_MULTI_CODES], columns=multi_codes.KEYS))
+            t_new = time.perf_counter() - start
+            if same_results(old, new) == False:
+                raise Exception('Metrics differ from the former implementation')
+            print('{}\tn={}\tlegacy={:.3f}s\tcurrent={:.3f}s\tspeedup={:.1f}x'
+                  .format(subtask, n, t_old, t_new, t_old / t_new))
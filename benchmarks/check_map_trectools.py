@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cross-check of cantemist_coding.compute_map against the original
+trectools evaluation (trectools 0.0.44: Qrel and Run files read as
+TrecRun.read_run read them, then TrecEval.get_map with trec_eval=False) on
+random runs, and timing of both. tests/test_coding_map.py runs the same
+check on a few runs.
+
+Later trectools versions sort the run by docid in TrecRun.read_run, which
+changes the rank order. The run is therefore read here as 0.0.44 read it:
+sorted by query and score only, with a stable sort that keeps the order of
+the file within every query. Only TrecQrel and TrecEval are taken from the
+installed trectools.
+
+trectools is not a requirement of the evaluation library, install it only 
+to run this check: pip install trectools
+
+Usage: python check_map_trectools.py [-n N_RUNS] [-q N_QUERIES]
+"""
+
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+import cantemist_coding
+
+
+def make_run(n_queries, seed, n_codes=200):
+    '''
+    Build random formatted GS and predictions, as returned by 
+    cantemist_coding.format_gs and cantemist_coding.format_predictions.
+    '''
+    rnd = np.random.RandomState(seed)
+    codes = np.array(['8{:03d}/{}'.format(i // 4, i % 4) for i in range(n_codes)])
+    queries = np.array(['cc_onco{}'.format(i) for i in range(n_queries)])
+    
+    gs = pd.DataFrame({'qid': queries[rnd.randint(0, n_queries, 5 * n_queries)],
+                       'q0': '0',
+                       'docno': codes[rnd.randint(0, 20, 5 * n_queries)],
+                       'rel': '1'})
+    gs = gs.drop_duplicates(subset=['qid', 'docno'])
+    
+    # Some queries in the GS are not predicted
+    pred_queries = queries[rnd.rand(n_queries) < 0.9]
+    pred = pd.DataFrame({'query': np.repeat(pred_queries, 15),
+                         'docid': codes[rnd.randint(0, 40, 15 * len(pred_queries))]})
+    pred = pred.drop_duplicates(subset=['query', 'docid'])
+    pred['q0'] = 'Q0'
+    pred['rank'] = pred.groupby('query').cumcount() + 1
+    pred['score'] = float(10)
+    pred['system'] = 'xx'
+    pred = pred[['query', 'q0', 'docid', 'rank', 'score', 'system']]
+    
+    return gs, pred
+
+
+def read_run(run_path):
+    '''
+    trectools TrecRun of a Run file, read as trectools 0.0.44 
+    TrecRun.read_run read it.
+    '''
+    from trectools import TrecRun
+    run = TrecRun()
+    run.run_data = pd.read_csv(run_path, sep=r'\s+',
+                               names=['query', 'q0', 'docid', 'rank', 'score', 'system'])
+    run.run_data.sort_values(['query', 'score'], ascending=[True, False], kind='stable',
+                             inplace=True)
+    run.filename = run_path
+    return run
+
+
+def trectools_map_files(qrels_path, run_path):
+    '''
+    MAP of the original evaluation, from Qrel and Run files.
+    '''
+    from trectools import TrecQrel, TrecEval
+    return TrecEval(read_run(run_path), TrecQrel(qrels_path)).get_map(trec_eval=False)
+
+
+def trectools_map(gs, pred):
+    '''
+    MAP of the original evaluation: Qrel and Run files written as 
+    format_gs and format_predictions write them, read as trectools 0.0.44
+    read them (see read_run) and TrecEval.get_map(trec_eval=False).
+    '''
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        qrels_path = os.path.join(tmp_dir, 'gs.txt')
+        run_path = os.path.join(tmp_dir, 'run.txt')
+        gs.to_csv(qrels_path, index=False, header=None, sep=' ')
+        pred.to_csv(run_path, index=False, header=None, sep='\t')
+        return trectools_map_files(qrels_path, run_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='cross-check MAP with trectools')
+    parser.add_argument('-n', '--n_runs', type=int, default=20)
+    parser.add_argument('-q', '--n_queries', type=int, default=2000)
+    args = parser.parse_args()
+    
+    t_trec = t_native = 0
+    for seed in range(args.n_runs):
+        gs, pred = make_run(args.n_queries, seed)
+        start = time.perf_counter()
+        expected = trectools_map(gs, pred)
+        t_trec += time.perf_counter() - start
+        start = time.perf_counter()
+        result = cantemist_coding.compute_map(gs, pred)
+        t_native += time.perf_counter() - start
+        if math.isclose(result, expected, rel_tol=1e-12) == False:
+            raise Exception('MAP differs from trectools with seed {}: {} != {}'
+                            .format(seed, result, expected))
+    print('OK: {} runs\ttrectools={:.3f}s\tnative={:.3f}s'
+          .format(args.n_runs, t_trec, t_native))
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Scaling benchmark of the evaluation of all subtasks on synthetic corpora.
+
+For every corpus size, a corpus is generated with synthetic.py and every
+subtask (ner, norm, coding, comp_f1) is run in a fresh Python process, stage
+by stage (e.g. load_gs, load_predictions, evaluate). The wall time and the
+peak RSS of every stage are written to a JSON file, with the commit and the
+library versions, so results of different commits can be compared:
+
+    python run_benchmarks.py -n 100 10000 1000000 -o before.json
+    python run_benchmarks.py -n 100 10000 1000000 -o after.json --compare before.json
+
+On Linux, the peak RSS of each stage is measured by resetting the high water
+mark of the process before the stage (/proc/self/clear_refs). Elsewhere, the
+peak RSS of the process up to the end of the stage is reported.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SRC = os.path.join(ROOT, 'src')
+CODES_PATH = os.path.join(ROOT, 'valid-codes.tsv')
+SUBTASKS = ['ner', 'norm', 'coding', 'comp_f1']
+
+sys.path.insert(0, SRC)
+
+
+class StageRecorder:
+    '''
+    Wall time and peak RSS of consecutive stages of one process.
+    '''
+
+    def __init__(self):
+        self.stages = []
+        self.rss_scope = 'stage' if reset_peak_rss() else 'process'
+
+    def run(self, name, func, *args, **kwargs):
+        reset_peak_rss()
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        wall = time.perf_counter() - start
+        self.stages.append({'stage': name, 'wall_s': wall,
+                            'peak_rss_mb': peak_rss_mb(),
+                            'rss_scope': self.rss_scope})
+        return result
+
+
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on Linux, bytes on macOS
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def run_subtask(subtask, corpus):
+    '''
+    Run the stages of one subtask on a corpus (paths as returned by
+    synthetic.write_corpus) and return the stage records and the metrics.
+    '''
+    recorder = StageRecorder()
+
+    if subtask in ['ner', 'norm']:
+        cantemist_ner_norm = recorder.run('import', __import__, 'cantemist_ner_norm')
+        valid_codes = None
+        if subtask == 'norm':
+            import valid_codes as vc
+            valid_codes = recorder.run('load_valid_codes', vc.load_valid_codes,
+                                       CODES_PATH)
+        gs, ann_list_gs = recorder.run('load_gs', cantemist_ner_norm.load_gs,
+                                       corpus['gs'], subtask)
+        pred = recorder.run('load_predictions', cantemist_ner_norm.load_predictions,
+                            corpus['pred'], subtask)
+        _, P, _, R, _, F1 = recorder.run('evaluate', cantemist_ner_norm.evaluate,
+                                         gs, ann_list_gs, pred, subtask, valid_codes)
+        metrics = {'P': P, 'R': R, 'F1': F1}
+
+    elif subtask == 'coding':
+        cantemist_coding = recorder.run('import', __import__, 'cantemist_coding')
+        valid_codes = recorder.run('load_valid_codes',
+                                   cantemist_coding.vc.load_valid_codes, CODES_PATH)
+        gs, qid_gs = recorder.run('format_gs', cantemist_coding.format_gs,
+                                  corpus['gs_coding'])
+        pred = recorder.run('format_predictions', cantemist_coding.format_predictions,
+                            corpus['pred_coding'], valid_codes, qid_gs)
+        MAP = recorder.run('compute_map', cantemist_coding.compute_map, gs, pred)
+        metrics = {'MAP': MAP}
+
+    elif subtask == 'comp_f1':
+        comp_f1_diag_proc = recorder.run('import', __import__, 'comp_f1_diag_proc')
+        valid_codes = recorder.run('load_valid_codes',
+                                   comp_f1_diag_proc.vc.load_valid_codes, CODES_PATH)
+        with open(corpus['test_files']) as f:
+            test_files = [line.strip() for line in f]
+        df_gs = recorder.run('read_gs', comp_f1_diag_proc.read_gs,
+                             corpus['gs_coding'])
+        df_run = recorder.run('read_run', comp_f1_diag_proc.read_run,
+                              corpus['pred_coding'], valid_codes, test_files)
+        _, P, _, R, _, F1 = recorder.run('calculate_metrics',
+                                         comp_f1_diag_proc.calculate_metrics,
+                                         df_gs, df_run)
+        metrics = {'P': P, 'R': R, 'F1': F1}
+
+    else:
+        raise Exception('Error! Subtask name not properly set up')
+
+    return recorder.stages, {k: float(v) for k, v in metrics.items()}
+
+
+def run_in_subprocess(subtask, corpus):
+    '''
+    Run one subtask in a fresh Python process, so that stages do not reuse
+    memory or imports of previous runs.
+    '''
+    command = [sys.executable, os.path.abspath(__file__), '--child', subtask,
+               '--corpus', json.dumps(corpus)]
+    output = subprocess.run(command, check=True, stdout=subprocess.PIPE,
+                            universal_newlines=True).stdout
+    return json.loads(output.strip().split('\n')[-1])
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                universal_newlines=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import numpy
+    import pandas
+    return {'commit': commit, 'python': platform.python_version(),
+            'numpy': numpy.__version__, 'pandas': pandas.__version__,
+            'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def main(sizes, subtasks, seed=0, data_dir=None, output_path=None):
+    '''
+    Generate one corpus per size and benchmark every subtask on it.
+
+    Returns
+    -------
+    report : dict
+        'environment', 'seed' and 'results' (one record per size, subtask
+        and stage).
+
+    '''
+    import synthetic
+    import valid_codes as vc
+    # Build the valid codes index once, so that it is not timed
+    vc.load_valid_codes(CODES_PATH)
+
+    report = {'environment': environment(), 'seed': seed, 'results': []}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_annots in sizes:
+            out_dir = os.path.join(data_dir or tmp_dir, 'corpus-{}-{}'.format(n_annots, seed))
+            start = time.perf_counter()
+            corpus = synthetic.write_corpus(out_dir, n_annots, seed=seed)
+            print('n_annots={}\tgenerate\t{:.3f}s'.format(n_annots,
+                                                         time.perf_counter() - start),
+                  file=sys.stderr)
+            for subtask in subtasks:
+                child = run_in_subprocess(subtask, corpus)
+                for stage in child['stages']:
+                    record = dict({'n_annots': n_annots, 'subtask': subtask}, **stage)
+                    report['results'].append(record)
+                    print('n_annots={}\t{}\t{}\t{:.3f}s\t{:.1f}MB'.format(
+                        n_annots, subtask, stage['stage'], stage['wall_s'],
+                        stage['peak_rss_mb']), file=sys.stderr)
+                report['results'].append({'n_annots': n_annots, 'subtask': subtask,
+                                          'stage': 'metrics',
+                                          'metrics': child['metrics']})
+
+    if output_path is not None:
+        with open(output_path, 'w') as f:
+            json.dump(report, f, indent=1)
+    return report
+
+
+def compare(report, baseline):
+    '''
+    Print the wall time and peak RSS ratios (current / baseline) of the
+    stages found in both reports, and warn if the metrics differ.
+    '''
+    def key(record):
+        return record['n_annots'], record['subtask'], record['stage']
+    base = {key(r): r for r in baseline['results']}
+    print('n_annots\tsubtask\tstage\ttime_ratio\trss_ratio')
+    for record in report['results']:
+        old = base.get(key(record))
+        if old is None:
+            continue
+        if record['stage'] == 'metrics':
+            if old['metrics'] != record['metrics']:
+                warnings.warn('Metrics differ from baseline: {} {}'.format(*key(record)[:2]))
+            continue
+        print('{}\t{}\t{}\t{:.2f}\t{:.2f}'.format(
+            *key(record), record['wall_s'] / max(old['wall_s'], 1e-9),
+            record['peak_rss_mb'] / max(old['peak_rss_mb'], 1e-9)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark all subtasks')
+    parser.add_argument('-n', '--n_annots', type=int, nargs='+',
+                        default=[10**2, 10**3, 10**4, 10**5],
+                        help='corpus sizes (number of GS annotations)')
+    parser.add_argument('-s', '--subtasks', nargs='+', default=SUBTASKS,
+                        choices=SUBTASKS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-d', '--data_dir', default=None,
+                        help='keep the generated corpora in this directory')
+    parser.add_argument('-o', '--output', default=None, dest='output_path',
+                        help='path to output JSON file')
+    parser.add_argument('--compare', default=None, dest='baseline_path',
+                        help='JSON file of a previous run to compare with')
+    parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--corpus', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        warnings.simplefilter('ignore')
+        stages, metrics = run_subtask(args.child, json.loads(args.corpus))
+        print(json.dumps({'stages': stages, 'metrics': metrics}))
+        sys.exit(0)
+
+    report = main(args.n_annots, args.subtasks, seed=args.seed,
+                  data_dir=args.data_dir, output_path=args.output_path)
+    if args.baseline_path is not None:
+        with open(args.baseline_path) as f:
+            compare(report, json.load(f))
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Seeded generator of synthetic CANTEMIST corpora.
+
+A corpus has the layout of gs-data/ and toy-data/:
+    gs/*.ann, pred/*.ann    Brat files with T, # (AnnotatorNotes) and R lines
+    gs-coding.tsv           GS codes per clinical case (no headers row)
+    pred-coding.tsv         Ranked predicted codes per clinical case
+    test-files.txt          GS clinical cases (for comp_f1_diag_proc.py)
+
+Codes are drawn from valid-codes.tsv. Predictions are derived from the GS:
+about 60% of the GS annotations are predicted with the same offsets (80% of
+them with the same code), 20% with shifted offsets and 20% are missed; some
+extra predictions, clinical cases without predictions and predicted clinical
+cases that are not in the GS are added. The same seed always gives the same
+corpus.
+
+Usage: python synthetic.py -o DIR -n N_ANNOTS [--seed SEED]
+"""
+
+import argparse
+import os
+import random
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+CODES_PATH = os.path.join(ROOT, 'valid-codes.tsv')
+LABEL = 'MORFOLOGIA_NEOPLASIA'
+
+
+def load_codes(codes_path=CODES_PATH):
+    '''
+    Codes (first column) of the valid codes TSV, in file order.
+    '''
+    with open(codes_path) as f:
+        return [line.split('\t', 1)[0].strip() for line in f if line.strip() != '']
+
+
+def generate_annotations(n_annots, seed=0, annots_per_file=20, codes=None,
+                         n_pool=500):
+    '''
+    Generate GS and predicted annotations.
+
+    Parameters
+    ----------
+    n_annots : int
+        Number of GS annotations.
+    seed : int
+        Random seed.
+    annots_per_file : int
+        Average number of GS annotations per clinical case.
+    codes : list
+        Codes to draw from. By default, the codes of valid-codes.tsv.
+    n_pool : int
+        Number of distinct codes used in the GS. Frequent codes are drawn
+        more often (weights 1/rank).
+
+    Returns
+    -------
+    gs, pred : dict
+        Clinical case (without extension) -> list of (start, end, code),
+        sorted by start.
+
+    '''
+    rnd = random.Random(seed)
+    if codes is None:
+        codes = load_codes()
+    pool = rnd.sample(codes, min(n_pool, len(codes)))
+    weights = [1 / (rank + 1) for rank in range(len(pool))]
+
+    n_files = max(n_annots // annots_per_file, 1)
+    sizes = [0] * n_files
+    for i in rnd.choices(range(n_files), k=n_annots):
+        sizes[i] += 1
+
+    gs, pred = {}, {}
+    for i, size in enumerate(sizes):
+        case = 'cc_onco{}'.format(i)
+        gs_annots, pred_annots = [], []
+        pos = 0
+        for code in rnd.choices(pool, weights=weights, k=size):
+            pos += rnd.randint(1, 200)
+            end = pos + rnd.randint(2, 40)
+            gs_annots.append((pos, end, code))
+            outcome = rnd.random()
+            if outcome < 0.6:
+                if rnd.random() >= 0.8:
+                    code = rnd.choices(pool, weights=weights)[0]
+                pred_annots.append((pos, end, code))
+            elif outcome < 0.8:
+                shift = rnd.randint(1, 3)
+                pred_annots.append((pos + shift, end + shift, code))
+            if rnd.random() < 0.1:
+                start = end + rnd.randint(1, 50)
+                pred_annots.append((start, start + rnd.randint(2, 40),
+                                    rnd.choices(pool, weights=weights)[0]))
+            pos = end
+        gs[case] = gs_annots
+        # 5% of the clinical cases are not predicted
+        if rnd.random() >= 0.05:
+            pred[case] = sorted(pred_annots)
+
+    # Predicted clinical cases that are not in the GS
+    for i in range(n_files, n_files + max(n_files // 50, 1)):
+        pos = rnd.randint(1, 200)
+        pred['cc_onco{}'.format(i)] = [(pos, pos + 10,
+                                        rnd.choices(pool, weights=weights)[0])]
+
+    return gs, pred
+
+
+def write_ann_files(datapath, docs, seed=0, related_ratio=0.05):
+    '''
+    Write one Brat .ann file per clinical case, with a T and a # line per
+    annotation. About related_ratio of the annotations are in R lines
+    (pairs of consecutive annotations).
+    '''
+    rnd = random.Random(seed)
+    os.makedirs(datapath, exist_ok=True)
+    for case, annots in docs.items():
+        lines = []
+        for j, (start, end, code) in enumerate(annots, start=1):
+            lines.append('T{}\t{} {} {}\t{}\n'.format(j, LABEL, start, end,
+                                                       'x' * (end - start)))
+            lines.append('#{}\tAnnotatorNotes T{}\t{}\n'.format(j, j, code))
+        n_relations = 0
+        for j in range(1, len(annots), 2):
+            if rnd.random() < related_ratio:
+                n_relations += 1
+                lines.append('R{}\tRel Arg1:T{} Arg2:T{}\t\n'.format(n_relations,
+                                                                    j, j + 1))
+        with open(os.path.join(datapath, case + '.ann'), 'w') as f:
+            f.writelines(lines)
+
+
+def write_coding_tsv(path, docs, seed=0, codes=None, extra_codes=0):
+    '''
+    Write the codes of every clinical case to a TSV without headers row,
+    in annotation order. If extra_codes > 0, that number of random codes is
+    appended to each clinical case (ranked predictions).
+    '''
+    rnd = random.Random(seed)
+    if (codes is None) & (extra_codes > 0):
+        codes = load_codes()
+    with open(path, 'w') as f:
+        for case, annots in docs.items():
+            case_codes = [code for _, _, code in annots]
+            if extra_codes > 0:
+                case_codes = list(dict.fromkeys(case_codes))
+                case_codes += rnd.sample(codes, extra_codes)
+            f.writelines('{}\t{}\n'.format(case, code) for code in case_codes)
+
+
+def write_corpus(out_dir, n_annots, seed=0, annots_per_file=20):
+    '''
+    Write a full synthetic corpus (see module docstring) to out_dir.
+
+    Returns
+    -------
+    paths : dict
+        Paths of the corpus files: 'gs', 'pred', 'gs_coding',
+        'pred_coding' and 'test_files'.
+
+    '''
+    codes = load_codes()
+    gs, pred = generate_annotations(n_annots, seed=seed,
+                                    annots_per_file=annots_per_file,
+                                    codes=codes)
+    paths = {'gs': os.path.join(out_dir, 'gs'),
+             'pred': os.path.join(out_dir, 'pred'),
+             'gs_coding': os.path.join(out_dir, 'gs-coding.tsv'),
+             'pred_coding': os.path.join(out_dir, 'pred-coding.tsv'),
+             'test_files': os.path.join(out_dir, 'test-files.txt')}
+    write_ann_files(paths['gs'], gs, seed=seed)
+    write_ann_files(paths['pred'], pred, seed=seed + 1)
+    write_coding_tsv(paths['gs_coding'], gs)
+    write_coding_tsv(paths['pred_coding'], pred, seed=seed, codes=codes,
+                     extra_codes=2)
+    with open(paths['test_files'], 'w') as f:
+        f.writelines(case + '\n' for case in gs)
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='generate synthetic corpus')
+    parser.add_argument('-o', '--output', required=True, dest='out_dir',
+                        help='output directory')
+    parser.add_argument('-n', '--n_annots', type=int, default=10000,
+                        help='number of GS annotations')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-a', '--annots_per_file', type=int, default=20)
+    args = parser.parse_args()
+
+    write_corpus(args.out_dir, args.n_annots, seed=args.seed,
+                 annots_per_file=args.annots_per_file)
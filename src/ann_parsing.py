@@ -6,54 +6,375 @@ Created on Mon Jun  8 12:20:04 2020
 @author: antonio
 """
 
+import io
 import os
+import numpy as np
 import pandas as pd
 import warnings
+from array import array
+from functools import partial
+
+import archives
+import profiling
 
 def warning_on_one_line(message, category, filename, lineno, file=None, line=None):
     return '%s:%s: %s: %s\n' % (filename, lineno, category.__name__, message)
 warnings.formatwarning = warning_on_one_line
 
-def parse_ann(datapath, relevant_labels, with_notes=False):
+def parse_ann(datapath, relevant_labels, with_notes=False, jobs=1):
     '''
     Parse information in .ann files.
     
     Parameters
     ----------
     datapath : str. 
-        Route to the folder where the files are. 
+        Route to the folder where the files are, or to a zip or tar archive
+        with them (see archives.py). 
     relevant_labels : list
         List of labels we parse
     with_notes : bool
         whether to take into account AnnotatorNotes or not (Brat comments)
+    jobs : int
+        number of worker processes. With jobs > 1, files are parsed in 
+        chunks by a process pool. The output is the same as with jobs=1.
+        Archives are read in one pass by the main process.
            
     Returns
     -------
     df : pandas DataFrame 
         It has information from ann files. Columns: filename',
-        'mark', 'label', 'offset', span' and (if with_notes=True) 'code'
+        'mark', 'label', 'offset', span' and (if with_notes=True) 'code'.
+        They are categoricals (see records_to_df).
     
     '''
     
-    info = []
+    relevant_labels = set(relevant_labels)
+    records = InternedRecords(len(record_columns(with_notes)))
+    
+    if archives.is_archive(datapath):
+        with profiling.stage('read_archive'):
+            parse_ann_archive(datapath, relevant_labels, with_notes, records=records)
+        profiling.count('annotations', len(records))
+        with profiling.stage('build_dataframe'):
+            return records_to_df(records, with_notes)
+    
+    ## List the files
+    with profiling.stage('list_files'):
+        paths = list_ann_files(datapath)
+    profiling.count('ann_files', len(paths))
+    
+    ## Parse them
+    with profiling.stage('read_files'):
+        if (jobs > 1) & (len(paths) > 1):
+            parse_ann_parallel(paths, relevant_labels, with_notes, jobs, records=records)
+        else:
+            parse_ann_chunk(paths, relevant_labels, with_notes, records=records)
+    profiling.count('annotations', len(records))
+
+    # Save parsed .ann files
+    with profiling.stage('build_dataframe'):
+        return records_to_df(records, with_notes)
+
+
+def list_ann_files(datapath):
+    '''
+    List the .ann files in datapath and its subdirectories.
+    
+    Returns
+    -------
+    paths : list of tuples
+        (root, filename) of every ANN file
     
-    ## Iterate over the files and parse them
+    '''
+    paths = []
     for root, dirs, files in os.walk(datapath):
          for filename in files:
              if filename[-3:] != 'ann':
                  continue            
-             info = parse_one_ann(info, root, filename, relevant_labels,
-                                  ignore_related=True, with_notes=with_notes)
+             paths.append((root, filename))
+    
+    return paths
 
-    # Save parsed .ann files
+
+def parse_ann_texts(texts, relevant_labels, with_notes=False):
+    '''
+    Parse the contents of .ann files that are already in memory.
+    
+    Parameters
+    ----------
+    texts : dict
+        ANN file name -> ANN file content
+    relevant_labels : list
+        List of labels we parse
+    with_notes : bool
+        whether to take into account AnnotatorNotes or not (Brat comments)
+           
+    Returns
+    -------
+    df : pandas DataFrame 
+        Same as parse_ann output.
+    
+    '''
+    relevant_labels = set(relevant_labels)
+    records = InternedRecords(len(record_columns(with_notes)))
+    for filename, text in texts.items():
+        if filename[-3:] != 'ann':
+            continue
+        records.extend(parse_ann_lines(io.StringIO(text, newline=None).readlines(), 
+                                       filename, relevant_labels,
+                                       ignore_related=True, 
+                                       with_notes=with_notes))
+    
+    return records_to_df(records, with_notes)
+
+
+def parse_ann_archive(archive_path, relevant_labels, with_notes, records=None):
+    '''
+    Parse the .ann files of a zip or tar archive, streaming its members.
+    AnnotatorNotes are used if with_notes=True and annotations included in
+    Brat relations are ignored.
+    
+    Returns
+    -------
+    records : list of tuples or InternedRecords
+        parsed annotations of all files, in archive order (appended to 
+        records, if given)
+    
+    '''
+    if records is None:
+        records = []
+    n_files = 0
+    for name, filename, lines in archives.iter_ann_members(archive_path):
+        records.extend(parse_ann_lines(lines, filename, relevant_labels,
+                                       ignore_related=True, with_notes=with_notes,
+                                       source=os.path.join(archive_path, name)))
+        n_files += 1
+    profiling.count('ann_files', n_files)
+    return records
+
+
+def record_columns(with_notes):
+    '''
+    Column names of the parsed records.
+    '''
     if with_notes == True:
-        df = pd.DataFrame(info, columns=['filename', 'mark', 'label','offset',
-                                         'span', 'code'])
-    else:
-        df = pd.DataFrame(info, columns=['filename', 'mark', 'label','offset',
-                                         'span'])
+        return ['filename', 'mark', 'label', 'offset', 'span', 'code']
+    return ['filename', 'mark', 'label', 'offset', 'span']
+
+
+def records_to_df(records, with_notes):
+    '''
+    Build the DataFrame returned by parse_ann from parsed records (list of
+    tuples or InternedRecords).
     
-    return df
+    Every column is a categorical: each distinct file name, label, offset,
+    span or code is stored once and the rows hold integer codes. Categories
+    are sorted, so sorting by category code is sorting by name. The 
+    categoricals are built from the interned codes: no DataFrame of 
+    strings is built.
+    '''
+    columns = record_columns(with_notes)
+    if isinstance(records, InternedRecords) == False:
+        interned = InternedRecords(len(columns))
+        interned.extend(records)
+        records = interned
+    
+    return pd.DataFrame({column: records.categorical(i) 
+                         for i, column in enumerate(columns)})
+
+
+class InternedRecords:
+    '''
+    Parsed annotations stored by column while parsing. Every distinct value
+    of a column is stored once, with an integer id, and the rows only hold
+    the ids (int32 arrays), so parsed files are not kept as tuples of 
+    strings. It has the extend method of a list of records.
+    '''
+    
+    def __init__(self, n_columns):
+        self.ids = [{} for _ in range(n_columns)]
+        self.codes = [array('i') for _ in range(n_columns)]
+    
+    def __len__(self):
+        return len(self.codes[0])
+    
+    def extend(self, records):
+        '''
+        Append records (tuples with one value per column).
+        '''
+        for values, ids, codes in zip(zip(*records), self.ids, self.codes):
+            codes.extend([ids.setdefault(value, len(ids)) for value in values])
+    
+    def extend_interned(self, other):
+        '''
+        Append the rows of another InternedRecords (e.g. sent by a worker).
+        '''
+        for ids, codes, other_ids, other_codes in zip(self.ids, self.codes,
+                                                      other.ids, other.codes):
+            remap = np.array([ids.setdefault(value, len(ids)) for value in other_ids],
+                             dtype=np.int32)
+            codes.frombytes(remap[np.frombuffer(other_codes, dtype=np.int32)].tobytes())
+    
+    def to_records(self):
+        '''
+        Rows as a list of tuples.
+        '''
+        columns = [list(ids) for ids in self.ids]
+        return list(zip(*[[values[code] for code in codes] 
+                          for values, codes in zip(columns, self.codes)]))
+    
+    def categorical(self, i):
+        '''
+        Column i as a pandas Categorical with sorted categories.
+        '''
+        values = list(self.ids[i])
+        order = sorted(range(len(values)), key=values.__getitem__)
+        # Id -> position of its value in the sorted categories
+        position = np.empty(len(values), dtype=np.int32)
+        position[order] = np.arange(len(values), dtype=np.int32)
+        codes = position[np.frombuffer(self.codes[i], dtype=np.int32)]
+        categories = pd.Index([values[j] for j in order])
+        return pd.Categorical.from_codes(codes, categories=categories)
+
+
+def compact(df):
+    '''
+    Convert the string (non-integer) columns of an annotations DataFrame
+    to categoricals.
+    '''
+    return df.assign(**{column: df[column].astype('category') 
+                        for column in df.columns
+                        if not pd.api.types.is_integer_dtype(df[column])})
+
+
+def share_categories(left, right, columns):
+    '''
+    Give pairs of categorical columns of two DataFrames the same (sorted)
+    categories, so that they are merged and compared by integer code.
+    
+    Parameters
+    ----------
+    left, right : pandas DataFrame
+    columns : list of tuples
+        (left column, right column) pairs.
+    
+    Returns
+    -------
+    left, right : pandas DataFrame
+        Copies with recoded columns.
+    
+    '''
+    left_columns, right_columns = {}, {}
+    for left_column, right_column in columns:
+        left_values = left[left_column].astype('category')
+        right_values = right[right_column].astype('category')
+        categories = left_values.cat.categories.union(right_values.cat.categories)
+        left_columns[left_column] = left_values.cat.set_categories(categories)
+        right_columns[right_column] = right_values.cat.set_categories(categories)
+    
+    return left.assign(**left_columns), right.assign(**right_columns)
+
+
+def size_by(df, column):
+    '''
+    Number of rows per value of a (categorical) column, for the values 
+    present in df. The index holds the values as plain objects, so that 
+    counts of different DataFrames can be aligned.
+    '''
+    sizes = df.groupby(column, observed=True).size()
+    sizes.index = sizes.index.astype(object)
+    return sizes
+
+
+def parse_ann_parallel(paths, relevant_labels, with_notes, jobs, records=None):
+    '''
+    Parse a list of ANN files with a pool of worker processes.
+    
+    Files are sent to the workers in contiguous chunks and the results are
+    concatenated in the order of paths, so the output does not depend on
+    which worker finishes first.
+    
+    Parameters
+    ----------
+    paths : list of tuples
+        (root, filename) of every ANN file
+    relevant_labels : set
+        ANN labels I will parse
+    with_notes : bool
+        whether to take into account AnnotatorNotes or not (Brat comments)
+    jobs : int
+        number of worker processes
+           
+    Returns
+    -------
+    records : list of tuples or InternedRecords
+        parsed annotations of all files, in the order of paths (appended
+        to records, if given)
+    
+    '''
+    from concurrent.futures import ProcessPoolExecutor
+    
+    n_chunks = min(len(paths), jobs * 4)
+    chunk_size = -(-len(paths) // n_chunks)
+    chunks = [paths[i:i + chunk_size] 
+              for i in range(0, len(paths), chunk_size)]
+    
+    # Workers return their error messages instead of printing them, so
+    # that they are printed here whole and in file order
+    if records is None:
+        records = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for chunk_records, chunk_errors in executor.map(partial(parse_ann_chunk_errors, 
+                                                                relevant_labels=relevant_labels,
+                                                                with_notes=with_notes),
+                                                        chunks):
+            if isinstance(records, InternedRecords):
+                records.extend_interned(chunk_records)
+            else:
+                records.extend(chunk_records.to_records())
+            for message in chunk_errors:
+                print(message)
+    
+    return records
+
+
+def parse_ann_chunk(paths, relevant_labels, with_notes, errors=None, records=None):
+    '''
+    Parse a list of ANN files. AnnotatorNotes are used if with_notes=True
+    and annotations included in Brat relations are ignored.
+    
+    Returns
+    -------
+    records : list of tuples or InternedRecords
+        parsed annotations of all files, in the order of paths (appended
+        to records, if given)
+    
+    '''
+    if records is None:
+        records = []
+    for root, filename in paths:
+        records.extend(read_one_ann(root, filename, relevant_labels,
+                                    ignore_related=True, with_notes=with_notes,
+                                    errors=errors))
+    return records
+
+
+def parse_ann_chunk_errors(paths, relevant_labels, with_notes):
+    '''
+    parse_ann_chunk for a worker process.
+    
+    Returns
+    -------
+    records : InternedRecords
+        parsed annotations of all files, in the order of paths
+    errors : list of str
+        error messages of the skipped files, in the order of paths
+    
+    '''
+    errors = []
+    records = InternedRecords(len(record_columns(with_notes)))
+    parse_ann_chunk(paths, relevant_labels, with_notes, errors=errors, records=records)
+    return records, errors
 
 
 def parse_one_ann(info, root, filename, relevant_labels, ignore_related=False,
@@ -61,6 +382,9 @@ def parse_one_ann(info, root, filename, relevant_labels, ignore_related=False,
     '''
     Parse information in one ANN file.
     
+    Kept for backwards compatibility: it appends the records produced by 
+    read_one_ann to info.
+    
     Parameters
     ----------
     info : list
@@ -82,87 +406,155 @@ def parse_one_ann(info, root, filename, relevant_labels, ignore_related=False,
         it contains parsed ANN information. One element per ANN annotation
     
     '''
+    info.extend(list(record) for record in 
+                read_one_ann(root, filename, relevant_labels,
+                             ignore_related=ignore_related, 
+                             with_notes=with_notes))
+    return info
+
+
+def read_one_ann(root, filename, relevant_labels, ignore_related=False,
+                 with_notes=False, errors=None):
+    '''
+    Parse information in one ANN file, streaming it line by line.
     
-    f = open(os.path.join(root,filename)).readlines()
-    ### Check all .ANN lines have 3 \t ###
-    for line in f:
-       splitted = line.split('\t')
-       if len(splitted)<3:
-            print('ERROR in {}. Line with less than 3 tabular splits: {}.'.format(root+filename, line) +
-                  ' Skipping this file...')
-            return info
-       if len(splitted)>3:
-            print('ERROR in {}. Line with more than 3 tabular splits: {}.'.format(root+filename, line) +
-                  ' Skipping this file...')
-            return info
-       if (splitted[0][0] == 'T') & (';' in ' '.join(splitted[1].split(' ')[1:])):
-            print('ERROR in {}. Text span with discontinuous annotation: {}.'.format(root+filename, line) +
-                  ' Skipping this file...')
-            return info
-        
-    ### Parse .ann file ###
-    ignore_marks = []    
-    # extract relations
-    if ignore_related == True:   
-        for line in f:
-            if line[0] != 'R':
-                continue
-            ignore_marks.append(line.split('\t')[1].split(' ')[1].split(':')[1])
-            ignore_marks.append(line.split('\t')[1].split(' ')[2].split(':')[1])
-            
+    Parameters
+    ----------
+    root : str
+        route to parent directory where ANN file is stored
+    filename : str
+        ANN file name
+    relevant_labels : set
+        ANN labels I will parse
+    ignore_related : bool
+        whether to ignore annotations included in a Brat relation
+    with_notes : bool
+        whether to take into account AnnotatorNotes or not (Brat comments)
+    errors : list
+        if given, error messages are appended to it instead of printed
+           
+    Returns
+    -------
+    records : list of tuples
+        (filename, mark, label, offset, span) and, if with_notes=True, code.
+        Empty if the file does not pass the format checks.
+    
+    '''
+    with open(os.path.join(root, filename)) as f:
+        return parse_ann_lines(f, filename, relevant_labels, 
+                              ignore_related=ignore_related,
+                              with_notes=with_notes, source=root+filename,
+                              errors=errors)
+
+
+def parse_ann_lines(lines, filename, relevant_labels, ignore_related=False,
+                   with_notes=False, source=None, errors=None):
+    '''
+    Parse the lines of one ANN file in a single pass.
+    
+    Relations and AnnotatorNotes may appear after the entities they refer 
+    to, so entity lines are kept until the end of the file and then filtered
+    with set/dict lookups. The whole file is skipped if any line does not 
+    have exactly 3 tabular splits or if a text span is discontinuous.
+    
+    Parameters
+    ----------
+    lines : iterable of str
+        lines of the ANN file
+    filename : str
+        ANN file name (stored in the records)
+    relevant_labels : set
+        ANN labels I will parse
+    ignore_related : bool
+        whether to ignore annotations included in a Brat relation
+    with_notes : bool
+        whether to take into account AnnotatorNotes or not (Brat comments)
+    source : str
+        file identifier used in error messages. Default: filename
+    errors : list
+        if given, error messages are appended to it instead of printed
+    
+    Returns
+    -------
+    records : list of tuples
+        (filename, mark, label, offset, span) and, if with_notes=True, code.
+        Empty if the file does not pass the format checks.
+    
+    '''
+    if source is None:
+        source = filename
+    report = print if errors is None else errors.append
+    entities = []
+    ignore_marks = set()
     mark2code = {}
-    if with_notes == True:
-        # extract notes
-        for line in f:
-            if line[0] != '#':
-                continue
-            line_split = line.split('\t')
-            mark2code[line_split[1].split(' ')[1]] = line_split[2].strip()
-    
-    for line in f:
-        if line[0] != 'T':
-            continue
+    
+    for line in lines:
+        ### Check all .ANN lines have 3 \t ###
         splitted = line.split('\t')
-
-        mark = splitted[0]
-        if mark in ignore_marks:
-            continue
-        label_offset = splitted[1]
-        label = label_offset.split(' ')[0]
-        if label not in relevant_labels:
-            continue
-        offset = ' '.join(label_offset.split(' ')[1:])
-        span = splitted[2].strip()
-        
-        if with_notes == False:
-            info.append([filename, mark, label, offset, span])
-            continue
+        if len(splitted)<3:
+            report('ERROR in {}. Line with less than 3 tabular splits: {}.'.format(source, line) +
+                  ' Skipping this file...')
+            return []
+        if len(splitted)>3:
+            report('ERROR in {}. Line with more than 3 tabular splits: {}.'.format(source, line) +
+                  ' Skipping this file...')
+            return []
         
-        if mark in mark2code.keys():
-            code = mark2code[mark]
-            info.append([filename, mark, label, offset, span, code])
-            
-    return info
+        ### Parse line according to its type ###
+        kind = line[0]
+        if kind == 'T':
+            label, _, offset = splitted[1].partition(' ')
+            if ';' in offset:
+                report('ERROR in {}. Text span with discontinuous annotation: {}.'.format(source, line) +
+                      ' Skipping this file...')
+                return []
+            if label in relevant_labels:
+                entities.append((splitted[0], label, offset, splitted[2]))
+        elif (kind == 'R') & (ignore_related == True):
+            args = splitted[1].split(' ')
+            ignore_marks.add(args[1].split(':')[1])
+            ignore_marks.add(args[2].split(':')[1])
+        elif (kind == '#') & (with_notes == True):
+            mark2code[splitted[1].split(' ')[1]] = splitted[2].strip()
+    
+    if with_notes == False:
+        return [(filename, mark, label, offset, span.strip())
+                for mark, label, offset, span in entities
+                if mark not in ignore_marks]
+    
+    return [(filename, mark, label, offset, span.strip(), mark2code[mark])
+            for mark, label, offset, span in entities
+            if (mark not in ignore_marks) & (mark in mark2code)]
 
 
 def format_df(df):
     '''
-    Divide offset column into two: starting and ending annotation positions.
+    Divide offset column into two: starting and ending annotation positions
+    (int32). Only the distinct offsets (the categories) are split.
     
     '''
-    
-    df[['offset0','offset1']] = df['offset'].str.split(' ', n=1, expand=True)
-    df['offset0'] = df['offset0'].astype("int")
-    df['offset1'] = df['offset1'].astype("int")
+    offsets = df['offset'].astype('category')
+    bounds = (pd.Series(offsets.cat.categories, dtype=object)
+              .str.split(' ', n=1, expand=True))
+    codes = offsets.cat.codes.to_numpy()
+    df['offset0'] = bounds[0].astype('int32').to_numpy()[codes]
+    df['offset1'] = bounds[1].astype('int32').to_numpy()[codes]
     
     return df
 
-def main(datapath, relevant_labels, with_notes=False):
+def main(datapath, relevant_labels, with_notes=False, jobs=1):
+    
+    df = parse_ann(datapath, relevant_labels, with_notes, jobs)
+    
+    return check_and_format(df)
+
+
+def check_and_format(df):
     
-    df = parse_ann(datapath, relevant_labels, with_notes)
     if df.shape[0] == 0:
         warnings.warn('There are not parsed annotations')
         return df
-    df_ok = format_df(df)
+    with profiling.stage('format_df'):
+        df_ok = format_df(df)
     
     return df_ok
\ No newline at end of file
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+.ann corpora in zip or tar archives (.zip, .tar, .tar.gz/.tgz, .tar.bz2,
+.tar.xz), read without extracting them.
+
+Members are streamed in archive order: tar archives are read in one
+sequential pass and zip members are opened one by one. As with
+directories, every member whose name ends in 'ann' is parsed, and the list
+of GS files (os.listdir of a directory) is made of the .ann members of the
+archive root. The root is the top directory of the archive if all members
+are inside one (e.g. an archive of gs-data/), and the archive itself
+otherwise. Members of __MACOSX/ (resource forks added by macOS) are
+skipped.
+"""
+
+import hashlib
+import io
+import locale
+import os
+import posixpath
+import tarfile
+import zipfile
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2',
+                    '.tar.xz', '.txz')
+
+
+def is_archive(path):
+    return os.path.isfile(path) & path.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def iter_ann_members(archive_path):
+    '''
+    Stream the .ann files of an archive.
+
+    Yields
+    ------
+    name : str
+        Member name (path inside the archive).
+    filename : str
+        Member file name, without directories.
+    lines : iterable of str
+        Lines of the member, decoded as open() does.
+
+    '''
+    if archive_path.lower().endswith('.zip'):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                filename = posixpath.basename(info.filename)
+                if info.is_dir() or (filename[-3:] != 'ann') or is_resource_fork(info.filename):
+                    continue
+                yield info.filename, filename, decode(archive.read(info))
+        return
+
+    with tarfile.open(archive_path, 'r|*') as archive:
+        for info in archive:
+            filename = posixpath.basename(info.name)
+            if (info.isfile() == False) or (filename[-3:] != 'ann') or is_resource_fork(info.name):
+                continue
+            yield info.name, filename, decode(archive.extractfile(info).read())
+
+
+def decode(content):
+    '''
+    Lines of a member, decoded with the encoding and newline translation
+    of open(). Members are small: they are read whole, which is faster
+    than reading them line by line from the archive.
+    '''
+    return io.StringIO(content.decode(locale.getpreferredencoding(False)),
+                       newline=None)
+
+
+def member_names(archive_path):
+    '''
+    Names of the file members of an archive.
+    '''
+    if archive_path.lower().endswith('.zip'):
+        with zipfile.ZipFile(archive_path) as archive:
+            return [info.filename for info in archive.infolist()
+                    if (info.is_dir() == False) and (is_resource_fork(info.filename) == False)]
+    with tarfile.open(archive_path, 'r|*') as archive:
+        return [info.name for info in archive
+                if info.isfile() and (is_resource_fork(info.name) == False)]
+
+
+def is_resource_fork(name):
+    return posixpath.normpath(name).split('/')[0] == '__MACOSX'
+
+
+def list_root_ann_files(archive_path):
+    '''
+    .ann files of the archive root (see module docstring).
+    '''
+    names = [posixpath.normpath(name) for name in member_names(archive_path)]
+    top_dirs = set(name.split('/')[0] for name in names)
+    root = ''
+    if (len(top_dirs) == 1) and all('/' in name for name in names):
+        root = top_dirs.pop()
+    return [posixpath.basename(name) for name in names
+            if (posixpath.dirname(name) == root) and (name[-4:] == '.ann')]
+
+
+def fingerprint(archive_path):
+    stat = os.stat(archive_path)
+    return '{}\t{}'.format(stat.st_size, stat.st_mtime_ns)
+
+
+def content_hash(archive_path):
+    sha1 = hashlib.sha1()
+    with open(archive_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Score many prediction runs against one Gold Standard in a single process.
+
+The GS (and the valid codes) are loaded once and every run is scored,
+optionally in parallel. One line per run is printed, in the order the runs
+were given: pred_path|P|R|F1 (NER, NORM) or pred_path|MAP (CODING). A run
+that could not be scored gets a pred_path|error line (and a warning with
+the reason), so that it is not mistaken for a missing run.
+"""
+
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import valid_codes as vc
+
+def warning_on_one_line(message, category, filename, lineno, file=None, line=None):
+    return '%s:%s: %s: %s\n' % (filename, lineno, category.__name__, message)
+warnings.formatwarning = warning_on_one_line
+
+# Results line of the runs that could not be scored
+FAILED = 'error'
+
+# Data shared by all runs. It is set once per process and never modified.
+_context = {}
+
+
+def main(gs_path, pred_paths, codes_path, subtask, jobs=1, multi_codes_path=None):
+    '''
+    Load GS and valid codes once, score every prediction run and print one
+    results line per run.
+
+    Parameters
+    ----------
+    gs_path : str
+        Path to GS directory, GS store or GS TSV (see main.py).
+    pred_paths : list
+        Paths to prediction directories (NER, NORM) or TSV files (CODING).
+    codes_path : str
+        Path to TSV file with valid codes. In subtask norm, None to not
+        check the predicted codes.
+    subtask : str
+        Subtask name
+    jobs : int
+        Number of processes used to score the runs.
+    multi_codes_path : str
+        Path to TSV file with the GS annotations that have several valid
+        codes (subtask norm). If None, they are derived from the GS.
+
+    Returns
+    -------
+    results : list
+        One tuple of metrics per run (None if the run could not be scored).
+
+    '''
+    context = load_context(gs_path, codes_path, subtask, multi_codes_path)
+
+    if (jobs > 1) & (len(pred_paths) > 1):
+        with ProcessPoolExecutor(max_workers=jobs, initializer=set_context,
+                                 initargs=(context,)) as executor:
+            results = list(executor.map(score_run, pred_paths))
+    else:
+        set_context(context)
+        results = [score_run(pred_path) for pred_path in pred_paths]
+
+    ###### Show results ######
+    for pred_path, result in zip(pred_paths, results):
+        if result is None:
+            print('|'.join([pred_path, FAILED]))
+            continue
+        print('|'.join([pred_path] + [str(round(x, 3)) for x in result]))
+
+    return results
+
+
+def load_context(gs_path, codes_path, subtask, multi_codes_path=None):
+    '''
+    Load the data needed to score any run of a subtask.
+    '''
+    if subtask == 'coding':
+        import cantemist_coding
+        gs, qid_gs = cantemist_coding.format_gs(gs_path)
+        return {'subtask': subtask, 'gs': gs, 'qid_gs': qid_gs,
+                'valid_codes': vc.load_valid_codes(codes_path)}
+
+    if subtask not in ['ner', 'norm']:
+        raise Exception('Error! Subtask name not properly set up')
+    import cantemist_ner_norm
+    gs, ann_list_gs = cantemist_ner_norm.load_gs(gs_path, subtask)
+    if (subtask == 'norm') & (codes_path is not None):
+        valid_codes = vc.load_valid_codes(codes_path)
+    else:
+        valid_codes = None
+    if (subtask == 'norm') & (multi_codes_path is not None):
+        import multi_codes
+        multi_code_keys = multi_codes.load_keys(multi_codes_path)
+    else:
+        multi_code_keys = None
+    return {'subtask': subtask, 'gs': gs, 'ann_list_gs': ann_list_gs,
+            'valid_codes': valid_codes, 'multi_code_keys': multi_code_keys}
+
+
+def set_context(context):
+    _context.clear()
+    _context.update(context)
+
+
+def score_run(pred_path):
+    '''
+    Score one run with the data loaded in this process.
+
+    Returns
+    -------
+    result : tuple
+        (P, R, F1) for NER and NORM, (MAP,) for CODING. None if the run
+        could not be scored.
+
+    '''
+    subtask = _context['subtask']
+    try:
+        if subtask == 'coding':
+            import cantemist_coding
+            pred = cantemist_coding.format_predictions(pred_path,
+                                                       _context['valid_codes'],
+                                                       _context['qid_gs'])
+            return (cantemist_coding.compute_map(_context['gs'], pred),)
+
+        import cantemist_ner_norm
+        pred = cantemist_ner_norm.load_predictions(pred_path, subtask)
+        _, P, _, R, _, F1 = cantemist_ner_norm.evaluate(_context['gs'],
+                                                        _context['ann_list_gs'],
+                                                        pred, subtask,
+                                                        _context['valid_codes'],
+                                                        multi_code_keys=_context['multi_code_keys'])
+        return (P, R, F1)
+    except Exception as e:
+        warnings.warn('{} could not be scored: {}'.format(pred_path, e))
+        return None
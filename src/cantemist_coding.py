@@ -7,19 +7,26 @@ Created on Wed Dec 18 15:22:29 2019
 """
 
 import warnings
+import numpy as np
 import pandas as pd
-from trectools import TrecQrel, TrecRun, TrecEval
+import prediction_stream
+import profiling
+import results_output
+import valid_codes as vc
 
 def warning_on_one_line(message, category, filename, lineno, file=None, line=None):
     return '%s:%s: %s: %s\n' % (filename, lineno, category.__name__, message)
 warnings.formatwarning = warning_on_one_line
 
+# Ranking metrics of ranking_metrics (k is a cutoff rank, e.g. P@5)
+RANKING_METRICS = ['MAP', 'P@k', 'R@k', 'nDCG@k', 'Rprec', 'MRR']
 
-def format_gs(filepath, output_path, gs_names = ['qid', 'docno']):
+
+def format_gs(filepath, output_path=None, gs_names = ['qid', 'docno']):
     '''
-    Load Gold Standard table and stores TSV file with columns 
-    ["query", "q0", "docid", "rel"].
-    Note: Dataframe headers chosen to match library standards. 
+    Load Gold Standard table and format it with columns 
+    ["qid", "q0", "docno", "rel"].
+    Note: Dataframe headers chosen to match TREC standards. 
       More informative headers for the INPUT would be: 
       ["clinical case","label","code","relevance"]
     
@@ -27,23 +34,27 @@ def format_gs(filepath, output_path, gs_names = ['qid', 'docno']):
     
     Parameters
     ----------
-    filepath: str
+    filepath: str or file-like object
         route to TSV file with Gold Standard.
     output_path: str
-        route to TSV where intermediate file is stored
+        route to Qrel file where the formatted GS is stored. Optional, it is
+        not needed to compute MAP.
     
     Returns
     -------
-    None.
+    gs: pandas DataFrame
+        Formatted Gold Standard, without duplicated codes per clinical case.
+    qid_gs: set
+        Clinical cases in the Gold Standard.
 
     '''
+    # Import GS (read only once, filepath may also be a file-like object)
+    gs = pd.read_csv(filepath, sep='\t', header = 0)
+    
     # Check GS format:
-    check = pd.read_csv(filepath, sep='\t', header = 0, nrows=1)
-    if check.shape[1] != 2:
+    if gs.shape[1] != 2:
         raise ImportError('The GS file does not have 2 columns. Then, it was not imported')
-    
-    # Import GS
-    gs = pd.read_csv(filepath, sep='\t', header = 0, names = gs_names)  
+    gs.columns = gs_names
         
     # Preprocessing
     gs["q0"] = str(0) # column with all zeros (q0) # Columnn needed for the library to properly import the dataframe
@@ -60,18 +71,18 @@ def format_gs(filepath, output_path, gs_names = ['qid', 'docno']):
     qid_gs = set(gs.qid.tolist())
     
     # Write dataframe to Qrel file
-    gs.to_csv(output_path, index=False, header=None, sep=' ')
+    if output_path is not None:
+        gs.to_csv(output_path, index=False, header=None, sep=' ')
     
-    return qid_gs
+    return gs, qid_gs
     
-def format_predictions(filepath, output_path, valid_codes, qid_gs,
+def format_predictions(filepath, valid_codes, qid_gs, output_path=None,
                        system_name = 'xx', pred_names = ['query','docid']):
     '''
-    Load Predictions table, add extra columns to match 
-    trectools library standards and stores TSV files with columns with columns
+    Load Predictions table and add extra columns to match TREC standards: 
     ['query', "q0", 'docid', 'rank', 'score', 'system']
     
-    Note: Dataframe headers chosen to match library standards.
+    Note: Dataframe headers chosen to match TREC standards.
       More informative INPUT headers would be: 
       ["clinical case","code"]
 
@@ -79,28 +90,34 @@ def format_predictions(filepath, output_path, valid_codes, qid_gs,
         
     Parameters
     ---------- 
-    filepath: str
+    filepath: str or file-like object
             route to TSV file with Predictions.
+    valid_codes: numpy array
+        valid codes of this subtask (see valid_codes.load_valid_codes)
+    qid_gs: set
+        clinical cases in the Gold Standard
     output_path: str
-        route to TSV where intermediate file is stored
-    valid_codes: set
-        set of valid codes of this subtask
+        route to Run file where the formatted predictions are stored. 
+        Optional, it is not needed to compute MAP.
 
     Returns
     -------  
-    None.
+    pred_gs_subset: pandas DataFrame
+        Formatted predictions, in the given rank order.
     
     '''
+    # Import predictions (read only once, filepath may also be a file-like
+    # object)
+    pred = pd.read_csv(filepath, sep='\t', header = None)
+    
     # Check predictions format
-    check = pd.read_csv(filepath, sep='\t', header = None, nrows=1)
-    if check.shape[1] != 2:
+    if pred.shape[1] != 2:
         raise ImportError('The predictions file does not have 2 columns. Then, it was not imported')
-
-    # Import predictions
-    pred = pd.read_csv(filepath, sep='\t', header = None, names = pred_names)
+    pred.columns = pred_names
     
     # Check predictions types
-    if all(pred.dtypes == pd.Series({'query': object,'docid': object})) == False:
+    # (strings are object columns before pandas 3 and str columns after it)
+    if all(pd.api.types.is_string_dtype(pred[name]) for name in pred_names) == False:
         warnings.warn('The predictions file has wrong types')
         
     # Check if predictions file is empty
@@ -110,7 +127,7 @@ def format_predictions(filepath, output_path, valid_codes, qid_gs,
     else:
         is_empty = 0
         
-    # Add columns needed for the library to properly import the dataframe
+    # Add columns of the TREC Run format
     pred['rank'] = 1
     pred['rank'] = pred.groupby('query')['rank'].cumsum()
     pred['q0'] = 'Q0'
@@ -128,7 +145,7 @@ def format_predictions(filepath, output_path, valid_codes, qid_gs,
                                 keep='first')  # Keep first of the predictions
     
     # Remove codes predicted but not in list of valid codes
-    pred = pred[pred['docid'].isin(valid_codes)]
+    pred = pred[vc.isin(pred['docid'], valid_codes)]
     if (pred.shape[0] == 0) & (is_empty == 0):
         warnings.warn('None of the predicted codes are considered valid codes')
   
@@ -136,10 +153,380 @@ def format_predictions(filepath, output_path, valid_codes, qid_gs,
     pred_gs_subset = pred.loc[pred['query'].isin(qid_gs),:]
     
     # Write dataframe to Run file
-    pred_gs_subset.to_csv(output_path, index=False, header=None, sep = '\t')
+    if output_path is not None:
+        pred_gs_subset.to_csv(output_path, index=False, header=None, sep = '\t')
+    
+    return pred_gs_subset
+
+
+def compute_map(gs, pred, depth=1000):
+    '''
+    Compute Mean Average Precision. Rank order is taken from the given 
+    order of the predictions (equivalent to trectools 
+    TrecEval.get_map(trec_eval=False)).
+    
+    The precision at the rank of every relevant prediction is obtained with
+    a grouped cumulative sum. Average Precision of one clinical case is 
+    normalized by its number of GS codes, and MAP is averaged over the 
+    clinical cases with predictions.
+
+    Parameters
+    ----------
+    gs : pandas DataFrame
+        Output of format_gs. Relevant columns: 'qid', 'docno'.
+    pred : pandas DataFrame
+        Output of format_predictions. Relevant columns: 'query', 'docid'.
+    depth : int
+        Only the first depth predictions of every clinical case are used.
+
+    Returns
+    -------
+    MAP : float
+        Mean Average Precision.
+
+    '''
+    AP_sum, n_queries = map_components(gs, pred, depth=depth)
+    if n_queries == 0:
+        return 0.0
+    
+    return AP_sum / n_queries
+
+
+def map_components(gs, pred, depth=1000, gs_counts=None):
+    '''
+    Sum of the Average Precision of the clinical cases in pred and number
+    of clinical cases in pred (MAP is their ratio). Components of disjoint
+    sets of clinical cases can be added.
+    
+    gs_counts (number of GS codes per clinical case) can be given to avoid
+    computing it again for every set of predictions.
+    '''
+    if pred.shape[0] == 0:
+        return 0.0, 0
+    AP, queries = average_precision(gs, pred, depth=depth, gs_counts=gs_counts)
+    
+    return AP.sum(), len(queries)
+
+
+def average_precision_per_query(gs, pred, depth=1000):
+    '''
+    Average Precision of every clinical case in pred (pandas Series, in the
+    order of pred). Clinical cases without relevant predictions get zero.
+    '''
+    if pred.shape[0] == 0:
+        return pd.Series([], dtype=float)
+    AP, queries = average_precision(gs, pred, depth=depth)
+    
+    return pd.Series(AP, index=queries)
+
+
+def average_precision(gs, pred, depth=1000, gs_counts=None):
+    '''
+    Average Precision of every clinical case in pred (numpy array) and the
+    clinical cases (pandas Index, in the order of pred).
+    '''
+    if gs_counts is None:
+        gs_counts = gs.groupby('qid')['docno'].count()
+    
+    query, rank, is_rel, hits = rank_predictions(gs, pred, depth=depth)
+    codes, queries = pd.factorize(query)
+    ends = query_ends(codes)
+    
+    # Sum of the precision at the relevant ranks, normalized by the number
+    # of GS codes
+    AP = grouped_cumsum(np.where(is_rel, hits / rank, 0.0), codes)[ends]
+    n_relevant = gs_counts.reindex(queries).to_numpy(dtype=float)
+    
+    # Clinical cases without GS codes get zero, as in trectools
+    return np.where(np.isnan(n_relevant), 0.0, AP / n_relevant), queries
+
+
+def grouped_cumsum(values, codes):
+    '''
+    Cumulative sum of values within every clinical case (codes of 
+    pd.factorize), in the order of the ranked predictions.
+    '''
+    return pd.Series(values).groupby(codes, sort=False).cumsum().to_numpy()
+
+
+def query_ends(codes):
+    '''
+    Position of the last ranked prediction of every clinical case (codes of
+    pd.factorize of the query column of rank_predictions, whose clinical 
+    cases are contiguous).
+    '''
+    return np.cumsum(np.bincount(codes)) - 1
+
+
+def rank_predictions(gs, pred, depth=1000):
+    '''
+    Rank the predictions of every clinical case (first depth ones, in the
+    order of pred). The ranked predictions of every clinical case are 
+    contiguous, clinical cases are in order of first appearance.
+
+    Returns
+    -------
+    query : numpy array
+        Clinical case of every ranked prediction.
+    rank : numpy array
+        Rank of every prediction in its clinical case (from 1).
+    is_rel : numpy array
+        whether every prediction is a GS code of its clinical case.
+    hits : numpy array
+        Relevant predictions of the clinical case up to every rank.
+
+    '''
+    order = np.argsort(pd.factorize(pred['query'])[0], kind='stable')
+    run = pred.iloc[order].groupby('query', sort=False).head(depth)
+    query = run['query'].values
+    rank = run.groupby('query', sort=False).cumcount().values + 1
+    
+    # Relevant predictions and number of them up to every rank
+    relevant = pd.MultiIndex.from_arrays([gs['qid'].values, gs['docno'].values])
+    is_rel = pd.MultiIndex.from_arrays([query, run['docid'].values]).isin(relevant)
+    hits = pd.Series(is_rel.astype(int)).groupby(query, sort=False).cumsum().values
+    
+    return query, rank, is_rel, hits
+
 
+def parse_metrics(spec):
+    '''
+    Ranking metrics of a comma-separated list, e.g. 'MAP,P@5,nDCG@10'.
+    Names are those of RANKING_METRICS, with a positive cutoff k.
+    '''
+    metrics = []
+    for name in spec.split(','):
+        name = name.strip()
+        kind, at, k = name.partition('@')
+        if at == '':
+            valid = name in RANKING_METRICS
+        else:
+            valid = ((kind + '@k') in RANKING_METRICS) and k.isdigit() and (int(k) > 0)
+        if valid == False:
+            raise ValueError('Unknown ranking metric {} (valid: {})'.format(
+                name, ', '.join(RANKING_METRICS)))
+        if name not in metrics:
+            metrics.append(name)
+    return metrics
 
-def main(gs_path, pred_path, codes_path):
+
+def ranking_metrics(gs, pred, metrics, depth=1000, gs_counts=None):
+    '''
+    Compute several ranking metrics of every clinical case from arrays of
+    the ranked predictions (rank_predictions) that are computed once for
+    all the metrics: the relevant predictions up to every rank and the
+    cumulative sums of the precision at the relevant ranks and of the 
+    discounted gain. Every metric then reads them at one rank per clinical
+    case (its cutoff, R or its last rank), so the cost of each metric does
+    not grow with the number of predictions. With R the number of GS codes
+    of the clinical case:
+        MAP     Average Precision (as compute_map)
+        P@k     relevant predictions in the first k ranks / k
+        R@k     relevant predictions in the first k ranks / R
+        nDCG@k  DCG of the first k ranks (binary relevance, 1/log2(rank+1))
+                / DCG of an ideal ranking
+        Rprec   relevant predictions in the first R ranks / R
+        MRR     1 / rank of the first relevant prediction (0 if none)
+    Components of disjoint sets of clinical cases can be added, as those
+    of map_components.
+
+    Parameters
+    ----------
+    gs : pandas DataFrame
+        Output of format_gs.
+    pred : pandas DataFrame
+        Output of format_predictions.
+    metrics : list
+        Metric names (output of parse_metrics).
+    depth : int
+        Only the first depth predictions of every clinical case are used.
+    gs_counts : pandas Series
+        Number of GS codes per clinical case, to avoid computing it again
+        for every set of predictions.
+
+    Returns
+    -------
+    per_query : pandas DataFrame
+        One row per clinical case in pred (in the order of pred), one
+        column per metric.
+    sums : dict
+        Metric name -> sum over the clinical cases.
+
+    '''
+    if gs_counts is None:
+        gs_counts = gs.groupby('qid')['docno'].count()
+    if pred.shape[0] == 0:
+        return pd.DataFrame(columns=metrics, dtype=float), dict.fromkeys(metrics, 0.0)
+    
+    query, rank, is_rel, hits = rank_predictions(gs, pred, depth=depth)
+    codes, queries = pd.factorize(query)
+    n_relevant = gs_counts.reindex(queries).to_numpy(dtype=float)
+    
+    # Shared arrays
+    ends = query_ends(codes)
+    n_ranked = rank[ends]
+    starts = ends - n_ranked + 1
+    AP = grouped_cumsum(np.where(is_rel, hits / rank, 0.0), codes)
+    if any(name.startswith('nDCG@') for name in metrics):
+        DCG = grouped_cumsum(np.where(is_rel, 1 / np.log2(rank + 1), 0.0), codes)
+    if 'MRR' in metrics:
+        first = is_rel & (hits == 1)
+        reciprocal_rank = np.zeros(len(queries))
+        reciprocal_rank[codes[first]] = 1 / rank[first]
+    
+    def at_rank(cumulative, k):
+        # Value of a cumulative array at rank k (or at the last rank, if
+        # there are fewer predictions) of every clinical case
+        return cumulative[starts + np.minimum(k, n_ranked).astype(int) - 1]
+    
+    per_query = {}
+    for name in metrics:
+        kind, _, k = name.partition('@')
+        k = int(k) if k else 0
+        if kind == 'MAP':
+            values = AP[ends] / n_relevant
+        elif kind == 'P':
+            values = at_rank(hits, k) / k
+        elif kind == 'R':
+            values = at_rank(hits, k) / n_relevant
+        elif kind == 'nDCG':
+            discounts = 1 / np.log2(np.arange(2, k + 2))
+            ideal = np.concatenate([[0.0], np.cumsum(discounts)])
+            values = at_rank(DCG, k) / ideal[np.minimum(k, n_relevant).astype(int)]
+        elif kind == 'Rprec':
+            values = at_rank(hits, n_relevant) / n_relevant
+        elif kind == 'MRR':
+            values = reciprocal_rank
+        per_query[name] = values
+    
+    return (pd.DataFrame(per_query, index=queries, columns=metrics),
+            {name: values.sum() for name, values in per_query.items()})
+
+
+def compute_ranking_metrics(gs, pred, metrics, depth=1000):
+    '''
+    Ranking metrics (see ranking_metrics) averaged over the clinical cases
+    with predictions, as MAP.
+
+    Returns
+    -------
+    means : dict
+        Metric name -> mean value.
+    per_query : pandas DataFrame
+        Output of ranking_metrics.
+
+    '''
+    per_query, sums = ranking_metrics(gs, pred, metrics, depth=depth)
+    n_queries = per_query.shape[0]
+    
+    return ({name: sums[name] / n_queries if n_queries > 0 else 0.0
+             for name in metrics}, per_query)
+
+
+def compute_map_stream(filepath, valid_codes, gs, qid_gs, depth=1000,
+                       chunk_rows=prediction_stream.CHUNK_ROWS):
+    '''
+    Same as format_predictions followed by compute_map, reading the 
+    predictions in chunks of complete clinical cases (see 
+    prediction_stream.py), so that the whole file is never in memory. The
+    rows of every clinical case must be contiguous. Codes are read as
+    strings.
+    '''
+    gs_counts = gs.groupby('qid')['docno'].count()
+    AP_sum, n_queries = 0.0, 0
+    for pred in iter_prediction_chunks(filepath, valid_codes, qid_gs,
+                                       chunk_rows=chunk_rows):
+        chunk_AP_sum, chunk_queries = map_components(gs, pred, depth=depth,
+                                                     gs_counts=gs_counts)
+        AP_sum += chunk_AP_sum
+        n_queries += chunk_queries
+    
+    if n_queries == 0:
+        return 0.0
+    
+    return AP_sum / n_queries
+
+
+def compute_ranking_metrics_stream(filepath, valid_codes, gs, qid_gs, metrics,
+                                   depth=1000, chunk_rows=prediction_stream.CHUNK_ROWS):
+    '''
+    Same as format_predictions followed by compute_ranking_metrics, reading
+    the predictions in chunks of complete clinical cases (see 
+    compute_map_stream). Only the metrics of every clinical case are kept.
+    '''
+    gs_counts = gs.groupby('qid')['docno'].count()
+    per_query_chunks = []
+    sums = dict.fromkeys(metrics, 0.0)
+    for pred in iter_prediction_chunks(filepath, valid_codes, qid_gs,
+                                       chunk_rows=chunk_rows):
+        per_query, chunk_sums = ranking_metrics(gs, pred, metrics, depth=depth,
+                                                gs_counts=gs_counts)
+        per_query_chunks.append(per_query)
+        for name in metrics:
+            sums[name] += chunk_sums[name]
+    
+    per_query = pd.concat(per_query_chunks) if per_query_chunks else \
+        pd.DataFrame(columns=metrics, dtype=float)
+    n_queries = per_query.shape[0]
+    
+    return ({name: sums[name] / n_queries if n_queries > 0 else 0.0
+             for name in metrics}, per_query)
+
+
+def iter_prediction_chunks(filepath, valid_codes, qid_gs,
+                           chunk_rows=prediction_stream.CHUNK_ROWS):
+    '''
+    Read the predictions TSV in chunks of complete clinical cases and
+    format them as format_predictions does (lowercase codes, without 
+    duplicated, not valid or not GS clinical case predictions). The
+    warnings of format_predictions are shown when all chunks are read.
+    '''
+    n_rows, n_valid = 0, 0
+    for pred in prediction_stream.iter_case_chunks(filepath, names=['query', 'docid'],
+                                                   chunk_rows=chunk_rows):
+        n_rows += pred.shape[0]
+        pred['docid'] = pred['docid'].str.lower()
+        pred = pred.drop_duplicates(subset=['query', 'docid'], keep='first')
+        pred = pred[vc.isin(pred['docid'], valid_codes)]
+        n_valid += pred.shape[0]
+        yield pred.loc[pred['query'].isin(qid_gs),:]
+    
+    if n_rows == 0:
+        warnings.warn('The predictions file is empty')
+    elif n_valid == 0:
+        warnings.warn('None of the predicted codes are considered valid codes')
+
+
+def format_text(pred_path, MAP):
+    '''
+    Build the text output: MAP and the pred_path|MAP line.
+    '''
+    return ('\nMAP estimate: {}\n\n'.format(round(MAP, 3)) +
+            '{}|{}\n'.format(pred_path, round(MAP,3)))
+
+
+def format_ranking_text(pred_path, means, per_query):
+    '''
+    Build the text output of several ranking metrics: table of values per
+    clinical case, means and the pred_path|value|value... line.
+    '''
+    separator = '-----------------------------------------------------'
+    lines = ['\n' + separator, '\t'.join(['Clinical case name'] + list(means)),
+             separator]
+    for index, row in zip(per_query.index, per_query.itertuples(index=False)):
+        lines.append('\t'.join([str(index)] + [str(round(val, 3)) for val in row]))
+    lines.extend([separator, ''])
+    lines.extend('{} estimate: {}'.format(name, round(val, 3))
+                 for name, val in means.items())
+    lines.extend(['', '|'.join([pred_path] + [str(round(val, 3))
+                                              for val in means.values()])])
+    
+    return '\n'.join(lines) + '\n'
+
+
+def main(gs_path, pred_path, codes_path, fmt='text', output_path=None,
+         stream=False, stats_path=None, result_cache_dir=None,
+         result_cache_size=None, metrics=None):
     '''
     Load GS, predictions and valid codes; format GS and predictions according
     to TREC specifications; compute MAP and print it.
@@ -155,6 +542,28 @@ def main(gs_path, pred_path, codes_path):
     codes_path : str
         Path to TSV file with valid codes.
         It has no headers row.
+    fmt : str
+        Output format: 'text', 'json', 'csv' or 'tsv'.
+    output_path : str
+        If given, results are written to this file instead of stdout.
+    stream : bool
+        whether to read the predictions in chunks of complete clinical 
+        cases (compute_map_stream), for prediction files too large to be
+        loaded at once.
+    stats_path : str
+        If given, the Average Precision per clinical case is written to
+        this file (see shard_stats.py) instead of the results. Not
+        supported with stream or metrics.
+    result_cache_dir : str
+        If given, results are read from this cache directory when the same
+        contents were already scored, and stored in it otherwise (see 
+        result_cache.py).
+    result_cache_size : int
+        Size bound of the result cache directory, in bytes (default: 
+        result_cache.MAX_BYTES).
+    metrics : list
+        If given, these ranking metrics (see ranking_metrics) are computed
+        instead of MAP alone, and their values per clinical case are shown.
 
     Returns
     -------
@@ -162,31 +571,99 @@ def main(gs_path, pred_path, codes_path):
 
     '''
         
+    if (stream | (metrics is not None)) & (stats_path is not None):
+        raise Exception('Statistics files are not supported in streaming mode ' +
+                        'or with ranking metrics')
+    
+    use_cache = (result_cache_dir is not None) & (stats_path is None)
+    if use_cache:
+        import result_cache
+        with profiling.stage('result_cache'):
+            cache_key = result_cache.cache_key('coding', gs_path, pred_path,
+                                               codes_path=codes_path,
+                                               options=','.join(metrics or []))
+            results = result_cache.load_results(result_cache_dir, cache_key)
+        if results is not None:
+            profiling.count('result_cache_hits')
+            means = {name: values[0] for name, values in results.items()}
+            per_query = None
+            if metrics is not None:
+                per_query = pd.DataFrame({name: values[1] for name, values in results.items()},
+                                         columns=metrics)
+            results_output.write_output(format_output(pred_path, means, per_query,
+                                                      fmt=fmt), output_path)
+            return
+    
     ###### 0. Load valid codes lists: ######
-    valid_codes = set(pd.read_csv(codes_path, sep='\t', header=None, 
-                                  usecols=[0])[0].tolist())
-    valid_codes = set([x.lower() for x in valid_codes])
+    with profiling.stage('load_valid_codes'):
+        valid_codes = vc.load_valid_codes(codes_path)
     
     ###### 1. Format GS as TrecQrel format: ######
-    qid_gs = format_gs(gs_path, './intermediate_gs_file.txt')
+    with profiling.stage('format_gs'):
+        gs, qid_gs = format_gs(gs_path)
+    profiling.count('gs_rows', gs.shape[0])
     
-    ###### 2. Format predictions as TrecRun format: ######
-    format_predictions(pred_path, './intermediate_predictions_file.txt', 
-                       valid_codes, qid_gs)
+    per_query = None
+    if stream == True:
+        ###### 2-3. Format predictions and calculate MAP chunk by chunk ######
+        if metrics is not None:
+            with profiling.stage('compute_ranking_metrics_stream'):
+                means, per_query = compute_ranking_metrics_stream(
+                    pred_path, valid_codes, gs, qid_gs, metrics)
+        else:
+            with profiling.stage('compute_map_stream'):
+                means = {'MAP': compute_map_stream(pred_path, valid_codes, gs, qid_gs)}
+    else:
+        ###### 2. Format predictions as TrecRun format: ######
+        with profiling.stage('format_predictions'):
+            pred = format_predictions(pred_path, valid_codes, qid_gs)
+        profiling.count('pred_rows', pred.shape[0])
+        
+        if stats_path is not None:
+            ###### 3. Write the Average Precision per clinical case ######
+            import shard_stats
+            with profiling.stage('write_stats'):
+                AP_per_query = average_precision_per_query(gs, pred)
+                shard_stats.write_stats(stats_path, 'coding',
+                                        pd.DataFrame({'AP': AP_per_query}))
+            return
+        
+        ###### 3. Calculate MAP (or several ranking metrics) ######
+        # Rank order is taken from the given document order
+        if metrics is not None:
+            with profiling.stage('compute_ranking_metrics'):
+                means, per_query = compute_ranking_metrics(gs, pred, metrics)
+        else:
+            with profiling.stage('compute_map'):
+                means = {'MAP': compute_map(gs, pred)}
     
+    if use_cache:
+        if per_query is None:
+            results = {name: (val,) for name, val in means.items()}
+        else:
+            results = {name: (val, per_query[name]) for name, val in means.items()}
+        with profiling.stage('result_cache'):
+            result_cache.store_results(result_cache_dir, cache_key, results,
+                                       max_bytes=result_cache_size or
+                                       result_cache.MAX_BYTES)
     
-    ###### 3. Calculate MAP ######
-    # Load GS from qrel file
-    qrels = TrecQrel('./intermediate_gs_file.txt')
+    ###### 4. Show results ######
+    results_output.write_output(format_output(pred_path, means, per_query, fmt=fmt),
+                                output_path)
 
-    # Load pred from run file
-    run = TrecRun('./intermediate_predictions_file.txt')
 
-    # Calculate MAP
-    te = TrecEval(run, qrels)
-    MAP = te.get_map(trec_eval=False) # With this option False, rank order is taken from the given document order
-    
-    ###### 4. Show results ######
-    print('\nMAP estimate: {}\n'.format(round(MAP, 3)))
-    #print('\n{}'.format(round(MAP, 3)))
-    print('{}|{}'.format(pred_path, round(MAP,3)))
+def format_output(pred_path, means, per_query=None, fmt='text'):
+    '''
+    Build the output of one run in the given format: MAP alone (means is
+    {'MAP': MAP} and per_query is None) or several ranking metrics and 
+    their values per clinical case.
+    '''
+    if per_query is None:
+        if fmt == 'text':
+            return format_text(pred_path, means['MAP'])
+        return results_output.format_results(pred_path, means, fmt=fmt)
+    if fmt == 'text':
+        return format_ranking_text(pred_path, means, per_query)
+    return results_output.format_results(pred_path, means,
+                                         {name: per_query[name] for name in means},
+                                         fmt=fmt)
@@ -8,15 +8,33 @@ Created on Mon Jun 8 15:22:29 2020
 
 import pandas as pd
 import ann_parsing
+import gs_store
+import interval_matching
+import multi_codes
+import profiling
+import results_output
+import valid_codes as vc
 import warnings
-import os
 
 def warning_on_one_line(message, category, filename, lineno, file=None, line=None):
     return '%s:%s: %s: %s\n' % (filename, lineno, category.__name__, message)
 warnings.formatwarning = warning_on_one_line
 
+GS_LABELS = ['MORFOLOGIA_NEOPLASIA']
+PRED_LABELS = ['MORFOLOGIA_NEOPLASIA','MORFOLOGIA-NEOPLASIA']
+GS_COLUMNS = {'ner': ['clinical_case', 'mark', 'label', 'offset', 'span', 
+                      'start_pos_gs', 'end_pos_gs'],
+              'norm': ['clinical_case', 'mark', 'label', 'offset', 'span', 'code_gs',
+                       'start_pos_gs', 'end_pos_gs']}
+PRED_COLUMNS = {'ner': ['clinical_case', 'mark', 'label', 'offset', 'span',
+                        'start_pos_pred', 'end_pos_pred'],
+                'norm': ['clinical_case', 'mark', 'label', 'offset', 'span', 'code_pred',
+                         'start_pos_pred', 'end_pos_pred']}
 
-def main(gs_path, pred_path, subtask=['ner','norm']):
+def main(gs_path, pred_path, subtask=['ner','norm'], jobs=1, codes_path=None,
+         cache_dir=None, fmt='text', output_path=None, summary_only=False,
+         match='strict', multi_codes_path=None, stats_path=None,
+         result_cache_dir=None, result_cache_size=None, breakdown_path=None):
     '''
     Load GS and Predictions; format them; compute precision, recall and 
     F1-score and show them.
@@ -24,104 +42,350 @@ def main(gs_path, pred_path, subtask=['ner','norm']):
     Parameters
     ----------
     gs_path : str
-        Path to directory with GS .ANN files (Brat format).
+        Path to directory (or zip/tar archive) with GS .ANN files (Brat 
+        format), or to a GS store (.npz) compiled with gs_store.py.
     pred_path : str
-        Path to directory with Predicted .ANN files (Brat format).
+        Path to directory (or zip/tar archive) with Predicted .ANN files 
+        (Brat format).
     subtask : str
         Subtask name
+    jobs : int
+        Number of worker processes used to parse the .ANN files.
+    codes_path : str
+        Path to TSV file with valid codes. If given (subtask norm), a 
+        warning is shown when predicted codes are not valid.
+    cache_dir : str
+        If given, incremental mode: only the predicted .ANN files that 
+        changed since the last run with this cache directory are parsed.
+    fmt : str
+        Output format: 'text' (tables), 'json', 'csv' or 'tsv'.
+    output_path : str
+        If given, results are written to this file instead of stdout.
+    summary_only : bool
+        whether to leave out the per clinical case results.
+    match : str
+        'strict' (exact offsets), 'lenient' (overlapping offsets, see
+        interval_matching.py) or 'both'. With 'both', the lenient results
+        are shown first and the strict ones last.
+    multi_codes_path : str
+        Path to TSV file with the GS annotations that have several valid
+        codes (see multi_codes.py). If None (subtask norm), they are derived
+        from the GS.
+    stats_path : str
+        If given, the counts per clinical case are written to this file 
+        (see shard_stats.py) instead of the results. Not supported with
+        match 'both' or with incremental mode.
+    result_cache_dir : str
+        If given, results are read from this cache directory when the same
+        contents were already scored, and stored in it otherwise (see 
+        result_cache.py).
+    result_cache_size : int
+        Size bound of the result cache directory, in bytes (default: 
+        result_cache.MAX_BYTES).
+    breakdown_path : str
+        subtask norm: if given, P, R and F1 by code and code family (see 
+        code_breakdown.py) are also written to this file, in format fmt.
+        Not supported with incremental mode, stats_path or 
+        result_cache_dir.
 
     Returns
     -------
     None.
 
     '''
-    # Get ANN files in Gold Standard
-    ann_list_gs = list(filter(lambda x: x[-4:] == '.ann', os.listdir(gs_path)))
+    if subtask not in ['ner', 'norm']:
+        raise Exception('Error! Subtask name not properly set up')
     
-    if subtask=='norm':
-        gs = ann_parsing.main(gs_path, ['MORFOLOGIA_NEOPLASIA'], with_notes=True)
-        pred = ann_parsing.main(pred_path, ['MORFOLOGIA_NEOPLASIA','MORFOLOGIA-NEOPLASIA'], with_notes=True)
+    if (subtask=='norm') & (codes_path is not None):
+        with profiling.stage('load_valid_codes'):
+            valid_codes = vc.load_valid_codes(codes_path)
+    else:
+        valid_codes = None
+    
+    if (subtask=='norm') & (multi_codes_path is not None):
+        multi_code_keys = multi_codes.load_keys(multi_codes_path)
+    else:
+        multi_code_keys = None
+    
+    if match not in interval_matching.MATCH_MODES:
+        raise Exception('Error! Matching mode not properly set up')
+    modes = ['lenient', 'strict'] if match == 'both' else [match]
+    if (stats_path is not None) & ((match == 'both') | (cache_dir is not None)):
+        raise Exception('Statistics files need one matching mode, without incremental mode')
+    if (breakdown_path is not None) & ((subtask != 'norm') | (cache_dir is not None) |
+                                       (stats_path is not None) |
+                                       (result_cache_dir is not None)):
+        raise Exception('The breakdown by code needs subtask norm, without incremental ' +
+                        'mode, statistics files or result cache')
+    
+    results = None
+    if (result_cache_dir is not None) & (stats_path is None):
+        import result_cache
+        with profiling.stage('result_cache'):
+            cache_key = result_cache.cache_key(
+                subtask, gs_path, pred_path, codes_path=codes_path, match=match,
+                multi_codes_path=multi_codes_path if subtask == 'norm' else None)
+            results = result_cache.load_results(result_cache_dir, cache_key)
+    cached = results is not None
+    
+    if cached:
+        profiling.count('result_cache_hits')
+    elif cache_dir is not None:
+        results = {}
+        if match != 'strict':
+            raise Exception('Incremental mode only supports strict matching')
+        if multi_code_keys is not None:
+            raise Exception('Incremental mode derives multi-code annotations from the GS')
+        # Compute metrics re-parsing only the changed predictions
+        import incremental
+        with profiling.stage('incremental'):
+            results['strict'] = incremental.evaluate(gs_path, pred_path, subtask,
+                                                     cache_dir, valid_codes=valid_codes)
+    else:
+        results = {}
+        # Load GS and predictions
+        with profiling.stage('load_gs'):
+            gs, ann_list_gs = load_gs(gs_path, subtask, jobs=jobs)
+        with profiling.stage('load_predictions'):
+            pred = load_predictions(pred_path, subtask, jobs=jobs)
         
-        if pred.shape[0] == 0:
-            raise Exception('There are not parsed predicted annotations')
-        elif gs.shape[0] == 0:
-            raise Exception('There are not parsed Gold Standard annotations')
+        # Count matches per clinical case
+        with profiling.stage('evaluate'):
+            pred_gs_subset = filter_predictions(pred, ann_list_gs, subtask,
+                                                valid_codes=valid_codes)
+            counts, label_counts = {}, {}
+            for mode in modes:
+                mode_counts = count_cases(gs, pred_gs_subset, subtask=subtask,
+                                          match=mode, multi_code_keys=multi_code_keys,
+                                          breakdown=breakdown_path is not None)
+                if breakdown_path is not None:
+                    counts[mode], label_counts[mode] = mode_counts
+                else:
+                    counts[mode] = mode_counts
         
-        gs.columns = ['clinical_case', 'mark', 'label', 'offset', 'span', 'code_gs',
-                      'start_pos_gs', 'end_pos_gs']
-        pred.columns = ['clinical_case', 'mark', 'label', 'offset', 'span', 'code_pred',
-                      'start_pos_pred', 'end_pos_pred']
-    elif subtask=='ner':
-        gs = ann_parsing.main(gs_path, ['MORFOLOGIA_NEOPLASIA'], with_notes=False)
-        pred = ann_parsing.main(pred_path, ['MORFOLOGIA_NEOPLASIA','MORFOLOGIA-NEOPLASIA'], with_notes=False)
+        if stats_path is not None:
+            import shard_stats
+            with profiling.stage('write_stats'):
+                shard_stats.write_stats(stats_path, subtask, counts[match],
+                                        match=match)
+            return
         
-        if pred.shape[0] == 0:
-            raise Exception('There are not parsed predicted annotations')
-        elif gs.shape[0] == 0:
-            raise Exception('There are not parsed Gold Standard annotations')
+        # Compute metrics
+        with profiling.stage('metrics_from_counts'):
+            for mode in modes:
+                results[mode] = metrics_from_counts(counts[mode])
+    
+    if (result_cache_dir is not None) & (cached == False):
+        with profiling.stage('result_cache'):
+            result_cache.store_results(result_cache_dir, cache_key, results,
+                                       max_bytes=result_cache_size or
+                                       result_cache.MAX_BYTES)
         
-        gs.columns = ['clinical_case', 'mark', 'label', 'offset', 'span', 
-                      'start_pos_gs', 'end_pos_gs']
-        pred.columns = ['clinical_case', 'mark', 'label', 'offset', 'span',
-                      'start_pos_pred', 'end_pos_pred']
+    ###### Show results ######
+    if fmt == 'text':
+        content = ''
+        for mode in modes:
+            if match == 'both':
+                content += '\n{} matching\n'.format(mode.capitalize())
+            content += format_text(pred_path, *results[mode],
+                                   summary_only=summary_only)
     else:
-        raise Exception('Error! Subtask name not properly set up')
-
-    # Remove predictions for files not in Gold Standard
-    pred_gs_subset = pred.loc[pred['clinical_case'].isin(ann_list_gs),:]
+        formatted = {}
+        for mode in modes:
+            P_per_cc, P, R_per_cc, R, F1_per_cc, F1 = results[mode]
+            per_cc = None if summary_only else {'P': P_per_cc, 'R': R_per_cc,
+                                                'F1': F1_per_cc}
+            formatted[mode] = ({'P': P, 'R': R, 'F1': F1}, per_cc)
+        if match == 'both':
+            content = results_output.format_match_results(pred_path, formatted,
+                                                          fmt=fmt)
+        else:
+            content = results_output.format_results(pred_path, *formatted[match],
+                                                    fmt=fmt)
+    with profiling.stage('write_results'):
+        results_output.write_output(content, output_path)
     
-    # Compute metrics
-    P_per_cc, P, R_per_cc, R, F1_per_cc, F1 = calculate_metrics(gs, pred_gs_subset, 
-                                                                subtask=subtask)
-        
-    ###### Show results ######  
-    print('\n-----------------------------------------------------')
-    print('Clinical case name\t\t\tPrecision')
-    print('-----------------------------------------------------')
-    for index, val in P_per_cc.items():
-        print(str(index) + '\t\t' + str(round(val, 3)))
-        print('-----------------------------------------------------')
-    '''if any(P_per_cc.isna()):
-        warnings.warn('Some documents do not have predicted codes, ' + 
-                      'document-wise Precision not computed for them.')'''
+    if breakdown_path is not None:
+        import code_breakdown
+        with profiling.stage('write_breakdown'):
+            breakdowns = {mode if match == 'both' else '':
+                          code_breakdown.compute_breakdown(label_counts[mode])
+                          for mode in modes}
+            results_output.write_output(code_breakdown.format_breakdown(
+                pred_path, breakdowns, fmt=fmt), breakdown_path)
+
+
+def format_text(pred_path, P_per_cc, P, R_per_cc, R, F1_per_cc, F1,
+                summary_only=False):
+    '''
+    Build the text output: per clinical case tables (unless summary_only),
+    micro-averages and the pred_path|P|R|F1 line.
+    '''
+    separator = '-----------------------------------------------------'
+    lines = []
+    if summary_only == False:
+        for title, values in [('Precision', P_per_cc), ('Recall', R_per_cc),
+                              ('F-score', F1_per_cc)]:
+            lines.extend(['\n' + separator, 'Clinical case name\t\t\t' + title,
+                          separator])
+            for index, val in values.items():
+                lines.append(str(index) + '\t\t' + str(round(val, 3)))
+                lines.append(separator)
         
+    lines.extend(['\n' + separator, 'Micro-average metrics', separator,
+                  '\nMicro-average precision = {}\n'.format(round(P, 3)),
+                  '\nMicro-average recall = {}\n'.format(round(R, 3)),
+                  '\nMicro-average F-score = {}\n'.format(round(F1, 3)),
+                  '{}|{}|{}|{}'.format(pred_path,round(P, 3),round(R, 3),round(F1, 3))])
+    
+    return '\n'.join(lines) + '\n'
+
+
+def load_gs(gs_path, subtask, jobs=1):
+    '''
+    Load the Gold Standard annotations of one subtask. 
+
+    Parameters
+    ----------
+    gs_path : str
+        Path to directory (or zip/tar archive) with GS .ANN files (Brat 
+        format), or to a GS store (.npz) compiled with gs_store.py. If the 
+        store is stale, the GS directory it was compiled from is parsed 
+        instead.
+    subtask : str
+        Subtask name
+    jobs : int
+        Number of worker processes used to parse the .ANN files.
+
+    Returns
+    -------
+    gs : pandas DataFrame
+        GS annotations, with columns GS_COLUMNS[subtask].
+    ann_list_gs : list
+        ANN files in the Gold Standard directory.
+
+    '''
+    gs = None
+    if gs_store.is_store(gs_path):
+        gs, ann_list_gs = gs_store.load_gs(gs_path, subtask)
+        if gs is None:
+            gs_path = gs_store.source_path(gs_path)
     
+    if gs is None:
+        # Get ANN files in Gold Standard
+        ann_list_gs = gs_store.list_gs_files(gs_path)
+        gs = ann_parsing.main(gs_path, GS_LABELS, with_notes=(subtask=='norm'),
+                              jobs=jobs)
     
-    print('\n-----------------------------------------------------')
-    print('Clinical case name\t\t\tRecall')
-    print('-----------------------------------------------------')
-    for index, val in R_per_cc.items():
-        print(str(index) + '\t\t' + str(round(val, 3)))
-        print('-----------------------------------------------------')
-    '''if any(R_per_cc.isna()):
-        warnings.warn('Some documents do not have Gold Standard codes, ' + 
-                      'document-wise Recall not computed for them.')'''
-    
-    
-    print('\n-----------------------------------------------------')
-    print('Clinical case name\t\t\tF-score')
-    print('-----------------------------------------------------')
-    for index, val in F1_per_cc.items():
-        print(str(index) + '\t\t' + str(round(val, 3)))
-        print('-----------------------------------------------------')
-    '''if any(P_per_cc.isna()):
-        warnings.warn('Some documents do not have predicted codes, ' + 
-                      'document-wise F-score not computed for them.')
-    if any(R_per_cc.isna()):
-        warnings.warn('Some documents do not have Gold Standard codes, ' + 
-                      'document-wise F-score not computed for them.')'''
-        
-    print('\n-----------------------------------------------------')
-    print('Micro-average metrics')
-    print('-----------------------------------------------------')
-    print('\nMicro-average precision = {}\n'.format(round(P, 3)))
-    print('\nMicro-average recall = {}\n'.format(round(R, 3)))
-    print('\nMicro-average F-score = {}\n'.format(round(F1, 3)))
+    if gs.shape[0] == 0:
+        raise Exception('There are not parsed Gold Standard annotations')
+    gs.columns = GS_COLUMNS[subtask]
+    
+    return gs, ann_list_gs
+
+
+def load_predictions(pred_path, subtask, jobs=1):
+    '''
+    Load the predicted annotations of one subtask. 
+
+    Parameters
+    ----------
+    pred_path : str
+        Path to directory (or zip/tar archive) with Predicted .ANN files 
+        (Brat format).
+    subtask : str
+        Subtask name
+    jobs : int
+        Number of worker processes used to parse the .ANN files.
+
+    Returns
+    -------
+    pred : pandas DataFrame
+        Predicted annotations, with columns PRED_COLUMNS[subtask].
+
+    '''
+    pred = ann_parsing.main(pred_path, PRED_LABELS, with_notes=(subtask=='norm'),
+                            jobs=jobs)
+    
+    return set_prediction_columns(pred, subtask)
+
+
+def load_predictions_from_texts(texts, subtask):
+    '''
+    Same as load_predictions, for .ANN files given as a dict with their 
+    contents (file name -> content).
+    '''
+    pred = ann_parsing.check_and_format(
+        ann_parsing.parse_ann_texts(texts, PRED_LABELS, 
+                                    with_notes=(subtask=='norm')))
+    
+    return set_prediction_columns(pred, subtask)
+
+
+def set_prediction_columns(pred, subtask):
+    
+    if pred.shape[0] == 0:
+        raise Exception('There are not parsed predicted annotations')
+    pred.columns = PRED_COLUMNS[subtask]
+    
+    return pred
+
+
+def evaluate(gs, ann_list_gs, pred, subtask, valid_codes=None, match='strict',
+             multi_code_keys=None):
+    '''
+    Compute precision, recall and F1-score of one set of predictions.
+
+    Parameters
+    ----------
+    gs : pandas DataFrame
+        Output of load_gs.
+    ann_list_gs : list
+        ANN files in the Gold Standard directory.
+    pred : pandas DataFrame
+        Output of load_predictions.
+    subtask : str
+        Subtask name
+    valid_codes : numpy array
+        Valid codes. If given (subtask norm), a warning is shown when 
+        predicted codes are not valid.
+    match : str
+        'strict' or 'lenient'.
+    multi_code_keys : pandas DataFrame
+        Output of multi_codes.load_keys. See count_matches.
+
+    Returns
+    -------
+    Same as calculate_metrics.
+
+    '''
+    pred_gs_subset = filter_predictions(pred, ann_list_gs, subtask,
+                                        valid_codes=valid_codes)
+    
+    return calculate_metrics(gs, pred_gs_subset, subtask=subtask, match=match,
+                             multi_code_keys=multi_code_keys)
+
+
+def filter_predictions(pred, ann_list_gs, subtask, valid_codes=None):
+    '''
+    Keep the predictions of files in the Gold Standard and warn about 
+    predicted codes that are not valid.
+    '''
+    # Remove predictions for files not in Gold Standard
+    pred_gs_subset = pred.loc[pred['clinical_case'].isin(ann_list_gs),:]
+    
+    # Check predicted codes
+    if (subtask=='norm') & (valid_codes is not None):
+        n_invalid = (~vc.isin(pred_gs_subset['code_pred'].str.lower(), valid_codes)).sum()
+        if n_invalid > 0:
+            warnings.warn('{} predicted annotations have codes '.format(n_invalid) +
+                          'not included in the list of valid codes')
     
-    print('{}|{}|{}|{}'.format(pred_path,round(P, 3),round(R, 3),round(F1, 3)))
+    return pred_gs_subset
 
 
-def calculate_metrics(gs, pred, subtask=['ner','norm']):
+def calculate_metrics(gs, pred, subtask=['ner','norm'], match='strict',
+                      multi_code_keys=None):
     '''       
     Calculate task Coding metrics:
     
@@ -136,6 +400,12 @@ def calculate_metrics(gs, pred, subtask=['ner','norm']):
         with the predictions. Columns are those defined in main function.
     subtask : str
         subtask name
+    match : str
+        'strict': a prediction is valid if its offsets are exactly those of
+        a GS annotation. 'lenient': if its offsets overlap those of a GS 
+        annotation (one-to-one, see interval_matching.py).
+    multi_code_keys : pandas DataFrame
+        Output of multi_codes.load_keys. See count_matches.
     
     Returns
     -------
@@ -153,64 +423,163 @@ def calculate_metrics(gs, pred, subtask=['ner','norm']):
         Micro-average F1-score
     '''
     
+    counts = count_cases(gs, pred, subtask=subtask, match=match,
+                         multi_code_keys=multi_code_keys)
+    
+    with profiling.stage('metrics_from_counts'):
+        return metrics_from_counts(counts)
+
+
+def count_cases(gs, pred, subtask=['ner','norm'], match='strict',
+                multi_code_keys=None, breakdown=False):
+    '''
+    Count True Positives, Predicted Positives and Gold Standard Positives 
+    per clinical case with one matching mode ('strict': count_matches, 
+    'lenient': interval_matching.count_overlaps). These counts are the 
+    sufficient statistics of the metrics: counts of disjoint sets of 
+    clinical cases can be concatenated. With breakdown=True (subtask 
+    norm), the counts by code and code family are also returned.
+    '''
+    profiling.count('gs_rows', gs.shape[0])
+    profiling.count('pred_rows', pred.shape[0])
+    if match == 'lenient':
+        with profiling.stage('count_overlaps'):
+            return interval_matching.count_overlaps(gs, pred, subtask=subtask,
+                                                    breakdown=breakdown)
+    with profiling.stage('count_matches'):
+        return count_matches(gs, pred, subtask=subtask,
+                             multi_code_keys=multi_code_keys, breakdown=breakdown)
+
+
+def count_matches(gs, pred, subtask=['ner','norm'], multi_code_keys=None,
+                  breakdown=False):
+    '''
+    Count True Positives, Predicted Positives and Gold Standard Positives 
+    per clinical case.
+    
+    Parameters
+    ---------- 
+    gs : pandas dataframe
+        with the Gold Standard. Columns are those defined in main function.
+    pred : pandas dataframe
+        with the predictions. Columns are those defined in main function.
+    subtask : str
+        subtask name
+    multi_code_keys : pandas DataFrame
+        subtask norm: GS annotations with several valid codes (output of 
+        multi_codes.load_keys). If None, all GS annotations with several 
+        codes.
+    breakdown : bool
+        subtask norm: whether to also count the annotations of every code
+        and code family, from the same merge (see code_breakdown.py).
+    
+    Returns
+    -------
+    counts : pandas dataframe
+        One row per clinical case present in the GS or in the predictions 
+        (sorted by name). Integer columns: 'TP', 'Pred_Pos', 'GS_Pos'.
+    label_counts : dict
+        Only with breakdown=True. Output of code_breakdown.count_labels.
+    '''
+    
+    if breakdown & (subtask != 'norm'):
+        raise Exception('The breakdown by code is only supported in subtask norm')
+    
+    # Integer-keyed joins and comparisons
+    gs, pred = ann_parsing.share_categories(gs, pred, shared_columns(subtask))
+    
     # Predicted Positives:
-    Pred_Pos_per_cc = \
-        pred.drop_duplicates(subset=['clinical_case', "offset"]).\
-        groupby("clinical_case")["offset"].count()
-    Pred_Pos = pred.drop_duplicates(subset=['clinical_case', "offset"]).shape[0]
+    Pred_Pos_per_cc = ann_parsing.size_by(
+        pred.drop_duplicates(subset=['clinical_case', "offset"]), "clinical_case")
 
     # Gold Standard Positives:
-    GS_Pos_per_cc = \
-        gs.drop_duplicates(subset=['clinical_case', "offset"]).\
-        groupby("clinical_case")["offset"].count()
-    GS_Pos = gs.drop_duplicates(subset=['clinical_case', "offset"]).shape[0]
+    GS_Pos_per_cc = ann_parsing.size_by(
+        gs.drop_duplicates(subset=['clinical_case', "offset"]), "clinical_case")
     
     # Eliminate predictions not in GS (prediction needs to be in same clinical
     # case and to have the exact same offset to be considered valid!!!!)
     df_sel = pd.merge(pred, gs, 
-                      how="right",
+                      how="inner",
                       on=["clinical_case", "offset"])
     
     if subtask=='norm':
         # Check if codes are equal
-        df_sel["is_valid"] = \
-            df_sel.apply(lambda x: (x["code_gs"] == x["code_pred"]), axis=1)
+        df_sel = df_sel.assign(is_valid=(df_sel["code_gs"] == 
+                                         df_sel["code_pred"]).values)
     elif subtask=='ner':
-        is_valid = df_sel.apply(lambda x: x.isnull().any()==False, axis=1)
-        df_sel = df_sel.assign(is_valid=is_valid.values)
+        df_sel = df_sel.assign(is_valid=df_sel.notna().all(axis=1).values)
     else:
         raise Exception('Error! Subtask name not properly set up')
     
 
-    # There are two annotations with two valid codes. Any of the two codes is considered as valid
+    if breakdown:
+        # Annotations with the predicted code, before multi-code annotations
+        # are counted once
+        keys = ['clinical_case', 'offset']
+        units = {'TP': df_sel.loc[df_sel['is_valid'], keys + ['code_pred']],
+                 'Pred_Pos': pred[keys + ['code_pred']],
+                 'GS_Pos': gs[keys + ['code_gs']]}
+        units = {name: df.set_axis(keys + ['code'], axis=1) for name, df in units.items()}
+    
+    # Some annotations have several valid codes. Any of them is considered as valid
     if subtask=='norm':
-        df_sel = several_codes_one_annot(df_sel)
+        df_sel = multi_codes.apply_table(df_sel, multi_codes.build_table(gs, multi_code_keys))
         
     # True Positives:
-    TP_per_cc = (df_sel[df_sel["is_valid"] == True]
-                 .groupby("clinical_case")["is_valid"].count())
-    TP = df_sel[df_sel["is_valid"] == True].shape[0]
-    
-    # Add entries for clinical cases that are not in predictions but are present
-    # in the GS
-    cc_not_predicted = (pred.drop_duplicates(subset=["clinical_case"])
-                        .merge(gs.drop_duplicates(subset=["clinical_case"]), 
-                              on='clinical_case',
-                              how='right', indicator=True)
-                        .query('_merge == "right_only"')
-                        .drop('_merge', 1))['clinical_case'].to_list()
-    for cc in cc_not_predicted:
-        TP_per_cc[cc] = 0
-    
-    # Remove entries for clinical cases that are not in GS but are present
-    # in the predictions
-    cc_not_GS = (gs.drop_duplicates(subset=["clinical_case"])
-                .merge(pred.drop_duplicates(subset=["clinical_case"]), 
-                      on='clinical_case',
-                      how='right', indicator=True)
-                .query('_merge == "right_only"')
-                .drop('_merge', 1))['clinical_case'].to_list()
-    Pred_Pos_per_cc = Pred_Pos_per_cc.drop(cc_not_GS)
+    TP_per_cc = ann_parsing.size_by(df_sel.loc[df_sel["is_valid"] == True],
+                                    "clinical_case")
+    
+    counts = pd.concat([TP_per_cc, Pred_Pos_per_cc, GS_Pos_per_cc], axis=1,
+                       keys=['TP', 'Pred_Pos', 'GS_Pos'])
+    counts = counts.fillna(0).astype(int).sort_index()
+    counts.index.name = 'clinical_case'
+    
+    if breakdown:
+        import code_breakdown
+        with profiling.stage('count_labels'):
+            return counts, code_breakdown.count_labels(units, keys)
+    return counts
+
+
+def shared_columns(subtask):
+    '''
+    (GS column, predictions column) pairs that are joined or compared when
+    counting matches.
+    '''
+    columns = [('clinical_case', 'clinical_case'), ('offset', 'offset')]
+    if subtask == 'norm':
+        columns.append(('code_gs', 'code_pred'))
+    return columns
+
+
+def metrics_from_counts(counts):
+    '''
+    Compute precision, recall and F1-score per clinical case and 
+    micro-averaged from the output of count_matches.
+    
+    Clinical cases present in the predictions but not in the GS only count
+    for the micro-average precision. Clinical cases present in both without
+    True Positives get NaN precision, recall and F1-score.
+    
+    Returns
+    -------
+    Same as calculate_metrics.
+    '''
+    in_gs = counts['GS_Pos'] > 0
+    in_pred = counts['Pred_Pos'] > 0
+    
+    # Clinical cases that are not in predictions but are present in the GS
+    # have zero True Positives
+    TP_per_cc = counts.loc[(counts['TP'] > 0) | (in_gs & ~in_pred), 'TP']
+    # Clinical cases that are not in GS but are present in the predictions
+    # are removed
+    Pred_Pos_per_cc = counts.loc[in_gs & in_pred, 'Pred_Pos']
+    GS_Pos_per_cc = counts.loc[in_gs, 'GS_Pos']
+    TP_per_cc.name = Pred_Pos_per_cc.name = GS_Pos_per_cc.name = None
+    
+    TP = int(counts['TP'].sum())
+    Pred_Pos = int(counts['Pred_Pos'].sum())
+    GS_Pos = int(counts['GS_Pos'].sum())
 
     # Calculate Final Metrics:
     P_per_cc =  TP_per_cc / Pred_Pos_per_cc
@@ -230,28 +599,3 @@ def calculate_metrics(gs, pred, subtask=['ner','norm']):
                                             
     return P_per_cc, P, R_per_cc, R, F1_per_cc, F1
 
-
-def several_codes_one_annot(df_sel):
-    
-    # If any of the two valid codes is predicted, give both as good
-    if any(df_sel.loc[(df_sel['clinical_case']=='cc_onco838.ann') & 
-                  (df_sel['offset'] == '2509 2534')]['is_valid']):
-        df_sel.loc[(df_sel['clinical_case']=='cc_onco838.ann') &
-                   (df_sel['offset'] == '2509 2534'),'is_valid'] = True
-            
-    if any(df_sel.loc[(df_sel['clinical_case']=='cc_onco1057.ann') & 
-                      (df_sel['offset'] == '2791 2831')]['is_valid']):
-        df_sel.loc[(df_sel['clinical_case']=='cc_onco1057.ann') &
-                   (df_sel['offset'] == '2791 2831'),'is_valid'] = True
-        
-    # Remove one of the entries where there are two valid codes
-    df_sel.drop(df_sel.loc[(df_sel['clinical_case']=='cc_onco838.ann') &
-                    (df_sel['offset'] == '2509 2534') & 
-                    (df_sel['code_gs']=='8441/0')].index, inplace=True)
-    
-    df_sel.drop(df_sel.loc[(df_sel['clinical_case']=='cc_onco1057.ann') &
-            (df_sel['offset'] == '2791 2831') & 
-            (df_sel['code_gs']=='8803/3')].index, inplace=True)
-        
-        
-    return df_sel
\ No newline at end of file
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Precision, recall and F1-score by code and by code family (--breakdown),
+for error analysis of subtask NORM and of comp_f1_diag_proc.py.
+
+The units are the positives of the evaluation with their codes:
+(clinical case, offsets, code) in NORM and (clinical case, code) in
+comp_f1_diag_proc.py. For every label, TP, Pred_Pos and GS_Pos count the
+units of the True Positives, of the predictions and of the GS with that
+label. Labels are grouped in levels:
+    code        ICD-O code (e.g. 8041/3)
+    morphology  morphology prefix, before the first '/' (8041)
+    behaviour   behaviour suffix, '/' and the first digit after it (/3,
+                /6); grades and other qualifiers (8041/31, 8041/3/h) are
+                left out
+A GS annotation with several codes counts for each of them (a prediction
+is a True Positive of the code it has), and once in a family. In lenient
+matching, every span is matched once, under one of its codes (see
+interval_matching.py).
+
+Counts of every level come from one grouped aggregation: the units of the
+True Positives, predictions and GS are concatenated once, and every level
+maps their (few) distinct codes to labels and counts the unique (unit,
+label) pairs with one np.bincount. P, R and F1 are not defined (NaN) for
+labels without predictions or without GS units. Macro-averages are the
+means over the labels where they are defined (F1 is 0 for labels without
+True Positives).
+"""
+
+import io
+import json
+
+import numpy as np
+import pandas as pd
+
+import results_output
+
+LEVELS = ['code', 'morphology', 'behaviour']
+COUNTS = ['TP', 'Pred_Pos', 'GS_Pos']
+METRICS = ['P', 'R', 'F1']
+MACRO_AVERAGE_ROW = 'macro-average'
+
+
+def code_label(code, level):
+    '''
+    Label of a code in one level (see module docstring).
+    '''
+    if level == 'code':
+        return code
+    morphology, slash, rest = code.partition('/')
+    if level == 'morphology':
+        return morphology
+    return slash + rest[:1]
+
+
+def count_labels(units, keys, levels=LEVELS):
+    '''
+    Count the units of every label.
+
+    Parameters
+    ----------
+    units : dict
+        'TP', 'Pred_Pos' and 'GS_Pos' -> pandas DataFrame with the key
+        columns of the units and their 'code'. Repeated rows are counted
+        once.
+    keys : list
+        Columns that identify a unit, without its code (e.g. clinical case
+        and offset).
+    levels : list
+        Levels of LEVELS to count.
+
+    Returns
+    -------
+    counts : dict
+        Level -> pandas DataFrame with one row per label (index, sorted)
+        and integer columns 'TP', 'Pred_Pos' and 'GS_Pos'.
+
+    '''
+    df = pd.concat([units[name][keys + ['code']] for name in COUNTS],
+                   ignore_index=True)
+    if df.shape[0] == 0:
+        return {level: pd.DataFrame(np.zeros((0, len(COUNTS)), dtype=int),
+                                    index=pd.Index([], name='label', dtype=object),
+                                    columns=COUNTS)
+                for level in levels}
+    column = np.repeat(np.arange(len(COUNTS)), [units[name].shape[0] for name in COUNTS])
+    unit = df.groupby(keys, sort=False, observed=True).ngroup().to_numpy()
+    code_ids, codes = pd.factorize(df['code'])
+    codes = [str(code) for code in codes]
+
+    counts = {}
+    for level in levels:
+        label_ids, labels = pd.factorize(pd.Series([code_label(code, level)
+                                                    for code in codes], dtype=object))
+        label = label_ids[code_ids]
+        # Unique (unit, count, label) triples, counted by (label, count)
+        pairs = pd.unique((unit.astype(np.int64) * len(COUNTS) + column) * len(labels) + label)
+        label, column_of_pair = pairs % len(labels), (pairs // len(labels)) % len(COUNTS)
+        table = np.bincount(label * len(COUNTS) + column_of_pair,
+                            minlength=len(labels) * len(COUNTS)).reshape(-1, len(COUNTS))
+        counts[level] = pd.DataFrame(table, index=pd.Index(labels, name='label'),
+                                     columns=COUNTS).sort_index()
+
+    return counts
+
+
+def add_counts(counts_list):
+    '''
+    Add the outputs of count_labels for disjoint sets of clinical cases.
+    '''
+    return {level: pd.concat([counts[level] for counts in counts_list])
+            .groupby(level=0).sum().sort_index()
+            for level in counts_list[0]}
+
+
+def metrics_from_counts(counts):
+    '''
+    Precision, recall and F1-score of every label, and their
+    macro-averages, from one level of count_labels.
+
+    Returns
+    -------
+    table : pandas DataFrame
+        Columns of counts and 'P', 'R', 'F1'.
+    macro : dict
+        'P', 'R', 'F1' -> macro-average (NaN if there are no labels where
+        it is defined).
+
+    '''
+    TP = counts['TP'].to_numpy(dtype=float)
+    Pred_Pos = counts['Pred_Pos'].to_numpy(dtype=float)
+    GS_Pos = counts['GS_Pos'].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        table = counts.assign(P=np.where(Pred_Pos > 0, TP / Pred_Pos, np.nan),
+                              R=np.where(GS_Pos > 0, TP / GS_Pos, np.nan),
+                              F1=2 * TP / (Pred_Pos + GS_Pos))
+    macro = {name: table[name].mean() for name in METRICS}
+
+    return table, macro
+
+
+def compute_breakdown(counts):
+    '''
+    metrics_from_counts of every level of count_labels.
+
+    Returns
+    -------
+    breakdown : dict
+        Level -> (table, macro).
+
+    '''
+    return {level: metrics_from_counts(level_counts)
+            for level, level_counts in counts.items()}
+
+
+def format_breakdown(pred_path, breakdowns, fmt='text'):
+    '''
+    Format the breakdown of one run.
+
+    Parameters
+    ----------
+    pred_path : str
+        Path to the predictions.
+    breakdowns : dict
+        Matching mode (or '' if there is only one) -> output of
+        compute_breakdown.
+    fmt : str
+        'text' (one table per level and the macro-averages), 'json'
+        ({"pred_path": ..., [mode: {...},] level: {"macro-average": {...},
+        "per_label": {label: {...}}}}) or 'csv'/'tsv' (one row per level
+        and label and a macro-average row per level; with several
+        matching modes, a first 'match' column).
+
+    Returns
+    -------
+    content : str
+
+    '''
+    if fmt == 'text':
+        return ''.join(('\n{} matching\n'.format(mode.capitalize()) if mode else '') +
+                       format_text(breakdown)
+                       for mode, breakdown in breakdowns.items())
+
+    if fmt == 'json':
+        content = {'pred_path': pred_path}
+        for mode, breakdown in breakdowns.items():
+            levels = {}
+            for level, (table, macro) in breakdown.items():
+                levels[level] = {MACRO_AVERAGE_ROW: {name: results_output.to_json_number(val)
+                                                     for name, val in macro.items()},
+                                 'per_label': {str(label): {
+                                     name: (int(val) if name in COUNTS else
+                                            results_output.to_json_number(val))
+                                     for name, val in row.items()}
+                                     for label, row in zip(table.index,
+                                                           table.to_dict('records'))}}
+            if mode:
+                content[mode] = levels
+            else:
+                content.update(levels)
+        return json.dumps(content, indent=1) + '\n'
+
+    if fmt not in ['csv', 'tsv']:
+        raise ValueError('Unknown output format {}'.format(fmt))
+    tables = []
+    for mode, breakdown in breakdowns.items():
+        for level, (table, macro) in breakdown.items():
+            macro_row = pd.DataFrame([macro], index=[MACRO_AVERAGE_ROW])
+            table = pd.concat([table.astype(object), macro_row]).reset_index()
+            table.columns = ['label'] + list(table.columns[1:])
+            table.insert(0, 'level', level)
+            if mode:
+                table.insert(0, 'match', mode)
+            tables.append(table)
+    buffer = io.StringIO()
+    pd.concat(tables).to_csv(buffer, sep=',' if fmt == 'csv' else '\t',
+                             index=False, na_rep='')
+    return buffer.getvalue()
+
+
+def format_text(breakdown):
+    '''
+    Build the text output of one matching mode: one table per level and
+    its macro-averages.
+    '''
+    separator = '-----------------------------------------------------'
+    lines = []
+    for level, (table, macro) in breakdown.items():
+        lines.extend(['\n' + separator,
+                      '\t'.join([level.capitalize()] + COUNTS + METRICS), separator])
+        for label, row in zip(table.index, table.itertuples(index=False)):
+            lines.append('\t'.join([str(label)] +
+                                   [str(int(val)) for val in row[:len(COUNTS)]] +
+                                   [str(round(val, 3)) for val in row[len(COUNTS):]]))
+        lines.extend([separator, ''])
+        lines.extend('Macro-average {} by {} = {}'.format(name, level, round(val, 3))
+                     for name, val in macro.items())
+
+    return '\n'.join(lines) + '\n'
@@ -8,6 +8,10 @@ Created on Tue May 12 09:45:01 2020
 import pandas as pd
 import argparse
 import warnings
+import valid_codes as vc
+import prediction_stream
+import profiling
+import results_output
 
 ###### 0. Load valid codes lists: ######
 
@@ -29,7 +33,7 @@ def read_run(pred_path, valid_codes, test_files):
     # Remove predictions for queries not in Gold Standard
     run_data = run_data.loc[run_data['clinical_case'].isin(test_files),:]
     
-    run_data = run_data[run_data['code'].isin(valid_codes)]
+    run_data = run_data[vc.isin(run_data['code'], valid_codes)]
     if (run_data.shape[0] == 0):
         warnings.warn('None of the predicted codes are considered valid codes')
     return run_data
@@ -37,20 +41,54 @@ def read_run(pred_path, valid_codes, test_files):
 
 
 def calculate_metrics(df_gs, df_pred):
-    Pred_Pos_per_cc = df_pred.drop_duplicates(subset=['clinical_case', 
-                                                  "code"]).groupby("clinical_case")["code"].count()
-    Pred_Pos = df_pred.drop_duplicates(subset=['clinical_case', "code"]).shape[0]
+    
+    return metrics_from_counts(*count_codes(df_gs, df_pred))
+
+
+def count_codes(df_gs, df_pred, breakdown=False):
+    '''
+    Count Gold Standard Positives, True Positives and Predicted Positives
+    per clinical case (pandas Series indexed by clinical case; clinical 
+    cases without True Positives may be missing). With breakdown=True, 
+    the counts by code and code family of the same (clinical case, code) 
+    pairs are also returned (code_breakdown.count_labels).
+    '''
+    pred_unique = df_pred[['clinical_case', 'code']].drop_duplicates()
+    gs_unique = df_gs[['clinical_case', 'code']].drop_duplicates()
     
     # Gold Standard Positives:
-    GS_Pos_per_cc = df_gs.drop_duplicates(subset=['clinical_case', 
-                                               "code"]).groupby("clinical_case")["code"].count()
-    GS_Pos = df_gs.drop_duplicates(subset=['clinical_case', "code"]).shape[0]
-    cc = set(df_gs.clinical_case.tolist())
-    TP_per_cc = pd.Series(dtype=float)
-    for c in cc:
-        pred = set(df_pred.loc[df_pred['clinical_case']==c,'code'].values)
-        gs = set(df_gs.loc[df_gs['clinical_case']==c,'code'].values)
-        TP_per_cc[c] = len(pred.intersection(gs))
+    GS_Pos_per_cc = gs_unique.groupby("clinical_case")["code"].count()
+    
+    # Predicted Positives:
+    Pred_Pos_per_cc = pred_unique.groupby("clinical_case")["code"].count()
+    
+    # True Positives: (clinical case, code) pairs both in GS and predictions.
+    tp_unique = pd.merge(pred_unique, gs_unique, how='inner',
+                         on=['clinical_case', 'code'])
+    TP_per_cc = tp_unique.groupby('clinical_case').size()
+    
+    if breakdown:
+        import code_breakdown
+        label_counts = code_breakdown.count_labels(
+            {'TP': tp_unique, 'Pred_Pos': pred_unique, 'GS_Pos': gs_unique},
+            ['clinical_case'])
+        return (GS_Pos_per_cc, TP_per_cc, Pred_Pos_per_cc), label_counts
+    return GS_Pos_per_cc, TP_per_cc, Pred_Pos_per_cc
+
+
+def metrics_from_counts(GS_Pos_per_cc, TP_per_cc, Pred_Pos_per_cc):
+    '''
+    Compute precision, recall and F1-score per clinical case and 
+    micro-averaged from the Gold Standard Positives, True Positives and 
+    Predicted Positives per clinical case (clinical cases without True 
+    Positives may be missing).
+    '''
+    GS_Pos = int(GS_Pos_per_cc.sum())
+    Pred_Pos = int(Pred_Pos_per_cc.sum())
+    
+    # Clinical cases in GS without True Positives get zero
+    TP_per_cc = (TP_per_cc.reindex(GS_Pos_per_cc.index, fill_value=0)
+                 .astype(float).sort_index())
         
     TP = sum(TP_per_cc.values)
         
@@ -69,6 +107,114 @@ def calculate_metrics(df_gs, df_pred):
     
     return P_per_cc, P, R_per_cc, R, F1_per_cc, F1
 
+
+def calculate_metrics_stream(df_gs, pred_path, valid_codes, test_files,
+                             chunk_rows=prediction_stream.CHUNK_ROWS):
+    
+    return metrics_from_counts(*count_codes_stream(df_gs, pred_path, valid_codes,
+                                                   test_files, chunk_rows=chunk_rows))
+
+
+def count_codes_stream(df_gs, pred_path, valid_codes, test_files,
+                       chunk_rows=prediction_stream.CHUNK_ROWS, breakdown=False):
+    '''
+    Same as read_run followed by count_codes, reading the predictions in
+    chunks of complete clinical cases (see prediction_stream.py), so that 
+    the whole file is never in memory. Only the True Positives and 
+    Predicted Positives of every clinical case (and, with breakdown=True,
+    of every code and code family) are kept. The rows of every clinical 
+    case must be contiguous.
+    '''
+    gs_unique = df_gs[['clinical_case', 'code']].drop_duplicates()
+    GS_Pos_per_cc = gs_unique.groupby("clinical_case")["code"].count()
+    test_files = set(test_files)
+    TP_chunks, Pred_Pos_chunks = [], []
+    if breakdown:
+        import code_breakdown
+        no_units = gs_unique.iloc[:0]
+        label_chunks = [code_breakdown.count_labels(
+            {'TP': no_units, 'Pred_Pos': no_units, 'GS_Pos': gs_unique},
+            ['clinical_case'])]
+    for run_data in prediction_stream.iter_case_chunks(pred_path, chunk_rows=chunk_rows):
+        run_data['code'] = run_data['code'].str.lower()
+        run_data = run_data.drop_duplicates()
+        run_data = run_data.loc[(run_data['code']!='8000/6') &
+                                run_data['clinical_case'].isin(test_files) &
+                                vc.isin(run_data['code'], valid_codes),:]
+        Pred_Pos_chunks.append(run_data.groupby("clinical_case")["code"].count())
+        tp_unique = pd.merge(run_data, gs_unique, how='inner',
+                             on=['clinical_case', 'code'])
+        TP_chunks.append(tp_unique.groupby('clinical_case').size())
+        if breakdown:
+            # Chunks have disjoint clinical cases: their counts are added
+            label_chunks.append(code_breakdown.count_labels(
+                {'TP': tp_unique, 'Pred_Pos': run_data, 'GS_Pos': no_units},
+                ['clinical_case']))
+    if sum(x.sum() for x in Pred_Pos_chunks) == 0:
+        warnings.warn('None of the predicted codes are considered valid codes')
+    
+    Pred_Pos_per_cc = pd.concat(Pred_Pos_chunks).sort_index()
+    TP_per_cc = pd.concat(TP_chunks)
+    
+    if breakdown:
+        return ((GS_Pos_per_cc, TP_per_cc, Pred_Pos_per_cc),
+                code_breakdown.add_counts(label_chunks))
+    return GS_Pos_per_cc, TP_per_cc, Pred_Pos_per_cc
+
+
+def counts_table(GS_Pos_per_cc, TP_per_cc, Pred_Pos_per_cc):
+    '''
+    Join the output of count_codes in one table of sufficient statistics
+    (see shard_stats.py): one row per clinical case, integer columns 'TP',
+    'Pred_Pos' and 'GS_Pos'.
+    '''
+    counts = pd.concat([TP_per_cc, Pred_Pos_per_cc, GS_Pos_per_cc], axis=1,
+                       keys=['TP', 'Pred_Pos', 'GS_Pos'])
+    counts = counts.fillna(0).astype(int).sort_index()
+    counts.index.name = 'clinical_case'
+    
+    return counts
+
+def format_text(pred_path, P_per_cc, P, R_per_cc, R, F1_per_cc, F1,
+                summary_only=False):
+    '''
+    Build the text output: per clinical case tables (unless summary_only),
+    micro-averages and the pred_path|P|R|F1 line.
+    '''
+    separator = '-----------------------------------------------------'
+    lines = []
+    if summary_only == False:
+        if any(P_per_cc.isna()):
+            warnings.warn('Some documents do not have predicted codes, ' + 
+                          'document-wise Precision not computed for them.')
+        if any(R_per_cc.isna()):
+            warnings.warn('Some documents do not have Gold Standard codes, ' + 
+                          'document-wise Recall not computed for them.')
+        if any(P_per_cc.isna()):
+            warnings.warn('Some documents do not have predicted codes, ' + 
+                          'document-wise F-score not computed for them.')
+        if any(R_per_cc.isna()):
+            warnings.warn('Some documents do not have Gold Standard codes, ' + 
+                          'document-wise F-score not computed for them.')
+        for title, values, micro in [('Precision', P_per_cc, 'precision = {}'.format(round(P, 3))),
+                                     ('Recall', R_per_cc, 'recall = {}'.format(round(R, 3))),
+                                     ('F-score', F1_per_cc, 'F-score = {}'.format(round(F1, 3)))]:
+            lines.extend(['\n' + separator, 'Clinical case name\t\t\t' + title,
+                          separator])
+            for index, val in values.items():
+                lines.append(str(index) + '\t\t' + str(round(val, 3)))
+                lines.append(separator)
+            lines.append('\nMicro-average {}\n'.format(micro))
+    
+    lines.extend(['\n__________________________________________________________',
+                  '\nMICRO-AVERAGE STATISTICS:',
+                  '\nMicro-average precision = {}'.format(round(P, 3)),
+                  '\nMicro-average recall = {}'.format(round(R, 3)),
+                  '\nMicro-average F-score = {}\n'.format(round(F1, 3)),
+                  '{}|{}|{}|{}'.format(pred_path, round(P, 3), round(R, 3), round(F1, 3))])
+    
+    return '\n'.join(lines) + '\n'
+
 def parse_arguments():
     '''
     DESCRIPTION: Parse command line arguments
@@ -83,75 +229,107 @@ def parse_arguments():
                         dest = "codes_path", help = "path to valid codes TSV")
     parser.add_argument("-f", "--test_files_path", required = True, 
                     dest = "test_files_path", help = "path to list of valid test files")
+    parser.add_argument('--format', required = False, default = 'text',
+                        choices = results_output.FORMATS, dest = 'fmt',
+                        help = 'output format (default: text tables)')
+    parser.add_argument('-o', '--output', required = False, default = None,
+                        dest = 'output_path', help = 'write results to this file')
+    parser.add_argument('--summary-only', required = False, default = False,
+                        action = 'store_true', dest = 'summary_only',
+                        help = 'only output the micro-averages')
+    parser.add_argument('--stream', required = False, default = False,
+                        action = 'store_true', dest = 'stream',
+                        help = 'read the predictions in chunks of complete clinical ' +
+                        'cases (rows of each clinical case must be contiguous)')
+    parser.add_argument('--profile', required = False, default = None,
+                        nargs = '?', const = '-', dest = 'profile_path',
+                        help = 'write a JSON report with stage timings, counters ' +
+                        'and peak memory to this file (default: stderr)')
+    parser.add_argument('--stats', required = False, default = None,
+                        dest = 'stats_path',
+                        help = 'write the counts per clinical case to this file ' +
+                        '(see shard_stats.py) instead of the results')
+    parser.add_argument('--breakdown', required = False, default = None,
+                        dest = 'breakdown_path',
+                        help = 'also write P, R and F1 by code, morphology and ' +
+                        'behaviour, with macro-averages, to this file (in the ' +
+                        '--format format)')
     
     args = parser.parse_args()
+    if (args.breakdown_path is not None) & (args.stats_path is not None):
+        parser.error('--breakdown is not supported with --stats')
     gs_path = args.gs_path
     pred_path = args.pred_path
     codes_path = args.codes_path
     test_files_path = args.test_files_path
+    profile_path = args.profile_path
    
-    return gs_path, pred_path, codes_path, test_files_path
+    return (gs_path, pred_path, codes_path, test_files_path, profile_path,
+            args.fmt, args.output_path, args.summary_only, args.stream,
+            args.stats_path, args.breakdown_path)
 
 
 if __name__ == '__main__':
     
-    gs_path, pred_path, codes_path, test_files_path = parse_arguments()
+    (gs_path, pred_path, codes_path, test_files_path, profile_path,
+     fmt, output_path, summary_only, stream, stats_path,
+     breakdown_path) = parse_arguments()
+    if profile_path is not None:
+        profiling.enable()
     
     ###### 0. Load valid codes lists: ######
-    valid_codes = set(pd.read_csv(codes_path, sep='\t', header=None, 
-                                  usecols=[0])[0].tolist())
-    valid_codes = set([x.lower() for x in valid_codes])
+    with profiling.stage('load_valid_codes'):
+        valid_codes = vc.load_valid_codes(codes_path)
     
     test_files = list(map(lambda x: x.strip(), open(test_files_path).readlines()))
     
     ###### 1. Load GS and Predictions ######
-    df_gs = read_gs(gs_path)
-    df_run = read_run(pred_path, valid_codes, test_files)
-    
-    ###### 2. Calculate score ######
-    P_per_cc, P, R_per_cc, R, F1_per_cc, F1 = calculate_metrics(df_gs, df_run)
-    
-    ###### 3. Show results ######  
-    print('\n-----------------------------------------------------')
-    print('Clinical case name\t\t\tPrecision')
-    print('-----------------------------------------------------')
-    for index, val in P_per_cc.items():
-        print(str(index) + '\t\t' + str(round(val, 3)))
-        print('-----------------------------------------------------')
-    if any(P_per_cc.isna()):
-        warnings.warn('Some documents do not have predicted codes, ' + 
-                      'document-wise Precision not computed for them.')
+    with profiling.stage('read_gs'):
+        df_gs = read_gs(gs_path)
+    profiling.count('gs_rows', df_gs.shape[0])
+    
+    if stream == True:
+        ###### 1-2. Read predictions and count codes chunk by chunk ######
+        with profiling.stage('count_codes_stream'):
+            counts = count_codes_stream(df_gs, pred_path, valid_codes, test_files,
+                                        breakdown=breakdown_path is not None)
+    else:
+        with profiling.stage('read_run'):
+            df_run = read_run(pred_path, valid_codes, test_files)
+        profiling.count('pred_rows', df_run.shape[0])
         
-    print('\nMicro-average precision = {}\n'.format(round(P, 3)))
-    
-    print('\n-----------------------------------------------------')
-    print('Clinical case name\t\t\tRecall')
-    print('-----------------------------------------------------')
-    for index, val in R_per_cc.items():
-        print(str(index) + '\t\t' + str(round(val, 3)))
-        print('-----------------------------------------------------')
-    if any(R_per_cc.isna()):
-        warnings.warn('Some documents do not have Gold Standard codes, ' + 
-                      'document-wise Recall not computed for them.')
-    print('\nMicro-average recall = {}\n'.format(round(R, 3)))
-    
-    print('\n-----------------------------------------------------')
-    print('Clinical case name\t\t\tF-score')
-    print('-----------------------------------------------------')
-    for index, val in F1_per_cc.items():
-        print(str(index) + '\t\t' + str(round(val, 3)))
-        print('-----------------------------------------------------')
-    if any(P_per_cc.isna()):
-        warnings.warn('Some documents do not have predicted codes, ' + 
-                      'document-wise F-score not computed for them.')
-    if any(R_per_cc.isna()):
-        warnings.warn('Some documents do not have Gold Standard codes, ' + 
-                      'document-wise F-score not computed for them.')
-    print('\nMicro-average F-score = {}\n'.format(round(F1, 3)))
-    
-    print('\n__________________________________________________________')
-    print('\nMICRO-AVERAGE STATISTICS:')
-    print('\nMicro-average precision = {}'.format(round(P, 3)))
-    print('\nMicro-average recall = {}'.format(round(R, 3)))
-    print('\nMicro-average F-score = {}\n'.format(round(F1, 3)))
-    print('{}|{}|{}|{}'.format(pred_path, round(P, 3), round(R, 3), round(F1, 3)))
\ No newline at end of file
+        with profiling.stage('count_codes'):
+            counts = count_codes(df_gs, df_run, breakdown=breakdown_path is not None)
+    if breakdown_path is not None:
+        counts, label_counts = counts
+    
+    if stats_path is not None:
+        ###### 2. Write the counts per clinical case ######
+        import shard_stats
+        with profiling.stage('write_stats'):
+            shard_stats.write_stats(stats_path, 'comp_f1', counts_table(*counts))
+    else:
+        ###### 2. Calculate score ######
+        with profiling.stage('metrics_from_counts'):
+            P_per_cc, P, R_per_cc, R, F1_per_cc, F1 = metrics_from_counts(*counts)
+        
+        ###### 3. Show results ######  
+        if fmt == 'text':
+            content = format_text(pred_path, P_per_cc, P, R_per_cc, R, F1_per_cc, F1,
+                                  summary_only=summary_only)
+        else:
+            per_cc = None if summary_only else {'P': P_per_cc, 'R': R_per_cc,
+                                                'F1': F1_per_cc}
+            content = results_output.format_results(pred_path, {'P': P, 'R': R, 'F1': F1},
+                                                    per_cc, fmt=fmt)
+        with profiling.stage('write_results'):
+            results_output.write_output(content, output_path)
+        
+        if breakdown_path is not None:
+            import code_breakdown
+            with profiling.stage('write_breakdown'):
+                breakdowns = {'': code_breakdown.compute_breakdown(label_counts)}
+                results_output.write_output(code_breakdown.format_breakdown(
+                    pred_path, breakdowns, fmt=fmt), breakdown_path)
+    
+    profiling.write_report(profile_path)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compiled Gold Standard store for CANTEMIST-NER and CANTEMIST-NORM.
+
+The GS .ann directory (or zip/tar archive) is parsed once and stored in a NumPy .npz file, with
+the columns returned by ann_parsing.main for both subtasks. The store
+records a content hash of the source .ann files, so a stale store is
+detected and the GS is parsed again.
+
+Usage: python gs_store.py -g ../gs-data/ -o ../gs-data.npz
+"""
+
+import argparse
+import hashlib
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import ann_parsing
+import archives
+
+STORE_VERSION = 1
+SUBTASKS = ['ner', 'norm']
+
+def warning_on_one_line(message, category, filename, lineno, file=None, line=None):
+    return '%s:%s: %s: %s\n' % (filename, lineno, category.__name__, message)
+warnings.formatwarning = warning_on_one_line
+
+
+def compile_gs(gs_path, store_path, relevant_labels=['MORFOLOGIA_NEOPLASIA'],
+               jobs=1):
+    '''
+    Parse the GS .ann files and store them in a .npz file.
+
+    Parameters
+    ----------
+    gs_path : str
+        Path to directory with GS .ANN files (Brat format).
+    store_path : str
+        Path to the .npz file.
+    relevant_labels : list
+        ANN labels that are parsed.
+    jobs : int
+        Number of worker processes used to parse the .ANN files.
+
+    Returns
+    -------
+    None.
+
+    '''
+    arrays = {'version': np.array(STORE_VERSION),
+              'source': np.array(os.path.abspath(gs_path)),
+              'fingerprint': np.array(stat_fingerprint(gs_path)),
+              'content_hash': np.array(content_hash(gs_path)),
+              'ann_list': np.array(list_gs_files(gs_path), dtype=str)}
+
+    for subtask in SUBTASKS:
+        df = ann_parsing.main(gs_path, relevant_labels,
+                              with_notes=(subtask=='norm'), jobs=jobs)
+        arrays[subtask + '_columns'] = np.array(df.columns, dtype=str)
+        for i, column in enumerate(df.columns):
+            if pd.api.types.is_integer_dtype(df[column]):
+                values = df[column].to_numpy()
+            else:
+                values = df[column].to_numpy(dtype=str)
+            arrays['{}_{}'.format(subtask, i)] = values
+
+    with open(store_path, 'wb') as f:
+        np.savez(f, **arrays)
+
+
+def load_gs(store_path, subtask, check=True, clinical_cases=None):
+    '''
+    Load the GS of one subtask from a .npz store. Only the arrays of that
+    subtask are read.
+
+    Parameters
+    ----------
+    store_path : str
+        Path to the .npz file created with compile_gs.
+    subtask : str
+        Subtask name ('ner' or 'norm').
+    check : bool
+        whether to check that the source .ann files have not changed since
+        the store was compiled.
+    clinical_cases : list
+        if given, only the annotations of these .ann files are loaded.
+
+    Returns
+    -------
+    df : pandas DataFrame or None
+        Same as ann_parsing.main output. None if the store is stale.
+    ann_list_gs : list
+        .ann files in the GS directory.
+
+    '''
+    if subtask not in SUBTASKS:
+        raise Exception('Error! Subtask name not properly set up')
+
+    with np.load(store_path, allow_pickle=False) as store:
+        if int(store['version']) != STORE_VERSION:
+            raise Exception('The GS store {} was created with another '.format(store_path) +
+                            'version. Compile it again.')
+        if check and (is_fresh(store) == False):
+            warnings.warn('The GS store {} is stale: '.format(store_path) +
+                          'the source .ann files have changed. Compile it again.')
+            return None, []
+
+        columns = store[subtask + '_columns'].tolist()
+        arrays = [store['{}_{}'.format(subtask, i)] for i in range(len(columns))]
+        if (clinical_cases is not None) & (len(columns) > 0):
+            rows = np.isin(arrays[0], list(clinical_cases))
+            arrays = [values[rows] for values in arrays]
+        df = ann_parsing.compact(pd.DataFrame(dict(zip(columns, arrays)),
+                                              columns=columns))
+        ann_list_gs = store['ann_list'].tolist()
+
+    return df, ann_list_gs
+
+
+def load_ann_list(store_path, check=True):
+    '''
+    Load only the list of GS .ann files of a store, without the annotations.
+    None if check is True and the store is stale.
+    '''
+    with np.load(store_path, allow_pickle=False) as store:
+        if int(store['version']) != STORE_VERSION:
+            raise Exception('The GS store {} was created with another '.format(store_path) +
+                            'version. Compile it again.')
+        if check and (is_fresh(store) == False):
+            return None
+        return store['ann_list'].tolist()
+
+
+def source_path(store_path):
+    '''
+    Return the GS directory a store was compiled from.
+    '''
+    with np.load(store_path, allow_pickle=False) as store:
+        return str(store['source'])
+
+
+def stored_content_hash(store_path):
+    '''
+    Return the content hash of the .ann files a store was compiled from.
+    '''
+    with np.load(store_path, allow_pickle=False) as store:
+        return str(store['content_hash'])
+
+
+def is_store(path):
+    return os.path.isfile(path) & path.endswith('.npz')
+
+
+def is_fresh(store):
+    '''
+    Check whether the source .ann files of an opened store have changed.
+    File sizes and modification times are compared first, and contents
+    are only hashed if they differ. If the source directory is not
+    available, the store is considered fresh.
+    '''
+    source = str(store['source'])
+    if os.path.exists(source) == False:
+        return True
+    if stat_fingerprint(source) == str(store['fingerprint']):
+        return True
+    return content_hash(source) == str(store['content_hash'])
+
+
+def list_gs_files(gs_path):
+    if archives.is_archive(gs_path):
+        return archives.list_root_ann_files(gs_path)
+    return list(filter(lambda x: x[-4:] == '.ann', os.listdir(gs_path)))
+
+
+def list_ann_paths(gs_path):
+    '''
+    Sorted paths (relative to gs_path) of the files parsed by
+    ann_parsing.parse_ann.
+    '''
+    paths = []
+    rel_roots = {}
+    for root, filename in ann_parsing.list_ann_files(gs_path):
+        if root not in rel_roots:
+            rel_roots[root] = os.path.relpath(root, gs_path)
+            if rel_roots[root] == os.curdir:
+                rel_roots[root] = ''
+        paths.append(os.path.join(rel_roots[root], filename))
+    return sorted(paths)
+
+
+def stat_fingerprint(gs_path):
+    if archives.is_archive(gs_path):
+        return archives.fingerprint(gs_path)
+    sha1 = hashlib.sha1()
+    for path in list_ann_paths(gs_path):
+        stat = os.stat(os.path.join(gs_path, path))
+        sha1.update('{}\t{}\t{}\n'.format(path, stat.st_size,
+                                          stat.st_mtime_ns).encode('utf-8'))
+    return sha1.hexdigest()
+
+
+def content_hash(gs_path):
+    if archives.is_archive(gs_path):
+        return archives.content_hash(gs_path)
+    sha1 = hashlib.sha1()
+    for path in list_ann_paths(gs_path):
+        sha1.update(path.encode('utf-8') + b'\0')
+        with open(os.path.join(gs_path, path), 'rb') as f:
+            sha1.update(f.read())
+        sha1.update(b'\0')
+    return sha1.hexdigest()
+
+
+def parse_arguments():
+    '''
+    DESCRIPTION: Parse command line arguments
+    '''
+
+    parser = argparse.ArgumentParser(description='compile Gold Standard store')
+    parser.add_argument("-g", "--gs_path", required = True, dest = "gs_path",
+                        help = "path to directory with GS .ann files")
+    parser.add_argument("-o", "--output", required = True, dest = "store_path",
+                        help = "path to output .npz file")
+    parser.add_argument('-j', '--jobs', required = False, default = 1,
+                        type = int, dest = 'jobs',
+                        help = 'number of processes used to parse .ann files')
+
+    args = parser.parse_args()
+
+    return args.gs_path, args.store_path, args.jobs
+
+
+if __name__ == '__main__':
+
+    gs_path, store_path, jobs = parse_arguments()
+    compile_gs(gs_path, store_path, jobs=jobs)
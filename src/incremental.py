@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Incremental re-evaluation for CANTEMIST-NER and CANTEMIST-NORM.
+
+A cache directory keeps:
+    - gs.npz: the GS compiled with gs_store (unless a GS store is given).
+    - state-<subtask>.npz: size, modification time and SHA-1 of every
+      predicted .ann file, and the TP, Pred_Pos and GS_Pos counts of every
+      clinical case (NumPy arrays, read with allow_pickle=False: a cache
+      directory never makes the evaluation run code).
+
+On a re-run, only the predicted files whose size and modification time
+changed are read; if their content also changed, they are parsed again and
+the counts of their clinical cases are recomputed. The micro-averages are
+then obtained from the stored per-case counts. If the GS changes, all the
+counts are recomputed.
+
+The parsed annotations of the predicted files are not cached: only the
+counts of every clinical case are needed to update the results, and
+changed files are parsed again whole.
+"""
+
+import hashlib
+import os
+import tempfile
+import warnings
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+import ann_parsing
+import archives
+import cantemist_ner_norm
+import gs_store
+import valid_codes as vc
+
+STATE_VERSION = 2
+COUNT_COLUMNS = ['TP', 'Pred_Pos', 'GS_Pos']
+
+def warning_on_one_line(message, category, filename, lineno, file=None, line=None):
+    return '%s:%s: %s: %s\n' % (filename, lineno, category.__name__, message)
+warnings.formatwarning = warning_on_one_line
+
+
+def evaluate(gs_path, pred_path, subtask, cache_dir, valid_codes=None):
+    '''
+    Compute precision, recall and F1-score, re-parsing only the predicted
+    .ann files that changed since the last run with the same cache_dir.
+
+    Parameters
+    ----------
+    gs_path : str
+        Path to directory with GS .ANN files (Brat format), or to a GS store
+        (.npz) compiled with gs_store.py.
+    pred_path : str
+        Path to directory with Predicted .ANN files (Brat format).
+    subtask : str
+        Subtask name
+    cache_dir : str
+        Directory where the cache is stored. It is created if needed.
+    valid_codes : numpy array
+        Valid codes. If given (subtask norm), a warning is shown when
+        re-parsed predicted codes are not valid.
+
+    Returns
+    -------
+    Same as cantemist_ner_norm.calculate_metrics.
+
+    '''
+    if subtask not in ['ner', 'norm']:
+        raise Exception('Error! Subtask name not properly set up')
+    if archives.is_archive(pred_path):
+        raise Exception('Incremental mode needs a directory of predicted .ann files')
+    os.makedirs(cache_dir, exist_ok=True)
+
+    ###### 1. GS store ######
+    if gs_store.is_store(gs_path):
+        store_path = gs_path
+    else:
+        store_path = os.path.join(cache_dir, 'gs.npz')
+        if (os.path.isfile(store_path) == False) or \
+           (gs_store.source_path(store_path) != os.path.abspath(gs_path)):
+            gs_store.compile_gs(gs_path, store_path)
+    ann_list_gs = gs_store.load_ann_list(store_path)
+    if (ann_list_gs is None) & (store_path == gs_path):
+        raise Exception('The GS store {} is stale. Compile it again.'.format(gs_path))
+    elif ann_list_gs is None:
+        gs_store.compile_gs(gs_path, store_path)
+        ann_list_gs = gs_store.load_ann_list(store_path, check=False)
+    gs_key = gs_store.stored_content_hash(store_path)
+
+    ###### 2. Find changed prediction files ######
+    state_path = os.path.join(cache_dir, 'state-{}.npz'.format(subtask))
+    state = load_state(state_path)
+    full_run = (state is None) or (state['gs_key'] != gs_key)
+    if full_run:
+        state = {'version': STATE_VERSION, 'gs_key': gs_key, 'files': {},
+                 'counts': None}
+
+    paths = ann_parsing.list_ann_files(pred_path)
+    files = {}
+    changed_cases = set()
+    rel_roots = {}
+    for root, filename in paths:
+        if root not in rel_roots:
+            rel_roots[root] = os.path.relpath(root, pred_path)
+            if rel_roots[root] == os.curdir:
+                rel_roots[root] = ''
+        path = os.path.join(root, filename)
+        rel_path = os.path.join(rel_roots[root], filename)
+        stat = os.stat(path)
+        entry = state['files'].get(rel_path)
+        if (entry is not None) and (entry[:2] == (stat.st_size, stat.st_mtime_ns)):
+            files[rel_path] = entry
+            continue
+        sha1 = file_sha1(path)
+        if (entry is None) or (entry[2] != sha1):
+            changed_cases.add(filename)
+        files[rel_path] = (stat.st_size, stat.st_mtime_ns, sha1, filename)
+    for rel_path in state['files'].keys() - files.keys():
+        changed_cases.add(state['files'][rel_path][3])
+
+    ###### 3. Recompute counts of changed clinical cases ######
+    if full_run:
+        counts = compute_counts(store_path, paths, subtask, ann_list_gs,
+                                None, valid_codes)
+    elif len(changed_cases) > 0:
+        new_counts = compute_counts(store_path, paths, subtask, ann_list_gs,
+                                    changed_cases, valid_codes)
+        counts = state['counts']
+        counts = pd.concat([counts.loc[~counts.index.isin(changed_cases)],
+                            new_counts]).sort_index()
+    else:
+        counts = state['counts']
+
+    state['files'] = files
+    state['counts'] = counts
+    save_state(state_path, state)
+
+    if counts['Pred_Pos'].sum() == 0:
+        raise Exception('There are not parsed predicted annotations')
+
+    return cantemist_ner_norm.metrics_from_counts(counts)
+
+
+def compute_counts(store_path, paths, subtask, ann_list_gs, clinical_cases,
+                   valid_codes):
+    '''
+    Parse the predicted .ann files (paths, as returned by 
+    ann_parsing.list_ann_files) of some clinical cases (all of them if
+    clinical_cases is None) and count TP, Pred_Pos and GS_Pos per clinical
+    case.
+    '''
+    paths = [(root, filename) for root, filename in paths
+             if (clinical_cases is None) or (filename in clinical_cases)]
+    with_notes = (subtask=='norm')
+    records = ann_parsing.InternedRecords(len(ann_parsing.record_columns(with_notes)))
+    ann_parsing.parse_ann_chunk(paths, set(cantemist_ner_norm.PRED_LABELS),
+                                with_notes=with_notes, records=records)
+    pred = ann_parsing.records_to_df(records, with_notes=with_notes)
+    pred = pred.assign(offset0=0, offset1=0)
+    if pred.shape[0] > 0:
+        pred = ann_parsing.format_df(pred)
+    pred.columns = cantemist_ner_norm.PRED_COLUMNS[subtask]
+    pred = pred.loc[pred['clinical_case'].isin(ann_list_gs),:]
+
+    if (subtask=='norm') & (valid_codes is not None):
+        n_invalid = (~vc.isin(pred['code_pred'].str.lower(), valid_codes)).sum()
+        if n_invalid > 0:
+            warnings.warn('{} predicted annotations have codes '.format(n_invalid) +
+                          'not included in the list of valid codes')
+
+    gs, _ = gs_store.load_gs(store_path, subtask, check=False,
+                             clinical_cases=clinical_cases)
+    gs.columns = cantemist_ner_norm.GS_COLUMNS[subtask]
+
+    return cantemist_ner_norm.count_matches(gs, pred, subtask=subtask)
+
+
+def load_state(state_path):
+    '''
+    Read the state saved by save_state. None if there is none, or if it is
+    corrupt or of another version.
+    '''
+    try:
+        with np.load(state_path, allow_pickle=False) as arrays:
+            if int(arrays['version']) != STATE_VERSION:
+                return None
+            files = {rel_path: (int(size), int(mtime), sha1, filename)
+                     for rel_path, size, mtime, sha1, filename in
+                     zip(arrays['file_paths'].tolist(), arrays['file_sizes'].tolist(),
+                         arrays['file_mtimes'].tolist(), arrays['file_sha1s'].tolist(),
+                         arrays['file_cases'].tolist())}
+            counts = pd.DataFrame(arrays['counts'], columns=COUNT_COLUMNS,
+                                  index=pd.Index(arrays['count_cases'].astype(object),
+                                                 name='clinical_case'))
+            return {'version': STATE_VERSION, 'gs_key': str(arrays['gs_key']),
+                    'files': files, 'counts': counts}
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+
+
+def save_state(state_path, state):
+    '''
+    Atomically write the state: the files table and the counts as arrays.
+    '''
+    files = list(state['files'].items())
+    counts = state['counts']
+    arrays = {'version': np.array(STATE_VERSION),
+              'gs_key': np.array(state['gs_key'], dtype=str),
+              'file_paths': np.array([rel_path for rel_path, _ in files], dtype=str),
+              'file_sizes': np.array([entry[0] for _, entry in files], dtype=np.int64),
+              'file_mtimes': np.array([entry[1] for _, entry in files], dtype=np.int64),
+              'file_sha1s': np.array([entry[2] for _, entry in files], dtype=str),
+              'file_cases': np.array([entry[3] for _, entry in files], dtype=str),
+              'count_cases': np.array(counts.index.astype(str), dtype=str),
+              'counts': counts[COUNT_COLUMNS].to_numpy(dtype=np.int64)}
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(state_path)),
+                                    suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, state_path)
+
+
+def file_sha1(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
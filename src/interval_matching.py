@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lenient (overlap-based) matching of GS and predicted annotations.
+
+Annotations are the unique (clinical case, start, end) spans of the GS and
+of the predictions, the same units counted as GS and Predicted Positives in
+strict matching. A predicted span matches a GS span of the same clinical
+case if they overlap (offsets are end-exclusive, as in Brat) and, in
+subtask norm, if they have a code in common. Every annotation is matched at
+most once:
+    1. Spans with exactly the same offsets (and a common code) are matched
+       first, with one merge.
+    2. The remaining spans are matched with a sort-and-sweep, per clinical
+       case and code: spans are visited by end position and each one is
+       matched with the not yet matched span of the other side that
+       starts before its end and ends first (a heap of started spans per
+       side). This gives the maximum number of matches for spans with one
+       code, in O(n log n) instead of comparing every pair of spans.
+"""
+
+import heapq
+
+import numpy as np
+import pandas as pd
+
+import ann_parsing
+
+MATCH_MODES = ['strict', 'lenient', 'both']
+
+
+def count_overlaps(gs, pred, subtask=['ner','norm'], breakdown=False):
+    '''
+    Count lenient True Positives, Predicted Positives and Gold Standard
+    Positives per clinical case.
+
+    Parameters
+    ----------
+    gs : pandas dataframe
+        with the Gold Standard. Columns are those defined in
+        cantemist_ner_norm.GS_COLUMNS.
+    pred : pandas dataframe
+        with the predictions. Columns are those defined in
+        cantemist_ner_norm.PRED_COLUMNS.
+    subtask : str
+        subtask name
+    breakdown : bool
+        subtask norm: whether to also count the spans of every code and
+        code family (see code_breakdown.py). A matched span is a True
+        Positive of the code it was matched with.
+
+    Returns
+    -------
+    Same as cantemist_ner_norm.count_matches.
+
+    '''
+    if subtask not in ['ner', 'norm']:
+        raise Exception('Error! Subtask name not properly set up')
+    if breakdown & (subtask != 'norm'):
+        raise Exception('The breakdown by code is only supported in subtask norm')
+
+    shared = [('clinical_case', 'clinical_case')]
+    if subtask == 'norm':
+        shared.append(('code_gs', 'code_pred'))
+    gs, pred = ann_parsing.share_categories(gs, pred, shared)
+    gs_spans, gs_codes = spans(gs, 'gs', subtask)
+    pred_spans, pred_codes = spans(pred, 'pred', subtask)
+
+    ###### 1. Exact offsets ######
+    on = ['clinical_case', 'start', 'end'] + (['code'] if subtask == 'norm' else [])
+    pairs = (pd.merge(gs_codes, pred_codes, on=on, suffixes=('_gs', '_pred'))
+             [['span_gs', 'span_pred'] + (['code'] if subtask == 'norm' else [])]
+             .drop_duplicates(subset=['span_gs'])
+             .drop_duplicates(subset=['span_pred']))
+    gs_matched = np.zeros(gs_spans.shape[0], dtype=bool)
+    pred_matched = np.zeros(pred_spans.shape[0], dtype=bool)
+    gs_matched[pairs['span_gs'].to_numpy()] = True
+    pred_matched[pairs['span_pred'].to_numpy()] = True
+
+    ###### 2. Overlapping offsets ######
+    swept, swept_codes = sweep(gs_codes.loc[~gs_matched[gs_codes['span'].to_numpy()]],
+                  pred_codes.loc[~pred_matched[pred_codes['span'].to_numpy()]],
+                  subtask)
+
+    matched_cases = np.concatenate([
+        gs_spans['clinical_case'].to_numpy()[pairs['span_gs'].to_numpy()],
+        gs_spans['clinical_case'].to_numpy()[np.array(swept, dtype=np.int64)]])
+    TP_per_cc = pd.Series(matched_cases, dtype=object).value_counts()
+    Pred_Pos_per_cc = ann_parsing.size_by(pred_spans, 'clinical_case')
+    GS_Pos_per_cc = ann_parsing.size_by(gs_spans, 'clinical_case')
+
+    counts = pd.concat([TP_per_cc, Pred_Pos_per_cc, GS_Pos_per_cc], axis=1,
+                       keys=['TP', 'Pred_Pos', 'GS_Pos'])
+    counts = counts.fillna(0).astype(int).sort_index()
+    counts.index.name = 'clinical_case'
+
+    if breakdown:
+        import code_breakdown
+        matched = pd.DataFrame({'span': np.concatenate([pairs['span_gs'].to_numpy(),
+                                                        np.array(swept, dtype=np.int64)]),
+                                'code': pd.concat([pairs['code'], pd.Series(swept_codes, dtype=object)
+                                                   .astype(pairs['code'].dtype)],
+                                                  ignore_index=True)})
+        units = {'TP': matched, 'Pred_Pos': pred_codes, 'GS_Pos': gs_codes}
+        return counts, code_breakdown.count_labels(units, ['span'])
+    return counts
+
+
+def spans(df, side, subtask):
+    '''
+    Unique spans of one side and their codes.
+
+    Returns
+    -------
+    spans : pandas dataframe
+        Columns 'clinical_case', 'start', 'end'. The index is the span id.
+    codes : pandas dataframe
+        Columns 'span' (span id), 'clinical_case', 'start', 'end' and, in
+        subtask norm, 'code'. One row per span (and code).
+    '''
+    columns = {'start_pos_' + side: 'start', 'end_pos_' + side: 'end',
+               'code_' + side: 'code'}
+    df = df.rename(columns=columns)
+    keys = ['clinical_case', 'start', 'end']
+    spans = df[keys].drop_duplicates().reset_index(drop=True)
+    codes = df[keys + (['code'] if subtask == 'norm' else [])].drop_duplicates()
+    codes = pd.merge(codes, spans.reset_index().rename(columns={'index': 'span'}),
+                     on=keys)
+    return spans, codes
+
+
+def sweep(gs_codes, pred_codes, subtask):
+    '''
+    One-to-one matching of overlapping spans (see module docstring).
+
+    Returns
+    -------
+    matched : list
+        Span ids of the matched GS spans.
+    codes : list
+        Code of every match (subtask norm).
+    '''
+    events = pd.concat([gs_codes.assign(side=0), pred_codes.assign(side=1)],
+                       ignore_index=True)
+    if subtask == 'ner':
+        events = events.assign(code='')
+    events = events.sort_values(['clinical_case', 'code', 'side', 'start', 'end'],
+                                kind='mergesort')
+
+    matched, codes = [], []
+    done = (set(), set())
+    group_key = None
+    group = ([], [])
+    for span_case, code, side, start, end, span in zip(
+            events['clinical_case'].to_numpy(), events['code'].to_numpy(),
+            events['side'].to_numpy(), events['start'].to_numpy(),
+            events['end'].to_numpy(), events['span'].to_numpy()):
+        if (span_case, code) != group_key:
+            if group_key is not None:
+                match_group(group, done, matched)
+                codes.extend([group_key[1]] * (len(matched) - len(codes)))
+            group_key = (span_case, code)
+            group = ([], [])
+        group[side].append((int(start), int(end), int(span)))
+    if group_key is not None:
+        match_group(group, done, matched)
+        codes.extend([group_key[1]] * (len(matched) - len(codes)))
+
+    return matched, codes
+
+
+def match_group(group, done, matched):
+    '''
+    Match the spans of one clinical case (and code). group holds the GS
+    and the predicted spans, as lists of (start, end, span id) sorted by
+    start.
+
+    Spans are visited by end position. The span that ends first can only
+    overlap spans of the other side that start before its end, and all of
+    them end later; matching it with the one that ends first gives a
+    maximum matching.
+    '''
+    if (len(group[0]) == 0) | (len(group[1]) == 0):
+        return
+    order = sorted((end, side, span) for side in (0, 1)
+                   for _, end, span in group[side])
+    heaps = ([], [])
+    started = [0, 0]
+    visited = (set(), set())
+    for end, side, span in order:
+        if (span in done[side]) or (span in visited[side]):
+            continue
+        visited[side].add(span)
+        other = 1 - side
+        spans = group[other]
+        while (started[other] < len(spans)) and (spans[started[other]][0] < end):
+            _, other_end, other_span = spans[started[other]]
+            heapq.heappush(heaps[other], (other_end, other_span))
+            started[other] += 1
+        heap = heaps[other]
+        while heap and ((heap[0][1] in done[other]) or (heap[0][1] in visited[other])):
+            heapq.heappop(heap)
+        if heap:
+            _, other_span = heapq.heappop(heap)
+            visited[other].add(other_span)
+            done[side].add(span)
+            done[other].add(other_span)
+            matched.append(span if side == 0 else other_span)
@@ -9,13 +9,15 @@ Created on Mon Jun 8 15:22:29 2020
 import argparse
 import warnings
 
-import cantemist_coding
-import cantemist_ner_norm
+import profiling
+import results_output
 
 def warning_on_one_line(message, category, filename, lineno, file=None, line=None):
     return '%s:%s: %s: %s\n' % (filename, lineno, category.__name__, message)
 warnings.formatwarning = warning_on_one_line
 
+DEFAULT_CODES_PATH = '../valid-codes.tsv'
+
 def parse_arguments():
     '''
     DESCRIPTION: Parse command line arguments
@@ -23,33 +25,182 @@ def parse_arguments():
   
     parser = argparse.ArgumentParser(description='process user given parameters')
     parser.add_argument("-g", "--gs_path", required = True, dest = "gs_path", 
-                        help = "path to GS file")
+                        help = "path to GS file (or .ann directory or zip/tar archive)")
     parser.add_argument("-p", "--pred_path", required = True, dest = "pred_path", 
-                        help = "path to predictions file")
+                        nargs = '+',
+                        help = "path to predictions file (or .ann directory or zip/tar " +
+                        "archive). With several paths, " +
+                        "only one results line per run is printed")
     parser.add_argument("-c", "--valid_codes_path", required = False, 
-                        default = '../valid-codes.tsv',
-                        dest = "codes_path", help = "path to valid codes TSV")
+                        default = None, dest = "codes_path",
+                        help = "path to valid codes TSV (subtask coding: default " +
+                        "{}; subtask norm: codes are only checked ".format(DEFAULT_CODES_PATH) +
+                        "if it is given)")
     parser.add_argument('-s', '--subtask', required = True, dest = 'subtask',
                         choices=['ner', 'norm', 'coding'],
                         help = 'Subtask name')
+    parser.add_argument('-j', '--jobs', required = False, default = 1,
+                        type = int, dest = 'jobs',
+                        help = 'number of processes used to parse .ann files ' +
+                        '(or to score the runs, with several prediction paths)')
+    parser.add_argument('-i', '--incremental', required = False, default = None,
+                        dest = 'cache_dir',
+                        help = 'cache directory for incremental re-evaluation ' +
+                        '(subtasks ner and norm): only changed .ann files are parsed')
+    parser.add_argument('--stream', required = False, default = False,
+                        action = 'store_true', dest = 'stream',
+                        help = 'subtask coding: read the predictions in chunks of complete ' +
+                        'clinical cases (rows of each clinical case must be contiguous)')
+    parser.add_argument('--match', required = False, default = 'strict',
+                        choices = ['strict', 'lenient', 'both'], dest = 'match',
+                        help = 'strict (exact offsets) or lenient (overlapping ' +
+                        'offsets) matching, or both (subtasks ner and norm)')
+    parser.add_argument('--multi-codes', required = False, default = None,
+                        dest = 'multi_codes_path',
+                        help = 'subtask norm: TSV (clinical case, start, end) of the GS ' +
+                        'annotations with several valid codes (default: derived from the GS)')
+    parser.add_argument('--metrics', required = False, default = None,
+                        dest = 'metrics',
+                        help = 'subtask coding: comma-separated ranking metrics computed ' +
+                        'in one pass, with their values per clinical case: MAP, P@k, ' +
+                        'R@k, nDCG@k, Rprec, MRR (e.g. MAP,P@5,nDCG@10)')
+    parser.add_argument('--breakdown', required = False, default = None,
+                        dest = 'breakdown_path',
+                        help = 'subtask norm: also write P, R and F1 by code, morphology ' +
+                        'and behaviour, with macro-averages, to this file (in the ' +
+                        '--format format)')
+    parser.add_argument('--format', required = False, default = 'text',
+                        choices = results_output.FORMATS, dest = 'fmt',
+                        help = 'output format (default: text tables)')
+    parser.add_argument('-o', '--output', required = False, default = None,
+                        dest = 'output_path', help = 'write results to this file')
+    parser.add_argument('--summary-only', required = False, default = False,
+                        action = 'store_true', dest = 'summary_only',
+                        help = 'only output the micro-averages (subtasks ner and norm)')
+    parser.add_argument('--stats', required = False, default = None,
+                        dest = 'stats_path',
+                        help = 'write the sufficient statistics of this shard of clinical ' +
+                        'cases to this file instead of the results (merge shards with ' +
+                        'shard_stats.py)')
+    parser.add_argument('--result-cache', required = False, default = None,
+                        dest = 'result_cache_dir',
+                        help = 'cache directory of results: predictions already scored ' +
+                        'with the same contents are not evaluated again')
+    parser.add_argument('--result-cache-size', required = False, default = 256,
+                        type = int, dest = 'result_cache_size',
+                        help = 'size bound of the result cache, in MB (default: 256); ' +
+                        'least recently used results are evicted')
+    parser.add_argument('--profile', required = False, default = None,
+                        nargs = '?', const = '-', dest = 'profile_path',
+                        help = 'write a JSON report with stage timings, counters ' +
+                        'and peak memory to this file (default: stderr)')
     
     args = parser.parse_args()
+    if (len(args.pred_path) > 1) & ((args.fmt != 'text') | (args.output_path is not None) |
+                                    args.stream | (args.cache_dir is not None) |
+                                    args.summary_only):
+        parser.error('--format, --output, --stream, --incremental and --summary-only ' +
+                     'are not supported with several prediction paths')
+    if (args.match != 'strict') & ((args.subtask == 'coding') | (len(args.pred_path) > 1) |
+                                   (args.cache_dir is not None)):
+        parser.error('--match is only supported for one run of subtasks ner and norm, ' +
+                     'without --incremental')
+    if (args.multi_codes_path is not None) & (args.cache_dir is not None):
+        parser.error('--multi-codes is not supported with --incremental')
+    if (args.stats_path is not None) & ((len(args.pred_path) > 1) | (args.match == 'both') |
+                                        (args.cache_dir is not None) |
+                                        ((args.subtask == 'coding') & args.stream)):
+        parser.error('--stats is only supported for one run and one matching mode, ' +
+                     'without --incremental (or --stream in subtask coding)')
+    if args.metrics is not None:
+        if (args.subtask != 'coding') | (len(args.pred_path) > 1) | (args.stats_path is not None):
+            parser.error('--metrics is only supported for one run of subtask coding, ' +
+                         'without --stats')
+        import cantemist_coding
+        try:
+            args.metrics = cantemist_coding.parse_metrics(args.metrics)
+        except ValueError as e:
+            parser.error(str(e))
+    if (args.result_cache_dir is not None) & ((len(args.pred_path) > 1) |
+                                              (args.stats_path is not None)):
+        parser.error('--result-cache is not supported with several prediction paths ' +
+                     'or with --stats')
+    if (args.breakdown_path is not None) & ((args.subtask != 'norm') | (len(args.pred_path) > 1) |
+                                            (args.cache_dir is not None) |
+                                            (args.stats_path is not None) |
+                                            (args.result_cache_dir is not None)):
+        parser.error('--breakdown is only supported for one run of subtask norm, ' +
+                     'without --incremental, --stats or --result-cache')
     gs_path = args.gs_path
     pred_path = args.pred_path
     codes_path = args.codes_path
+    if (codes_path is None) & (args.subtask == 'coding'):
+        codes_path = DEFAULT_CODES_PATH
     subtask = args.subtask
+    jobs = args.jobs
+    cache_dir = args.cache_dir
+    profile_path = args.profile_path
+    stream = args.stream
+    metrics = args.metrics
+    output = {'fmt': args.fmt, 'output_path': args.output_path,
+              'summary_only': args.summary_only, 'match': args.match,
+              'multi_codes_path': args.multi_codes_path,
+              'stats_path': args.stats_path,
+              'breakdown_path': args.breakdown_path,
+              'result_cache_dir': args.result_cache_dir,
+              'result_cache_size': args.result_cache_size << 20}
     
-    return gs_path, pred_path, codes_path, subtask
+    return (gs_path, pred_path, codes_path, subtask, jobs, cache_dir, stream,
+            metrics, profile_path, output)
 
 
-if __name__ == '__main__':
+def run(gs_path, pred_path, codes_path, subtask, jobs, cache_dir, stream, metrics,
+        output):
     
-    gs_path, pred_path, codes_path, subtask = parse_arguments()
+    if len(pred_path) > 1:
+        import batch
+        with profiling.stage('batch'):
+            batch.main(gs_path, pred_path, codes_path, subtask, jobs=jobs,
+                       multi_codes_path=output['multi_codes_path'])
+        return
+    pred_path = pred_path[0]
     
+    # Subtask modules are imported here, so that a run of one subtask does
+    # not pay the import time of the others
     if subtask == 'coding':
-        cantemist_coding.main(gs_path, pred_path, codes_path)
+        with profiling.stage('import'):
+            import cantemist_coding
+        cantemist_coding.main(gs_path, pred_path, codes_path, fmt=output['fmt'],
+                              output_path=output['output_path'], stream=stream,
+                              stats_path=output['stats_path'],
+                              result_cache_dir=output['result_cache_dir'],
+                              result_cache_size=output['result_cache_size'],
+                              metrics=metrics)
     elif subtask == 'ner':
-        cantemist_ner_norm.main(gs_path, pred_path, subtask='ner')
+        with profiling.stage('import'):
+            import cantemist_ner_norm
+        cantemist_ner_norm.main(gs_path, pred_path, subtask='ner', jobs=jobs,
+                                cache_dir=cache_dir, **output)
     elif subtask == 'norm':
-        cantemist_ner_norm.main(gs_path, pred_path, subtask='norm')
-        
\ No newline at end of file
+        with profiling.stage('import'):
+            import cantemist_ner_norm
+        cantemist_ner_norm.main(gs_path, pred_path, subtask='norm', jobs=jobs,
+                                codes_path=codes_path,
+                                cache_dir=cache_dir, **output)
+
+
+if __name__ == '__main__':
+    
+    (gs_path, pred_path, codes_path, subtask, jobs, cache_dir, stream,
+     metrics, profile_path, output) = parse_arguments()
+    
+    if profile_path is not None:
+        profiling.enable()
+        try:
+            run(gs_path, pred_path, codes_path, subtask, jobs, cache_dir, stream, metrics,
+                output)
+        finally:
+            profiling.write_report(profile_path)
+    else:
+        run(gs_path, pred_path, codes_path, subtask, jobs, cache_dir, stream, metrics,
+            output)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GS annotations with several valid codes (subtask NORM).
+
+Some GS annotations have more than one valid code: the same clinical case
+and offsets appear in several annotations, each one with a different code.
+A prediction with any of those codes is a True Positive, and the
+annotation is counted once.
+
+By default, these annotations are derived from the GS: every (clinical
+case, offset) with more than one code. A multi-codes TSV (clinical case,
+start, end; no headers row) restricts them to the listed annotations.
+
+The table has one row per multi-code annotation, keyed by (clinical_case,
+offset), with the code whose matches are kept ('code_gs', the first one in
+the GS). It is applied to the merged GS and predictions with one join.
+"""
+
+import pandas as pd
+
+KEYS = ['clinical_case', 'offset']
+
+
+def load_keys(multi_codes_path):
+    '''
+    Read a multi-codes TSV.
+
+    Parameters
+    ----------
+    multi_codes_path : str
+        Path to TSV file with 3 columns: clinical case (.ann file name),
+        start and end offsets. It has no headers row.
+
+    Returns
+    -------
+    keys : pandas DataFrame
+        Columns 'clinical_case' and 'offset' ('start end', as in the parsed
+        annotations).
+
+    '''
+    df = pd.read_csv(multi_codes_path, sep='\t', header=None, dtype=str)
+    if df.shape[1] != 3:
+        raise ImportError('The multi-codes file does not have 3 columns. Then, it was not imported')
+    return pd.DataFrame({'clinical_case': df[0], 'offset': df[1] + ' ' + df[2]})
+
+
+def build_table(gs, keys=None):
+    '''
+    Multi-code annotations of the GS.
+
+    Parameters
+    ----------
+    gs : pandas DataFrame
+        GS annotations of subtask norm (cantemist_ner_norm.GS_COLUMNS).
+    keys : pandas DataFrame
+        Output of load_keys. If None, all GS annotations with more than one
+        code are used.
+
+    Returns
+    -------
+    table : pandas DataFrame
+        Columns 'clinical_case', 'offset' and 'code_gs' (the kept code).
+
+    '''
+    codes = gs[KEYS + ['code_gs']].drop_duplicates()
+    n_codes = codes.groupby(KEYS, observed=True)['code_gs'].transform('size')
+    table = codes.loc[n_codes > 1].drop_duplicates(subset=KEYS)
+    if keys is not None:
+        listed = set(keys['clinical_case'] + '\t' + keys['offset'])
+        key = table['clinical_case'].astype(str) + '\t' + table['offset'].astype(str)
+        table = table.loc[key.isin(listed).to_numpy()]
+
+    return table.reset_index(drop=True)
+
+
+def apply_table(df_sel, table):
+    '''
+    Count every multi-code annotation once, as valid if any of its codes
+    was predicted.
+
+    Parameters
+    ----------
+    df_sel : pandas DataFrame
+        Merge of predictions and GS on clinical case and offset, with a
+        boolean column 'is_valid' (codes are equal).
+    table : pandas DataFrame
+        Output of build_table.
+
+    Returns
+    -------
+    df_sel : pandas DataFrame
+        Rows of multi-code annotations are valid if any of them was valid,
+        and only the rows of the kept code remain.
+
+    '''
+    if table.shape[0] == 0:
+        return df_sel
+
+    rows = pd.merge(df_sel[KEYS + ['code_gs', 'is_valid']].reset_index(), table,
+                    on=KEYS, suffixes=('', '_kept'))
+    any_valid = rows.groupby(KEYS, observed=True)['is_valid'].transform('any')
+    df_sel.loc[rows.loc[any_valid.to_numpy(), 'index'].to_numpy(), 'is_valid'] = True
+    dropped = rows.loc[(rows['code_gs'] != rows['code_gs_kept']).to_numpy(), 'index']
+
+    return df_sel.drop(dropped.to_numpy())
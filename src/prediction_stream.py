@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Chunked reader of prediction TSVs (clinical case, code) for streaming
+evaluation (--stream).
+
+The TSV is read with pandas in chunks of chunk_rows rows, and only
+complete clinical cases are yielded: the rows of the last clinical case of
+a chunk are kept and yielded with the next chunk. Memory is then bounded by
+the chunk size plus the largest clinical case, whatever the size of the
+file.
+
+The rows of every clinical case must be contiguous (the usual layout of
+ranked predictions). If a clinical case appears again after another one,
+an exception is raised: its predictions could not be deduplicated or
+ranked as in the non-streaming evaluation.
+"""
+
+import numpy as np
+import pandas as pd
+
+CHUNK_ROWS = 1000000
+
+
+def iter_case_chunks(filepath, names=['clinical_case', 'code'],
+                     chunk_rows=CHUNK_ROWS):
+    '''
+    Read a prediction TSV (no headers row) in chunks of complete clinical
+    cases.
+
+    Parameters
+    ----------
+    filepath : str or file-like object
+        Route to TSV file with 2 columns: clinical case, code.
+    names : list
+        Names given to the 2 columns.
+    chunk_rows : int
+        Number of rows read at once.
+
+    Yields
+    ------
+    chunk : pandas DataFrame
+        Rows of one or more complete clinical cases, in file order. Values
+        are strings (NaN if empty).
+
+    '''
+    reader = pd.read_csv(filepath, sep='\t', header=None, dtype=str,
+                         chunksize=chunk_rows)
+    closed = set()
+    pending = []
+    for chunk in reader:
+        if chunk.shape[1] != 2:
+            raise ImportError('The predictions file does not have 2 columns. Then, it was not imported')
+        chunk.columns = names
+        cases = chunk[names[0]].fillna('').to_numpy()
+        # First row of the last clinical case of the chunk
+        changes = np.flatnonzero(cases[1:] != cases[:-1]) + 1
+        tail_start = changes[-1] if len(changes) > 0 else 0
+
+        if tail_start == 0:
+            if pending and (pending[0][names[0]].fillna('').iat[0] != cases[0]):
+                yield check_contiguous(pd.concat(pending, ignore_index=True),
+                                       names[0], closed)
+                pending = []
+            pending.append(chunk)
+            continue
+
+        complete = pd.concat(pending + [chunk.iloc[:tail_start]], ignore_index=True)
+        yield check_contiguous(complete, names[0], closed)
+        pending = [chunk.iloc[tail_start:]]
+
+    if pending:
+        yield check_contiguous(pd.concat(pending, ignore_index=True), names[0],
+                               closed)
+
+
+def check_contiguous(chunk, column, closed):
+    '''
+    Check that the clinical cases of a chunk have not been seen in previous
+    chunks and that each one is in one block of rows. closed is updated
+    with the clinical cases of the chunk.
+    '''
+    cases = chunk[column].fillna('').to_numpy()
+    starts = np.concatenate([[0], np.flatnonzero(cases[1:] != cases[:-1]) + 1])
+    blocks = cases[starts] if len(cases) > 0 else cases
+    unique = set(blocks)
+    if (len(unique) != len(blocks)) | (len(closed & unique) > 0):
+        raise Exception('The predictions of each clinical case must be in ' +
+                        'contiguous rows to be evaluated in streaming mode. ' +
+                        'Sort the file by clinical case (keeping the rank ' +
+                        'order) or evaluate it without streaming.')
+    closed.update(unique)
+    return chunk
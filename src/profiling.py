@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Stage timers, counters and peak memory of one evaluation run (--profile).
+
+Instrumented code marks its stages and counts what it processes:
+
+    with profiling.stage('parse_ann'):
+        ...
+        profiling.count('ann_files', len(paths))
+
+Profiling is off unless enable() is called. When it is off, stage() returns
+a shared no-op context manager and count() returns at once, so the
+instrumentation has close to zero overhead.
+
+When it is on, the wall time and number of calls of every stage are
+recorded, nested stages are named 'outer/inner', and, if trace_memory is
+True, the peak memory allocated by Python during every stage is measured
+with tracemalloc (peak_mem_mb: total; peak_growth_mb: above the memory
+allocated when the stage started). Work done in worker processes (-j) is
+only seen as the time of the stage that waits for it.
+"""
+
+import json
+import sys
+import time
+import tracemalloc
+
+_report = None
+_stack = []
+
+
+class _NullStage:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if _stack:
+            self.path = _stack[-1].path + '/' + self.name
+        else:
+            self.path = self.name
+        self.peak = 0
+        if self.path not in _report['stages']:
+            # Stages are reported in the order they are first entered
+            _report['stages'][self.path] = {'name': self.path, 'calls': 0,
+                                            'wall_s': 0.0}
+        if _report['trace_memory']:
+            self.start_mem = tracemalloc.get_traced_memory()[0]
+            if _stack:
+                # Keep the peak of the enclosing stage before resetting it
+                _stack[-1].peak = max(_stack[-1].peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        _stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = time.perf_counter() - self.start
+        _stack.pop()
+        record = _report['stages'][self.path]
+        record['calls'] += 1
+        record['wall_s'] += wall
+        if _report['trace_memory']:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            record['peak_mem_mb'] = max(record.get('peak_mem_mb', 0),
+                                        self.peak / 1024 ** 2)
+            record['peak_growth_mb'] = max(record.get('peak_growth_mb', 0),
+                                           (self.peak - self.start_mem) / 1024 ** 2)
+            if _stack:
+                _stack[-1].peak = max(_stack[-1].peak, self.peak)
+            tracemalloc.reset_peak()
+        return False
+
+
+def enable(trace_memory=True):
+    '''
+    Start recording stages and counters. With trace_memory=True, tracemalloc
+    is started too (this slows down code that allocates many objects).
+    '''
+    global _report
+    _report = {'start': time.perf_counter(), 'trace_memory': trace_memory,
+               'stages': {}, 'counters': {}}
+    del _stack[:]
+    if trace_memory & (tracemalloc.is_tracing() == False):
+        tracemalloc.start()
+
+
+def is_enabled():
+    return _report is not None
+
+
+def stage(name):
+    '''
+    Context manager that records the wall time (and peak memory) of a stage.
+    '''
+    if _report is None:
+        return _NULL_STAGE
+    return _Stage(name)
+
+
+def count(name, n=1):
+    '''
+    Add n to the counter name.
+    '''
+    if _report is None:
+        return
+    _report['counters'][name] = _report['counters'].get(name, 0) + n
+
+
+def report():
+    '''
+    Return the recorded profile as a JSON-serializable dict, or None if
+    profiling is off.
+    '''
+    if _report is None:
+        return None
+    content = {'argv': sys.argv,
+               'wall_s': time.perf_counter() - _report['start'],
+               'stages': list(_report['stages'].values()),
+               'counters': dict(_report['counters'])}
+    if _report['trace_memory']:
+        content['peak_mem_mb'] = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        content['peak_mem_mb'] = max([content['peak_mem_mb']] +
+                                     [s['peak_mem_mb'] for s in content['stages']])
+    return content
+
+
+def write_report(output_path=None):
+    '''
+    Write the recorded profile as JSON to output_path, or to stderr if
+    output_path is None or '-'.
+    '''
+    content = report()
+    if content is None:
+        return
+    if (output_path is None) or (output_path == '-'):
+        sys.stderr.write(json.dumps(content, indent=1) + '\n')
+        return
+    with open(output_path, 'w') as f:
+        json.dump(content, f, indent=1)
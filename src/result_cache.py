@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of evaluation results (--result-cache).
+
+Results are stored under a key that hashes the contents of the
+predictions, the GS, the valid codes TSV and the multi-codes TSV, the
+subtask, the matching mode (or the ranking metrics of subtask coding) and
+EVALUATOR_VERSION. A prediction scored again unchanged (retries,
+leaderboard refreshes...) is not parsed: its micro-averages and per
+clinical case results are read from the cache and formatted as usual. Warnings of the first evaluation are not shown again.
+
+Every entry is one .npz file in the cache directory. Entries are written
+to a temporary file and renamed, so concurrent writers and readers never
+see a partial entry (writers of the same key store the same results).
+Reading an entry updates its modification time, and after every write
+the least recently used entries are removed until the directory is below
+its size bound (with concurrent writers, entries renamed after another
+writer evicted may exceed it until the next write). Entries that
+disappear while they are read count as misses.
+"""
+
+import hashlib
+import os
+import tempfile
+import time
+import warnings
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+import archives
+import gs_store
+import valid_codes as vc
+
+# Increase it with every change of the evaluation that alters results (or
+# of the entry format): entries of other versions are not used.
+EVALUATOR_VERSION = 4
+MAX_BYTES = 256 << 20
+# Temporary files older than this were left by writers that crashed
+STALE_TMP_SECONDS = 3600
+
+
+def cache_key(subtask, gs_path, pred_path, codes_path=None, match='strict',
+              multi_codes_path=None, options=''):
+    '''
+    Key of the results of one evaluation (SHA-1 hex digest).
+
+    Parameters
+    ----------
+    subtask : str
+        Subtask name
+    gs_path : str
+        Path to the GS: .ann directory or archive, GS store (.npz) or TSV.
+    pred_path : str
+        Path to the predictions: .ann directory or archive, or TSV.
+    codes_path : str
+        Path to the valid codes TSV, if it is used.
+    match : str
+        Matching mode (subtasks ner and norm).
+    multi_codes_path : str
+        Path to the multi-codes TSV, if it is used.
+    options : str
+        Other options that change the results (e.g. the ranking metrics of
+        subtask coding).
+
+    Returns
+    -------
+    key : str
+
+    '''
+    parts = [str(EVALUATOR_VERSION), subtask, match, content_hash(pred_path),
+             gs_content_hash(gs_path),
+             vc.file_sha1(codes_path) if codes_path is not None else '',
+             vc.file_sha1(multi_codes_path) if multi_codes_path is not None else '',
+             options]
+    return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+def content_hash(path):
+    '''
+    Hash of a .ann directory or archive (names and contents of the .ann
+    files, see gs_store.content_hash) or of a file.
+    '''
+    if os.path.isdir(path) or archives.is_archive(path):
+        return gs_store.content_hash(path)
+    return vc.file_sha1(path)
+
+
+def gs_content_hash(gs_path):
+    '''
+    Same as content_hash. For a GS store, the hash of the .ann files it
+    was compiled from (those of the source directory if it is stale), so
+    that a store and its source directory have the same key.
+    '''
+    if gs_store.is_store(gs_path):
+        with np.load(gs_path, allow_pickle=False) as store:
+            if gs_store.is_fresh(store):
+                return str(store['content_hash'])
+        return content_hash(gs_store.source_path(gs_path))
+    return content_hash(gs_path)
+
+
+def entry_path(cache_dir, key):
+    return os.path.join(cache_dir, key + '.npz')
+
+
+def load_results(cache_dir, key):
+    '''
+    Read the results stored under key, and mark them as recently used.
+
+    Returns
+    -------
+    results : dict or None
+        Same as given to store_results. None if there is no entry.
+
+    '''
+    path = entry_path(cache_dir, key)
+    try:
+        with np.load(path, allow_pickle=False) as entry:
+            results = decode(entry)
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return results
+
+
+def store_results(cache_dir, key, results, max_bytes=MAX_BYTES):
+    '''
+    Store results under key, then evict the least recently used entries
+    beyond max_bytes. If the directory is not writable, results are just
+    not stored.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Cache directory. It is created if needed.
+    key : str
+        Output of cache_key.
+    results : dict
+        Name -> tuple of metrics: floats or pandas Series indexed by
+        clinical case (e.g. matching mode -> output of
+        cantemist_ner_norm.metrics_from_counts).
+    max_bytes : int
+        Size bound of the cache directory.
+
+    Returns
+    -------
+    None.
+
+    '''
+    tmp_path = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix='.entry-', suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez_compressed(f, **encode(results))
+        os.replace(tmp_path, entry_path(cache_dir, key))
+    except OSError:
+        if (tmp_path is not None) and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        warnings.warn('Results could not be stored in the cache {}'.format(cache_dir))
+        return
+    evict(cache_dir, max_bytes)
+
+
+def evict(cache_dir, max_bytes=MAX_BYTES):
+    '''
+    Remove the least recently used entries until the entries of cache_dir
+    take at most max_bytes, and the temporary files of crashed writers.
+    Entries removed by another process meanwhile are ignored.
+    '''
+    entries = []
+    now = time.time()
+    for item in os.scandir(cache_dir):
+        try:
+            stat = item.stat()
+            if item.name.endswith('.npz'):
+                entries.append((stat.st_mtime_ns, stat.st_size, item.path))
+            elif item.name.endswith('.tmp') & (now - stat.st_mtime > STALE_TMP_SECONDS):
+                os.remove(item.path)
+        except FileNotFoundError:
+            continue
+
+    total = 0
+    for _, size, path in sorted(entries, reverse=True):
+        total += size
+        if total <= max_bytes:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def encode(results):
+    '''
+    Arrays of an entry: for every result name, its position in 'names',
+    and one array per metric (floats) or two (index and values of Series).
+    '''
+    arrays = {'names': np.array(list(results), dtype=str),
+              'lengths': np.array([len(metrics) for metrics in results.values()])}
+    for i, metrics in enumerate(results.values()):
+        for j, val in enumerate(metrics):
+            if isinstance(val, pd.Series):
+                arrays['{}_{}_index'.format(i, j)] = np.array(val.index.astype(str), dtype=str)
+                arrays['{}_{}'.format(i, j)] = val.to_numpy(dtype=float)
+            else:
+                arrays['{}_{}'.format(i, j)] = np.array(val)
+    return arrays
+
+
+def decode(entry):
+    '''
+    Inverse of encode, from an opened entry.
+    '''
+    results = {}
+    for i, (name, length) in enumerate(zip(entry['names'].tolist(),
+                                           entry['lengths'].tolist())):
+        metrics = []
+        for j in range(length):
+            values = entry['{}_{}'.format(i, j)]
+            if '{}_{}_index'.format(i, j) in entry.files:
+                index = entry['{}_{}_index'.format(i, j)].astype(object)
+                metrics.append(pd.Series(values, index=index))
+            else:
+                metrics.append(values.item())
+        results[name] = tuple(metrics)
+    return results
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Machine-readable output of evaluation results (--format, --output).
+
+The whole output is built in memory and written with a single call, to
+stdout or to a file. Formats:
+    json    {"pred_path": ..., "P": ..., "R": ..., "F1": ...,
+             "per_case": {case: {"P": ..., "R": ..., "F1": ...}}}
+    csv/tsv one row per clinical case (clinical_case,P,R,F1) and a last
+            row with the micro-averages (clinical_case = micro-average).
+            Without per clinical case results, one row: pred_path,P,R,F1
+            (or pred_path,MAP).
+With several matching modes (--match both), JSON has one object per mode
+and CSV/TSV a first 'match' column.
+Metrics that are not defined (NaN) are null in JSON and empty in CSV/TSV.
+The text format (tables of the original scripts) is built by each subtask
+module.
+"""
+
+import io
+import json
+import math
+import sys
+
+import pandas as pd
+
+FORMATS = ['text', 'json', 'csv', 'tsv']
+MICRO_AVERAGE_ROW = 'micro-average'
+
+
+def to_json_number(val):
+    val = float(val)
+    return None if math.isnan(val) else val
+
+
+def per_case_table(per_cc):
+    '''
+    Join per clinical case Series in one DataFrame.
+
+    Parameters
+    ----------
+    per_cc : dict
+        Metric name -> pandas Series indexed by clinical case.
+
+    Returns
+    -------
+    table : pandas DataFrame
+        One row per clinical case in any of the Series (sorted), one column
+        per metric.
+
+    '''
+    table = pd.DataFrame(per_cc).sort_index()
+    table.index.name = 'clinical_case'
+    return table
+
+
+def per_case_dict(table):
+    '''
+    Clinical case -> metric name -> value (None if not defined).
+    '''
+    return {str(index): {name: to_json_number(val) for name, val in row.items()}
+            for index, row in zip(table.index, table.to_dict('records'))}
+
+
+def format_results(pred_path, metrics, per_cc=None, fmt='json'):
+    '''
+    Format the results of one run.
+
+    Parameters
+    ----------
+    pred_path : str
+        Path to the predictions.
+    metrics : dict
+        Metric name -> micro-average value (e.g. P, R, F1 or MAP).
+    per_cc : dict
+        Metric name -> pandas Series with the value per clinical case. None
+        to leave out the per clinical case results.
+    fmt : str
+        'json', 'csv' or 'tsv'.
+
+    Returns
+    -------
+    content : str
+
+    '''
+    if fmt == 'json':
+        content = {'pred_path': pred_path}
+        content.update(results_dict(metrics, per_cc))
+        return json.dumps(content, indent=1) + '\n'
+
+    if fmt not in ['csv', 'tsv']:
+        raise ValueError('Unknown output format {}'.format(fmt))
+    table = results_table(pred_path, metrics, per_cc)
+    buffer = io.StringIO()
+    table.to_csv(buffer, sep=',' if fmt == 'csv' else '\t', na_rep='')
+    return buffer.getvalue()
+
+
+def results_dict(metrics, per_cc=None):
+    '''
+    JSON content of the results of one run, without the predictions path.
+    '''
+    content = {name: to_json_number(val) for name, val in metrics.items()}
+    if per_cc is not None:
+        content['per_case'] = per_case_dict(per_case_table(per_cc))
+    return content
+
+
+def results_table(pred_path, metrics, per_cc=None):
+    '''
+    CSV/TSV rows of the results of one run: one row per clinical case and
+    the micro-averages (index 'clinical_case'), or one row (index
+    'pred_path') without per clinical case results.
+    '''
+    if per_cc is not None:
+        table = per_case_table(per_cc)
+        micro = pd.DataFrame([metrics], index=[MICRO_AVERAGE_ROW])
+        table = pd.concat([table, micro[list(table.columns)]])
+        table.index.name = 'clinical_case'
+        return table
+    return pd.DataFrame([metrics], index=pd.Index([pred_path], name='pred_path'))
+
+
+def format_match_results(pred_path, results, fmt='json'):
+    '''
+    Format the results of one run scored with several matching modes.
+
+    Parameters
+    ----------
+    pred_path : str
+        Path to the predictions.
+    results : dict
+        Matching mode -> (metrics, per_cc), as in format_results.
+    fmt : str
+        'json' ({"pred_path": ..., mode: {...}}), or 'csv'/'tsv' (rows of
+        format_results with a first 'match' column).
+
+    Returns
+    -------
+    content : str
+
+    '''
+    if fmt == 'json':
+        content = {'pred_path': pred_path}
+        for match, (metrics, per_cc) in results.items():
+            content[match] = results_dict(metrics, per_cc)
+        return json.dumps(content, indent=1) + '\n'
+
+    if fmt not in ['csv', 'tsv']:
+        raise ValueError('Unknown output format {}'.format(fmt))
+    tables = []
+    for match, (metrics, per_cc) in results.items():
+        table = results_table(pred_path, metrics, per_cc).reset_index()
+        table.insert(0, 'match', match)
+        tables.append(table)
+    buffer = io.StringIO()
+    pd.concat(tables).to_csv(buffer, sep=',' if fmt == 'csv' else '\t', index=False,
+                             na_rep='')
+    return buffer.getvalue()
+
+
+def write_output(content, output_path=None):
+    '''
+    Write content with one call to output_path, or to stdout if
+    output_path is None or '-'.
+    '''
+    if (output_path is None) or (output_path == '-'):
+        sys.stdout.write(content)
+        sys.stdout.flush()
+        return
+    with open(output_path, 'w') as f:
+        f.write(content)
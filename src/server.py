@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local evaluation service that keeps the Gold Standard and the valid codes
+in memory.
+
+The GS of every subtask and the valid codes are loaded once at start-up.
+Then, each request is scored with the same functions as main.py and the
+metrics are returned as JSON. Requests are handled in threads; the loaded
+data is only read, never modified, so requests do not share mutable state.
+
+Usage:
+    python server.py -g ../gs-data/ -t ../gs-data/gs-coding.tsv -c ../valid-codes.tsv [--port 8000 | --socket PATH]
+
+Requests (POST /evaluate, JSON body):
+    {"subtask": "ner", "pred_path": "../toy-data/"}
+    {"subtask": "norm", "annotations": {"cc_onco1.ann": "T1\\tMORFOLOGIA_NEOPLASIA 2719 2740\\t..."}}
+    {"subtask": "coding", "pred_path": "../toy-data/pred-coding.tsv"}
+    {"subtask": "coding", "predictions": "cc_onco1\\t8041/3\\n..."}
+
+Responses:
+    {"pred_path": ..., "P": ..., "R": ..., "F1": ..., "per_case": {case: {"P": ..., "R": ..., "F1": ...}}}
+    {"pred_path": ..., "MAP": ...}
+"""
+
+import argparse
+import io
+import json
+import os
+import socketserver
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cantemist_coding
+import cantemist_ner_norm
+import results_output
+import valid_codes as vc
+
+# Loopback only: clients choose the files that are read
+HOST = '127.0.0.1'
+
+def warning_on_one_line(message, category, filename, lineno, file=None, line=None):
+    return '%s:%s: %s: %s\n' % (filename, lineno, category.__name__, message)
+warnings.formatwarning = warning_on_one_line
+
+
+class Evaluator:
+    '''
+    Gold Standard data of all subtasks, loaded once. Its attributes are not
+    modified after __init__.
+    '''
+
+    def __init__(self, gs_path=None, gs_coding_path=None, codes_path=None):
+        self.valid_codes = None
+        if codes_path is not None:
+            self.valid_codes = vc.load_valid_codes(codes_path)
+
+        self.gs = {}
+        if gs_path is not None:
+            for subtask in ['ner', 'norm']:
+                self.gs[subtask] = cantemist_ner_norm.load_gs(gs_path, subtask)
+        if gs_coding_path is not None:
+            if self.valid_codes is None:
+                raise Exception('The valid codes are needed for subtask coding')
+            self.gs['coding'] = cantemist_coding.format_gs(gs_coding_path)
+
+    def evaluate(self, request):
+        '''
+        Score one request.
+
+        Parameters
+        ----------
+        request : dict
+            'subtask' and one of 'pred_path', 'annotations' (NER, NORM;
+            dict file name -> .ann content) or 'predictions' (CODING; TSV
+            content).
+
+        Returns
+        -------
+        response : dict
+            Metrics of the request.
+
+        '''
+        subtask = request.get('subtask')
+        if subtask not in self.gs:
+            raise ValueError('Subtask {} is not loaded in this server'.format(subtask))
+        pred_path = request.get('pred_path')
+
+        if subtask == 'coding':
+            gs, qid_gs = self.gs['coding']
+            if 'predictions' in request:
+                source = io.StringIO(request['predictions'])
+            elif pred_path is not None:
+                source = pred_path
+            else:
+                raise ValueError('Missing pred_path or predictions')
+            pred = cantemist_coding.format_predictions(source, self.valid_codes,
+                                                       qid_gs)
+            return {'pred_path': pred_path,
+                    'MAP': results_output.to_json_number(cantemist_coding.compute_map(gs, pred))}
+
+        gs, ann_list_gs = self.gs[subtask]
+        if 'annotations' in request:
+            pred = cantemist_ner_norm.load_predictions_from_texts(request['annotations'],
+                                                                  subtask)
+        elif pred_path is not None:
+            pred = cantemist_ner_norm.load_predictions(pred_path, subtask)
+        else:
+            raise ValueError('Missing pred_path or annotations')
+        valid_codes = self.valid_codes if subtask == 'norm' else None
+        P_per_cc, P, R_per_cc, R, F1_per_cc, F1 = \
+            cantemist_ner_norm.evaluate(gs, ann_list_gs, pred, subtask, valid_codes)
+
+        per_case = results_output.per_case_dict(results_output.per_case_table(
+            {'P': P_per_cc, 'R': R_per_cc, 'F1': F1_per_cc}))
+        return {'pred_path': pred_path, 'P': results_output.to_json_number(P),
+                'R': results_output.to_json_number(R),
+                'F1': results_output.to_json_number(F1),
+                'per_case': per_case}
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+
+    evaluator = None
+
+    def do_GET(self):
+        if self.path != '/health':
+            self.send_json(404, {'error': 'Not found'})
+            return
+        self.send_json(200, {'status': 'ok', 'subtasks': sorted(self.evaluator.gs)})
+
+    def do_POST(self):
+        if self.path != '/evaluate':
+            self.send_json(404, {'error': 'Not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+            response = self.evaluator.evaluate(request)
+        except Exception as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        self.send_json(200, response)
+
+    def send_json(self, status, content):
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        socketserver.ThreadingUnixStreamServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+
+def serve(evaluator, port=8000, socket_path=None):
+    '''
+    Serve requests until interrupted, on a localhost port or on a Unix
+    socket. Requests can name any file to score (pred_path), so the server
+    only listens on the loopback interface.
+    '''
+    handler = type('Handler', (RequestHandler,), {'evaluator': evaluator})
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path, handler)
+        print('Serving on unix socket {}'.format(socket_path))
+    else:
+        server = ThreadingHTTPServer((HOST, port), handler)
+        print('Serving on http://{}:{}'.format(HOST, server.server_port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path is not None:
+            os.remove(socket_path)
+
+
+def parse_arguments():
+    '''
+    DESCRIPTION: Parse command line arguments
+    '''
+
+    parser = argparse.ArgumentParser(description='evaluation server')
+    parser.add_argument("-g", "--gs_path", required = False, dest = "gs_path",
+                        help = "path to GS directory with .ann files or GS store (NER and NORM)")
+    parser.add_argument("-t", "--gs_coding_path", required = False,
+                        dest = "gs_coding_path", help = "path to GS TSV file (CODING)")
+    parser.add_argument("-c", "--valid_codes_path", required = False,
+                        dest = "codes_path", help = "path to valid codes TSV")
+    parser.add_argument("--port", required = False, default = 8000, type = int,
+                        dest = "port", help = "port to listen on")
+    parser.add_argument("--socket", required = False, dest = "socket_path",
+                        help = "listen on this Unix socket instead of a port")
+
+    args = parser.parse_args()
+    if (args.gs_path is None) & (args.gs_coding_path is None):
+        parser.error('at least one of -g and -t is required')
+
+    return args
+
+
+if __name__ == '__main__':
+
+    args = parse_arguments()
+    evaluator = Evaluator(args.gs_path, args.gs_coding_path, args.codes_path)
+    serve(evaluator, port=args.port, socket_path=args.socket_path)
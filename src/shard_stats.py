@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Mergeable sufficient statistics for sharded scoring.
+
+A corpus can be split into shards of clinical cases, each shard holding
+the GS and the predictions of its own cases. Every shard is scored on its
+own with --stats FILE, which writes the statistics below instead of the
+results. The shard files are then merged into the global micro metrics
+and per clinical case tables, the same ones that scoring the whole corpus
+at once gives:
+
+    python shard_stats.py shard-*.npz [--format json] [-o results.json]
+
+Statistics per clinical case:
+    ner, norm  TP, Pred_Pos, GS_Pos (cantemist_ner_norm.count_cases)
+    comp_f1    TP, Pred_Pos, GS_Pos (comp_f1_diag_proc.count_codes)
+    coding     AP of every clinical case with predictions (MAP is their
+               mean; its value may differ from an unsharded run in the
+               last floating point digits, because sums are done in
+               another order)
+
+Shard files are NumPy .npz files, one integer or float array per
+statistic. Shards must not share clinical cases, because their
+statistics could not be added. Merging raises an exception if they do,
+or if the shards were scored for different subtasks or matching modes.
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import results_output
+
+STATS_VERSION = 3
+COLUMNS = {'ner': ['TP', 'Pred_Pos', 'GS_Pos'],
+           'norm': ['TP', 'Pred_Pos', 'GS_Pos'],
+           'comp_f1': ['TP', 'Pred_Pos', 'GS_Pos'],
+           'coding': ['AP']}
+
+
+def write_stats(stats_path, subtask, table, match='strict'):
+    '''
+    Write the sufficient statistics of one shard.
+
+    Parameters
+    ----------
+    stats_path : str
+        Path to the output .npz file.
+    subtask : str
+        'ner', 'norm', 'comp_f1' or 'coding'.
+    table : pandas DataFrame
+        One row per clinical case (index), with columns COLUMNS[subtask].
+    match : str
+        Matching mode of subtasks ner and norm ('strict' or 'lenient').
+
+    Returns
+    -------
+    None.
+
+    '''
+    if subtask not in COLUMNS:
+        raise Exception('Error! Subtask name not properly set up')
+    arrays = {'version': np.array(STATS_VERSION),
+              'subtask': np.array(subtask),
+              'match': np.array(match if subtask in ['ner', 'norm'] else ''),
+              'clinical_case': np.array(table.index.astype(str), dtype=str)}
+    for column in COLUMNS[subtask]:
+        arrays[column] = table[column].to_numpy()
+
+    with open(stats_path, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+
+
+def read_stats(stats_path):
+    '''
+    Read the sufficient statistics of one shard.
+
+    Returns
+    -------
+    subtask : str
+    match : str
+        '' for subtasks comp_f1 and coding.
+    table : pandas DataFrame
+        Same as the table given to write_stats.
+
+    '''
+    with np.load(stats_path, allow_pickle=False) as stats:
+        if int(stats['version']) != STATS_VERSION:
+            raise Exception('The statistics file {} was created with '.format(stats_path) +
+                            'another version. Score the shard again.')
+        subtask = str(stats['subtask'])
+        match = str(stats['match'])
+        index = pd.Index(stats['clinical_case'].astype(object), name='clinical_case')
+        table = pd.DataFrame({column: stats[column] for column in COLUMNS[subtask]},
+                             index=index)
+
+    return subtask, match, table
+
+
+def merge_stats(stats_paths):
+    '''
+    Merge the statistics of several shards.
+
+    Returns
+    -------
+    subtask : str
+    match : str
+    table : pandas DataFrame
+        Rows of all shards, sorted by clinical case.
+
+    '''
+    if len(stats_paths) == 0:
+        raise Exception('There are not statistics files to merge')
+    tables = []
+    for stats_path in stats_paths:
+        subtask, match, table = read_stats(stats_path)
+        if len(tables) == 0:
+            first = (subtask, match)
+        elif (subtask, match) != first:
+            raise Exception('{} was scored with subtask {} and matching '.format(stats_path, subtask) +
+                            '"{}", the first shard with subtask {} '.format(match, first[0]) +
+                            'and matching "{}"'.format(first[1]))
+        tables.append(table)
+
+    table = pd.concat(tables)
+    duplicated = table.index[table.index.duplicated()].unique()
+    if len(duplicated) > 0:
+        raise Exception('{} clinical cases are in more than one shard '.format(len(duplicated)) +
+                        '(e.g. {}). Shards must not share clinical cases.'.format(duplicated[0]))
+
+    return first[0], first[1], table.sort_index()
+
+
+def compute_metrics(subtask, table):
+    '''
+    Metrics of merged statistics.
+
+    Returns
+    -------
+    Same as cantemist_ner_norm.metrics_from_counts (ner, norm) and
+    comp_f1_diag_proc.metrics_from_counts (comp_f1). For coding, MAP and the
+    Average Precision per clinical case.
+
+    '''
+    # Subtask modules are imported here, as in main.py
+    if subtask in ['ner', 'norm']:
+        import cantemist_ner_norm
+        return cantemist_ner_norm.metrics_from_counts(table)
+    if subtask == 'comp_f1':
+        import comp_f1_diag_proc
+        return comp_f1_diag_proc.metrics_from_counts(
+            table.loc[table['GS_Pos'] > 0, 'GS_Pos'], table['TP'],
+            table.loc[table['Pred_Pos'] > 0, 'Pred_Pos'])
+    if subtask == 'coding':
+        MAP = table['AP'].sum() / table.shape[0] if table.shape[0] > 0 else 0.0
+        return MAP, table['AP']
+    raise Exception('Error! Subtask name not properly set up')
+
+
+def main(stats_paths, fmt='text', output_path=None, summary_only=False,
+         name='merged'):
+    '''
+    Merge shard statistics and show the global results, in the same
+    formats as the subtask scripts.
+
+    Parameters
+    ----------
+    stats_paths : list
+        Paths to the statistics files of the shards.
+    fmt : str
+        Output format: 'text', 'json', 'csv' or 'tsv'.
+    output_path : str
+        If given, results are written to this file instead of stdout.
+    summary_only : bool
+        whether to leave out the per clinical case results.
+    name : str
+        Name shown instead of the predictions path.
+
+    Returns
+    -------
+    None.
+
+    '''
+    subtask, match, table = merge_stats(stats_paths)
+    results = compute_metrics(subtask, table)
+
+    if subtask == 'coding':
+        MAP, AP_per_cc = results
+        if fmt == 'text':
+            import cantemist_coding
+            content = cantemist_coding.format_text(name, MAP)
+        else:
+            per_cc = None if summary_only else {'AP': AP_per_cc}
+            content = results_output.format_results(name, {'MAP': MAP}, per_cc, fmt=fmt)
+    elif fmt == 'text':
+        if subtask == 'comp_f1':
+            import comp_f1_diag_proc as subtask_module
+        else:
+            import cantemist_ner_norm as subtask_module
+        content = subtask_module.format_text(name, *results, summary_only=summary_only)
+    else:
+        P_per_cc, P, R_per_cc, R, F1_per_cc, F1 = results
+        per_cc = None if summary_only else {'P': P_per_cc, 'R': R_per_cc,
+                                            'F1': F1_per_cc}
+        content = results_output.format_results(name, {'P': P, 'R': R, 'F1': F1},
+                                                per_cc, fmt=fmt)
+    results_output.write_output(content, output_path)
+
+
+def parse_arguments():
+    '''
+    DESCRIPTION: Parse command line arguments
+    '''
+
+    parser = argparse.ArgumentParser(description='merge the statistics of scored shards')
+    parser.add_argument('stats_paths', nargs='+',
+                        help='statistics files written with --stats')
+    parser.add_argument('--format', required = False, default = 'text',
+                        choices = results_output.FORMATS, dest = 'fmt',
+                        help = 'output format (default: text tables)')
+    parser.add_argument('-o', '--output', required = False, default = None,
+                        dest = 'output_path', help = 'write results to this file')
+    parser.add_argument('--summary-only', required = False, default = False,
+                        action = 'store_true', dest = 'summary_only',
+                        help = 'only output the micro-averages')
+    parser.add_argument('-n', '--name', required = False, default = 'merged',
+                        dest = 'name', help = 'name shown instead of the predictions path')
+
+    args = parser.parse_args()
+
+    return (args.stats_paths, args.fmt, args.output_path, args.summary_only,
+            args.name)
+
+
+if __name__ == '__main__':
+
+    stats_paths, fmt, output_path, summary_only, name = parse_arguments()
+    main(stats_paths, fmt=fmt, output_path=output_path, summary_only=summary_only,
+         name=name)
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bootstrap confidence intervals and paired significance tests of runs,
+from their sufficient statistics (--stats files, see shard_stats.py).
+
+Clinical cases are the resampling unit:
+    bootstrap       the clinical cases of a run are resampled with
+                    replacement, and the percentile interval of every
+                    metric is reported.
+    randomization   paired approximate randomization test between two
+                    runs: the statistics of every clinical case are
+                    swapped between the runs at random, and the p-value is
+                    the fraction of shuffles with an absolute metric
+                    difference at least as large as the observed one.
+Metrics are computed from the column sums of the statistics (micro P, R
+and F1 from TP, Pred_Pos and GS_Pos; MAP from the AP of the clinical
+cases with predictions). Resamples are built as matrices in blocks of
+rows: bootstrap weights come from one bincount of a matrix of random case
+indices, and all sums are matrix products with the statistics.
+
+Usage:
+    python main.py -g ../gs-data/ -p run-a/ -s norm --stats run-a.npz
+    python main.py -g ../gs-data/ -p run-b/ -s norm --stats run-b.npz
+    python significance.py -a run-a.npz -b run-b.npz -n 10000
+"""
+
+import argparse
+import json
+
+import numpy as np
+
+import results_output
+import shard_stats
+
+RESAMPLES = 10000
+ALPHA = 0.05
+# Elements of the resample matrices built at once
+BLOCK_ELEMENTS = 1 << 22
+
+
+def statistics_matrix(subtask, table):
+    '''
+    Matrix with one row per clinical case and one column per statistic
+    that is summed: TP, Pred_Pos and GS_Pos (ner, norm, comp_f1) or AP and
+    a column of ones (coding; MAP is averaged over the clinical cases in
+    the table).
+    '''
+    if subtask == 'coding':
+        return np.column_stack([table['AP'].to_numpy(dtype=float),
+                                np.ones(table.shape[0])])
+    return table[['TP', 'Pred_Pos', 'GS_Pos']].to_numpy(dtype=float)
+
+
+def metrics_from_sums(subtask, sums):
+    '''
+    Metrics of every row of a matrix of column sums of statistics_matrix.
+
+    Returns
+    -------
+    metrics : dict
+        Metric name -> array with one value per row (NaN if not defined).
+
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if subtask == 'coding':
+            return {'MAP': np.where(sums[:, 1] > 0, sums[:, 0] / sums[:, 1], 0.0)}
+        TP, Pred_Pos, GS_Pos = sums[:, 0], sums[:, 1], sums[:, 2]
+        return {'P': TP / Pred_Pos, 'R': TP / GS_Pos,
+                'F1': 2 * TP / (Pred_Pos + GS_Pos)}
+
+
+def block_sizes(n_resamples, n_cases):
+    '''
+    Number of resamples of every block, so that a block has about
+    BLOCK_ELEMENTS elements.
+    '''
+    size = max(1, BLOCK_ELEMENTS // max(n_cases, 1))
+    return [min(size, n_resamples - start) for start in range(0, n_resamples, size)]
+
+
+def bootstrap(subtask, table, n_resamples=RESAMPLES, alpha=ALPHA, seed=0):
+    '''
+    Bootstrap confidence intervals of the metrics of one run.
+
+    Parameters
+    ----------
+    subtask : str
+        'ner', 'norm', 'comp_f1' or 'coding'.
+    table : pandas DataFrame
+        Statistics per clinical case (shard_stats.read_stats).
+    n_resamples : int
+        Number of bootstrap resamples.
+    alpha : float
+        The intervals have confidence level 1 - alpha.
+    seed : int
+        Seed of the random generator.
+
+    Returns
+    -------
+    intervals : dict
+        Metric name -> (lower bound, upper bound).
+
+    '''
+    rng = np.random.default_rng(seed)
+    X = statistics_matrix(subtask, table)
+    n = X.shape[0]
+    samples = []
+    for size in block_sizes(n_resamples, n):
+        # Times every clinical case is drawn, in every resample of the block
+        idx = rng.integers(0, n, size=(size, n)) + (np.arange(size) * n)[:, None]
+        weights = np.bincount(idx.ravel(), minlength=size * n).reshape(size, n)
+        samples.append(weights @ X)
+    metrics = metrics_from_sums(subtask, np.concatenate(samples))
+
+    return {name: tuple(np.nanpercentile(values, [100 * alpha / 2, 100 * (1 - alpha / 2)]))
+            for name, values in metrics.items()}
+
+
+def randomization_test(subtask, table_a, table_b, n_resamples=RESAMPLES, seed=0):
+    '''
+    Paired approximate randomization test between two runs scored on the
+    same GS.
+
+    Parameters
+    ----------
+    subtask : str
+        'ner', 'norm', 'comp_f1' or 'coding'.
+    table_a, table_b : pandas DataFrame
+        Statistics per clinical case of both runs. Clinical cases missing
+        from one run have zero statistics in it.
+    n_resamples : int
+        Number of shuffles.
+    seed : int
+        Seed of the random generator.
+
+    Returns
+    -------
+    tests : dict
+        Metric name -> (difference b - a, p-value).
+
+    '''
+    cases = table_a.index.union(table_b.index)
+    X_a = statistics_matrix(subtask, table_a.reindex(cases, fill_value=0))
+    X_b = statistics_matrix(subtask, table_b.reindex(cases, fill_value=0))
+    if subtask == 'coding':
+        # Clinical cases without predictions do not count for MAP
+        X_a[:, 1] = cases.isin(table_a.index)
+        X_b[:, 1] = cases.isin(table_b.index)
+    elif (X_a[:, 2] != X_b[:, 2]).any():
+        raise Exception('The runs were not scored against the same Gold Standard')
+
+    sum_a, sum_b = X_a.sum(axis=0), X_b.sum(axis=0)
+    observed = {name: values[1] - values[0] for name, values in
+                metrics_from_sums(subtask, np.vstack([sum_a, sum_b])).items()}
+    difference = X_b - X_a
+    rng = np.random.default_rng(seed)
+    n = X_a.shape[0]
+    extreme = dict.fromkeys(observed, 0)
+    for size in block_sizes(n_resamples, n):
+        # Clinical cases whose statistics are swapped, in every shuffle
+        swapped = rng.integers(0, 2, size=(size, n)).astype(float)
+        shift = swapped @ difference
+        shuffled_a = metrics_from_sums(subtask, sum_a + shift)
+        shuffled_b = metrics_from_sums(subtask, sum_b - shift)
+        for name, diff in observed.items():
+            extreme[name] += int((np.abs(shuffled_b[name] - shuffled_a[name]) >=
+                                  abs(diff) - 1e-12).sum())
+
+    return {name: (diff, (extreme[name] + 1) / (n_resamples + 1))
+            for name, diff in observed.items()}
+
+
+def main(paths_a, paths_b=None, n_resamples=RESAMPLES, alpha=ALPHA, seed=0,
+         fmt='text', output_path=None):
+    '''
+    Show the metrics and bootstrap confidence intervals of one or two runs
+    and, with two runs, the paired randomization tests.
+
+    Parameters
+    ----------
+    paths_a, paths_b : list
+        Statistics files of every run (several files of one run are its
+        shards, see shard_stats.py).
+    n_resamples : int
+        Number of bootstrap resamples and of shuffles.
+    alpha : float
+        Confidence level of the intervals is 1 - alpha.
+    seed : int
+        Seed of the random generators.
+    fmt : str
+        'text' or 'json'.
+    output_path : str
+        If given, results are written to this file instead of stdout.
+
+    Returns
+    -------
+    None.
+
+    '''
+    runs = [('a', paths_a)] + ([('b', paths_b)] if paths_b else [])
+    content = {'resamples': n_resamples, 'alpha': alpha}
+    tables = []
+    for name, paths in runs:
+        subtask, match, table = shard_stats.merge_stats(paths)
+        if tables and ((subtask, match) != tables[0][:2]):
+            raise Exception('Runs a and b were scored with different subtasks ' +
+                            'or matching modes')
+        tables.append((subtask, match, table))
+        metrics = metrics_from_sums(subtask, statistics_matrix(subtask, table)
+                                    .sum(axis=0)[None, :])
+        intervals = bootstrap(subtask, table, n_resamples=n_resamples,
+                              alpha=alpha, seed=seed)
+        content[name] = {'stats_paths': paths, 'n_cases': table.shape[0]}
+        content[name].update({metric: {'value': float(values[0]),
+                                       'ci': [float(bound) for bound in intervals[metric]]}
+                              for metric, values in metrics.items()})
+    content['subtask'] = tables[0][0]
+    if len(tables) == 2:
+        tests = randomization_test(tables[0][0], tables[0][2], tables[1][2],
+                                   n_resamples=n_resamples, seed=seed)
+        content['randomization'] = {metric: {'difference': float(diff),
+                                             'p_value': p_value}
+                                    for metric, (diff, p_value) in tests.items()}
+
+    if fmt == 'json':
+        text = json.dumps(content, indent=1) + '\n'
+    else:
+        text = format_text(content, [name for name, _ in runs])
+    results_output.write_output(text, output_path)
+
+
+def format_text(content, names):
+    '''
+    Build the text output of main.
+    '''
+    confidence = round(100 * (1 - content['alpha']), 3)
+    lines = []
+    for name in names:
+        run = content[name]
+        lines.append('Run {} ({}; {} clinical cases)'.format(name, ', '.join(run['stats_paths']),
+                                                               run['n_cases']))
+        for metric, result in run.items():
+            if isinstance(result, dict):
+                lines.append('\t{} = {} ({}% CI {} - {})'.format(
+                    metric, round(result['value'], 3), confidence,
+                    round(result['ci'][0], 3), round(result['ci'][1], 3)))
+    if 'randomization' in content:
+        lines.append('Paired approximate randomization test, {} shuffles (b - a)'.format(
+            content['resamples']))
+        for metric, result in content['randomization'].items():
+            lines.append('\t{} difference = {} (p = {})'.format(
+                metric, round(result['difference'], 4), round(result['p_value'], 4)))
+
+    return '\n'.join(lines) + '\n'
+
+
+def parse_arguments():
+    '''
+    DESCRIPTION: Parse command line arguments
+    '''
+
+    parser = argparse.ArgumentParser(description='confidence intervals and ' +
+                                     'significance tests of runs')
+    parser.add_argument('-a', required = True, nargs = '+', dest = 'paths_a',
+                        help = 'statistics files (--stats) of run a')
+    parser.add_argument('-b', required = False, default = None, nargs = '+',
+                        dest = 'paths_b',
+                        help = 'statistics files (--stats) of run b, compared with run a')
+    parser.add_argument('-n', '--resamples', required = False, default = RESAMPLES,
+                        type = int, dest = 'n_resamples',
+                        help = 'number of bootstrap resamples and of shuffles ' +
+                        '(default: {})'.format(RESAMPLES))
+    parser.add_argument('--alpha', required = False, default = ALPHA, type = float,
+                        dest = 'alpha', help = 'confidence level is 1 - alpha ' +
+                        '(default: {})'.format(ALPHA))
+    parser.add_argument('--seed', required = False, default = 0, type = int,
+                        dest = 'seed', help = 'seed of the random generators')
+    parser.add_argument('--format', required = False, default = 'text',
+                        choices = ['text', 'json'], dest = 'fmt',
+                        help = 'output format (default: text)')
+    parser.add_argument('-o', '--output', required = False, default = None,
+                        dest = 'output_path', help = 'write results to this file')
+
+    args = parser.parse_args()
+
+    return (args.paths_a, args.paths_b, args.n_resamples, args.alpha, args.seed,
+            args.fmt, args.output_path)
+
+
+if __name__ == '__main__':
+
+    paths_a, paths_b, n_resamples, alpha, seed, fmt, output_path = parse_arguments()
+    main(paths_a, paths_b, n_resamples=n_resamples, alpha=alpha, seed=seed,
+         fmt=fmt, output_path=output_path)
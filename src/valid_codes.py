@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compiled index of the valid codes TSV.
+
+The first column of the TSV is lowercased, deduplicated and sorted once,
+and stored next to it as a NumPy array of fixed-width strings
+(<codes_path>.codes.idx, an .npy file). It is loaded with mmap_mode='r',
+so loading takes about a millisecond whatever the number of codes, and
+codes are looked up with a binary search (np.searchsorted, see isin and
+contains).
+
+A one-line header file (<codes_path>.idx) records the size, modification
+time and SHA-1 hash of the TSV and the number of codes, so the index is
+rebuilt automatically when the TSV changes. A missing, corrupt or
+truncated index is rebuilt as well.
+"""
+
+import hashlib
+import os
+import tempfile
+import warnings
+
+import numpy as np
+import pandas as pd
+
+INDEX_SUFFIX = '.idx'
+CODES_SUFFIX = '.codes.idx'
+INDEX_MAGIC = 'cantemist-valid-codes-index-v2'
+
+def warning_on_one_line(message, category, filename, lineno, file=None, line=None):
+    return '%s:%s: %s: %s\n' % (filename, lineno, category.__name__, message)
+warnings.formatwarning = warning_on_one_line
+
+
+def load_valid_codes(codes_path, use_index=True):
+    '''
+    Load the valid codes (lowercased).
+
+    Parameters
+    ----------
+    codes_path : str
+        Path to TSV file with valid codes. Codes are in the first column.
+        It has no headers row.
+    use_index : bool
+        whether to read (and, if needed, build) the compiled index stored
+        next to codes_path.
+
+    Returns
+    -------
+    valid_codes : numpy array
+        Sorted, unique lowercased valid codes (fixed-width strings,
+        memory-mapped if read from the index). Look codes up with isin or
+        contains.
+
+    '''
+    if use_index == False:
+        return codes_array(read_codes_tsv(codes_path))
+
+    index_path = codes_path + INDEX_SUFFIX
+    array_path = codes_path + CODES_SUFFIX
+    stat = os.stat(codes_path)
+    header = read_header(index_path)
+
+    if header is not None:
+        size, mtime, sha1, n_codes = header
+        fresh = (size == stat.st_size) & (mtime == stat.st_mtime_ns)
+        # Touched but maybe not modified: compare contents
+        if fresh or (sha1 == file_sha1(codes_path)):
+            codes = read_codes_array(array_path, n_codes)
+            if codes is not None:
+                if fresh == False:
+                    write_header(index_path, stat, sha1, n_codes)
+                return codes
+
+    codes = codes_array(read_codes_tsv(codes_path))
+    write_index(index_path, array_path, codes, stat, file_sha1(codes_path))
+
+    return codes
+
+
+def codes_array(codes):
+    '''
+    Sorted array of the unique codes (fixed-width strings).
+    '''
+    codes = sorted(set(codes))
+    width = max([len(code) for code in codes], default=1)
+    return np.array(codes, dtype='U{}'.format(width))
+
+
+def isin(codes, valid_codes):
+    '''
+    Whether every code is a valid code.
+
+    Parameters
+    ----------
+    codes : array-like
+        Lowercased codes (e.g. a pandas Series). Missing values are not
+        valid.
+    valid_codes : numpy array
+        Output of load_valid_codes.
+
+    Returns
+    -------
+    mask : numpy array of bool
+
+    '''
+    # Look up the distinct codes only: there are few of them
+    ids, uniques = pd.factorize(np.asarray(codes, dtype=object))
+    if (len(valid_codes) == 0) | (len(uniques) == 0):
+        return np.zeros(len(ids), dtype=bool)
+    uniques = np.asarray(uniques, dtype=str)
+    pos = np.minimum(np.searchsorted(valid_codes, uniques), len(valid_codes) - 1)
+    found = np.append(valid_codes[pos] == uniques, False)
+    # Missing values (ids == -1) are not valid
+    return found[ids]
+
+
+def contains(valid_codes, code):
+    '''
+    Whether one (lowercased) code is a valid code.
+    '''
+    pos = np.searchsorted(valid_codes, code)
+    return bool((pos < len(valid_codes)) and (valid_codes[pos] == code))
+
+
+def read_codes_tsv(codes_path):
+    '''
+    Read the first column of the valid codes TSV, lowercased.
+    '''
+    with open(codes_path) as f:
+        return [line.rstrip('\r\n').split('\t', 1)[0].lower()
+                for line in f if line.strip() != '']
+
+
+def read_header(index_path):
+    '''
+    Read the header of a compiled index.
+
+    Returns
+    -------
+    header : tuple or None
+        (size, mtime_ns, sha1, n_codes) of the TSV the index was built
+        from. None if the header does not exist or is not valid.
+
+    '''
+    try:
+        with open(index_path) as f:
+            fields = f.read().rstrip('\n').split('\t')
+    except (OSError, UnicodeDecodeError):
+        return None
+
+    if (len(fields) != 5) or (fields[0] != INDEX_MAGIC):
+        return None
+    try:
+        return int(fields[1]), int(fields[2]), fields[3], int(fields[4])
+    except ValueError:
+        return None
+
+
+def read_codes_array(array_path, n_codes):
+    '''
+    Memory-map the codes array of a compiled index. None if it does not
+    exist, is corrupt or does not have n_codes codes.
+    '''
+    try:
+        codes = np.load(array_path, mmap_mode='r', allow_pickle=False)
+    except (OSError, ValueError, EOFError):
+        return None
+    if (codes.ndim != 1) or (codes.dtype.kind != 'U') or (codes.shape[0] != n_codes):
+        return None
+    return codes
+
+
+def write_index(index_path, array_path, codes, stat, sha1):
+    '''
+    Atomically write a compiled index: the codes array first, then the
+    header that validates it. If the directory is not writable, the index
+    is just not stored.
+    '''
+    if write_atomic(array_path, lambda f: np.save(f, codes, allow_pickle=False), 'wb'):
+        write_header(index_path, stat, sha1, len(codes))
+
+
+def write_header(index_path, stat, sha1, n_codes):
+    header = '\t'.join([INDEX_MAGIC, str(stat.st_size), str(stat.st_mtime_ns),
+                        sha1, str(n_codes)])
+    write_atomic(index_path, lambda f: f.write(header + '\n'), 'w')
+
+
+def write_atomic(path, write, mode):
+    '''
+    Write a file through a temporary file and os.replace. Returns whether
+    it was written.
+    '''
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                        prefix='.valid-codes-', suffix='.tmp')
+        with os.fdopen(fd, mode) as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except OSError:
+        if (tmp_path is not None) and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        warnings.warn('Valid codes index could not be written to {}'.format(path))
+        return False
+    return True
+
+
+def file_sha1(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fast linter of submissions: .ann directories (subtasks NER and NORM) and
+coding TSV files (subtask CODING), to reject bad ones before scoring.
+
+Every problem is reported as one line, path:line: level: message, and
+checking goes on after it. Levels:
+    error    the evaluator skips the file or fails to read it (wrong
+             number of tabs, discontinuous or malformed offsets, malformed
+             relations, wrong TSV columns), or, in subtask NORM, an
+             AnnotatorNotes line is malformed or refers to a missing
+             annotation.
+    warning  the line is read but ignored or not scored (unknown labels,
+             relations that refer to missing annotations, malformed or
+             orphan AnnotatorNotes in subtask NER, annotations without code
+             in subtask NORM, codes missing from the valid codes TSV, text
+             spans that do not match the .txt file next to the .ann file,
+             offsets that do not end after their start).
+Files are checked line by line, without pandas or NumPy, by a pool of
+worker processes (-j). Valid codes are read into a set. The exit status is
+1 if there are errors.
+
+Usage:
+    python validate.py -p submission/ -s norm -c ../valid-codes.tsv -j 4
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+# Same as cantemist_ner_norm.PRED_LABELS (not imported: it needs pandas)
+LABELS = ['MORFOLOGIA_NEOPLASIA', 'MORFOLOGIA-NEOPLASIA']
+ERROR = 'error'
+WARNING = 'warning'
+
+
+def main(pred_paths, subtask, codes_path=None, jobs=1, labels=LABELS):
+    '''
+    Check submissions.
+
+    Parameters
+    ----------
+    pred_paths : list
+        Paths to directories with .ann files (subtasks ner and norm) or to
+        TSV files (subtask coding).
+    subtask : str
+        Subtask name
+    codes_path : str
+        Path to TSV file with valid codes. If None, codes are not checked.
+    jobs : int
+        Number of worker processes.
+    labels : list
+        Annotation labels that are evaluated.
+
+    Returns
+    -------
+    problems : list of tuples
+        (path, line number, level, message), in file and line order.
+    n_files : int
+        Number of checked files.
+
+    '''
+    if subtask not in ['ner', 'norm', 'coding']:
+        raise Exception('Error! Subtask name not properly set up')
+    valid_codes = None
+    if (subtask != 'ner') & (codes_path is not None):
+        valid_codes = read_valid_codes(codes_path)
+
+    paths = []
+    for pred_path in pred_paths:
+        if subtask == 'coding':
+            paths.append(pred_path)
+        else:
+            paths.extend(list_ann_files(pred_path))
+    if subtask == 'coding':
+        check = partial(check_chunk, check_file=check_tsv, valid_codes=valid_codes)
+    else:
+        check = partial(check_chunk, check_file=check_ann, valid_codes=valid_codes,
+                        subtask=subtask, labels=set(labels))
+
+    if (jobs > 1) & (len(paths) > 1):
+        n_chunks = min(len(paths), jobs * 4)
+        chunk_size = -(-len(paths) // n_chunks)
+        chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+        problems = []
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            for chunk_problems in executor.map(check, chunks):
+                problems.extend(chunk_problems)
+    else:
+        problems = check(paths)
+
+    return problems, len(paths)
+
+
+def read_valid_codes(codes_path):
+    '''
+    Set of the valid codes (first column of the TSV, lowercased). Same as
+    valid_codes.read_codes_tsv (not imported: it needs pandas).
+    '''
+    with open(codes_path) as f:
+        return {line.rstrip('\r\n').split('\t', 1)[0].lower()
+                for line in f if line.strip() != ''}
+
+
+def list_ann_files(datapath):
+    '''
+    Paths of the .ann files in datapath and its subdirectories, sorted.
+    '''
+    if os.path.isfile(datapath):
+        return [datapath]
+    paths = []
+    for root, dirs, files in os.walk(datapath):
+        dirs.sort()
+        paths.extend(os.path.join(root, filename) for filename in sorted(files)
+                     if filename[-3:] == 'ann')
+    return paths
+
+
+def check_chunk(paths, check_file, **kwargs):
+    problems = []
+    for path in paths:
+        try:
+            problems.extend(check_file(path, **kwargs))
+        except (OSError, UnicodeDecodeError) as e:
+            problems.append((path, 0, ERROR, 'cannot be read: {}'.format(e)))
+    return problems
+
+
+def check_ann(path, subtask='norm', labels=set(LABELS), valid_codes=None):
+    '''
+    Check one .ann file.
+
+    Returns
+    -------
+    problems : list of tuples
+        (path, line number, level, message)
+
+    '''
+    problems = []
+    marks = {}
+    evaluated = {}
+    notes = []
+    relations = []
+    text = read_text(path)
+
+    with open(path) as f:
+        for lineno, line in enumerate(f, 1):
+            splitted = line.split('\t')
+            if len(splitted) != 3:
+                problems.append((path, lineno, ERROR,
+                                 '{} tabular splits instead of 3 '.format(len(splitted)) +
+                                 '(the evaluator skips this file)'))
+                continue
+
+            kind = line[0]
+            if kind == 'T':
+                label, _, offset = splitted[1].partition(' ')
+                if splitted[0] in marks:
+                    problems.append((path, lineno, WARNING,
+                                     'mark {} already used in line {}'.format(splitted[0],
+                                                                             marks[splitted[0]])))
+                marks[splitted[0]] = lineno
+                if ';' in offset:
+                    problems.append((path, lineno, ERROR,
+                                     'discontinuous text span {} '.format(offset) +
+                                     '(the evaluator skips this file)'))
+                elif label not in labels:
+                    problems.append((path, lineno, WARNING,
+                                     'unknown label {} (ignored)'.format(label)))
+                else:
+                    evaluated[splitted[0]] = lineno
+                    problems.extend((path, lineno, level, message) for level, message in
+                                    check_offset(offset, splitted[2].strip(), text))
+            elif kind == '#':
+                args = splitted[1].split(' ')
+                if len(args) < 2:
+                    # Only subtask norm reads AnnotatorNotes
+                    if subtask == 'norm':
+                        problems.append((path, lineno, ERROR, 'AnnotatorNotes without ' +
+                                         'annotation mark (the evaluator fails)'))
+                    else:
+                        problems.append((path, lineno, WARNING, 'AnnotatorNotes without ' +
+                                         'annotation mark (ignored in subtask ner)'))
+                    continue
+                notes.append((lineno, args[1], splitted[2].strip()))
+            elif kind == 'R':
+                args = splitted[1].split(' ')
+                if (len(args) < 3) or (':' not in args[1]) or (':' not in args[2]):
+                    problems.append((path, lineno, ERROR, 'relation without two ' +
+                                     'Arg:mark arguments (the evaluator fails)'))
+                    continue
+                relations.append((lineno, [args[1].split(':')[1], args[2].split(':')[1]]))
+
+    ###### References between lines ######
+    coded = set()
+    for lineno, mark, code in notes:
+        if mark not in marks:
+            problems.append((path, lineno, ERROR if subtask == 'norm' else WARNING,
+                             'AnnotatorNotes of missing annotation {}'.format(mark)))
+            continue
+        coded.add(mark)
+        if (subtask == 'norm') & (valid_codes is not None):
+            if code.lower() not in valid_codes:
+                problems.append((path, lineno, WARNING,
+                                 'code {} not in the valid codes'.format(code)))
+    related = set()
+    for lineno, args in relations:
+        for mark in args:
+            related.add(mark)
+            if mark not in marks:
+                problems.append((path, lineno, WARNING,
+                                 'relation with missing annotation {}'.format(mark)))
+    if subtask == 'norm':
+        # Annotations in relations are ignored by the evaluator
+        for mark, lineno in evaluated.items():
+            if (mark not in coded) & (mark not in related):
+                problems.append((path, lineno, WARNING,
+                                 'annotation {} without AnnotatorNotes code '.format(mark) +
+                                 '(ignored in subtask norm)'))
+
+    problems.sort(key=lambda problem: problem[1])
+    return problems
+
+
+def check_offset(offset, span, text=None):
+    '''
+    Check the offsets of one continuous annotation ('start end') and, if
+    the text of the document is given, that they point to span.
+
+    Returns
+    -------
+    problems : list of tuples
+        (level, message)
+
+    '''
+    bounds = offset.split(' ')
+    if (len(bounds) != 2) or (bounds[0].isdigit() == False) or (bounds[1].isdigit() == False):
+        return [(ERROR, 'offset {} is not "start end" (the evaluator fails)'.format(offset))]
+    start, end = int(bounds[0]), int(bounds[1])
+    if start >= end:
+        return [(WARNING, 'offset {} does not end after its start'.format(offset))]
+    if text is None:
+        return []
+    if end > len(text):
+        return [(ERROR, 'offset {} is beyond the end of the .txt file'.format(offset))]
+    if text[start:end].strip() != span:
+        return [(WARNING, 'text span does not match the .txt file at {}'.format(offset))]
+    return []
+
+
+def read_text(ann_path):
+    '''
+    Text of the .txt file next to an .ann file, or None if there is none.
+    '''
+    txt_path = ann_path[:-3] + 'txt'
+    if os.path.isfile(txt_path) == False:
+        return None
+    with open(txt_path, newline='') as f:
+        return f.read()
+
+
+def check_tsv(path, valid_codes=None):
+    '''
+    Check one coding TSV (clinical case, code; no headers row).
+
+    Returns
+    -------
+    problems : list of tuples
+        (path, line number, level, message)
+
+    '''
+    problems = []
+    with open(path) as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.rstrip('\r\n')
+            if line == '':
+                continue
+            splitted = line.split('\t')
+            if len(splitted) != 2:
+                problems.append((path, lineno, ERROR,
+                                 '{} columns instead of 2'.format(len(splitted))))
+                continue
+            clinical_case, code = splitted
+            if (clinical_case == '') or (code == ''):
+                problems.append((path, lineno, ERROR, 'empty clinical case or code'))
+                continue
+            if (valid_codes is not None) and (code.lower() not in valid_codes):
+                problems.append((path, lineno, WARNING,
+                                 'code {} not in the valid codes (ignored)'.format(code)))
+    return problems
+
+
+def parse_arguments():
+    '''
+    DESCRIPTION: Parse command line arguments
+    '''
+    parser = argparse.ArgumentParser(description='check submission files before scoring')
+    parser.add_argument('-p', '--pred_path', required=True, dest='pred_path',
+                        nargs='+', help='directories with .ann files (ner, norm) ' +
+                        'or TSV files (coding)')
+    parser.add_argument('-s', '--subtask', required=True, dest='subtask',
+                        choices=['ner', 'norm', 'coding'], help='Subtask name')
+    parser.add_argument('-c', '--valid_codes_path', required=False,
+                        default='../valid-codes.tsv', dest='codes_path',
+                        help='path to valid codes TSV (not checked if it does not exist)')
+    parser.add_argument('-j', '--jobs', required=False, default=1, type=int,
+                        dest='jobs', help='number of worker processes')
+    parser.add_argument('--errors-only', required=False, default=False,
+                        action='store_true', dest='errors_only',
+                        help='do not report warnings')
+    args = parser.parse_args()
+
+    return (args.pred_path, args.subtask, args.codes_path, args.jobs,
+            args.errors_only)
+
+
+if __name__ == '__main__':
+
+    pred_paths, subtask, codes_path, jobs, errors_only = parse_arguments()
+    if os.path.isfile(codes_path) == False:
+        codes_path = None
+
+    problems, n_files = main(pred_paths, subtask, codes_path=codes_path, jobs=jobs)
+
+    n_errors = sum(1 for problem in problems if problem[2] == ERROR)
+    lines = ['{}:{}: {}: {}'.format(*problem) for problem in problems
+             if (errors_only == False) | (problem[2] == ERROR)]
+    if lines:
+        sys.stdout.write('\n'.join(lines) + '\n')
+    sys.stderr.write('{} files checked: {} errors, {} warnings\n'.format(
+        n_files, n_errors, len(problems) - n_errors))
+    sys.exit(1 if n_errors > 0 else 0)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures of the test suite. Tests import the modules of src/
+directly, as the scripts there do, and run the scripts from src/ with the
+toy data of the repository.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+GS_DIR = os.path.join(ROOT, 'gs-data')
+PRED_DIR = os.path.join(ROOT, 'toy-data')
+GS_CODING = os.path.join(GS_DIR, 'gs-coding.tsv')
+PRED_CODING = os.path.join(PRED_DIR, 'pred-coding.tsv')
+
+sys.path.insert(0, SRC)
+
+
+def run_script(script, *args):
+    '''
+    Run a script of src/ from src/ and return the finished process (stdout
+    and stderr as text).
+    '''
+    return subprocess.run([sys.executable, script] + [str(arg) for arg in args],
+                          cwd=SRC, capture_output=True, text=True)
+
+
+@pytest.fixture
+def codes_path(tmp_path):
+    '''
+    Copy of valid-codes.tsv, so that its compiled index is written to a
+    temporary directory.
+    '''
+    path = tmp_path / 'valid-codes.tsv'
+    shutil.copy(os.path.join(ROOT, 'valid-codes.tsv'), path)
+    return str(path)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Parsing of .ann files (ann_parsing.py).
+"""
+
+import ann_parsing
+from conftest import PRED_DIR
+
+LABELS = {'MORFOLOGIA_NEOPLASIA'}
+
+ANN = ('T1\tMORFOLOGIA_NEOPLASIA 0 9\tcarcinoma\n'
+       'T2\tMORFOLOGIA_NEOPLASIA 10 20\tmetástasis\n'
+       'T3\tOTHER 21 25\tcosa\n'
+       'T4\tMORFOLOGIA_NEOPLASIA 26 30\ttumor\n'
+       'R1\tRel Arg1:T4 Arg2:T3\t\n'
+       '#1\tAnnotatorNotes T1\t8010/3\n'
+       '#2\tAnnotatorNotes T4\t8000/1\n')
+
+
+def test_notes_relations_and_labels():
+    lines = ANN.splitlines(keepends=True)
+
+    assert ann_parsing.parse_ann_lines(lines, 'a.ann', LABELS) == [
+        ('a.ann', 'T1', 'MORFOLOGIA_NEOPLASIA', '0 9', 'carcinoma'),
+        ('a.ann', 'T2', 'MORFOLOGIA_NEOPLASIA', '10 20', 'metástasis'),
+        ('a.ann', 'T4', 'MORFOLOGIA_NEOPLASIA', '26 30', 'tumor')]
+    # Related annotations are ignored, and annotations without notes too
+    assert ann_parsing.parse_ann_lines(lines, 'a.ann', LABELS, ignore_related=True,
+                                       with_notes=True) == [
+        ('a.ann', 'T1', 'MORFOLOGIA_NEOPLASIA', '0 9', 'carcinoma', '8010/3')]
+
+
+def test_malformed_files_are_skipped(capsys):
+    assert ann_parsing.parse_ann_lines(['T1\tMORFOLOGIA_NEOPLASIA 0 3;5 9\tab cd\n'],
+                                       'a.ann', LABELS) == []
+    assert ann_parsing.parse_ann_lines(ANN.splitlines(keepends=True) + ['T9\tbad\n'],
+                                       'b.ann', LABELS) == []
+
+    out = capsys.readouterr().out.splitlines()
+    assert out[0].startswith('ERROR in a.ann. Text span with discontinuous annotation')
+    assert out[-1].startswith('. Skipping this file')
+
+
+def test_parse_ann_directory():
+    df = ann_parsing.parse_ann(PRED_DIR, LABELS, with_notes=True)
+
+    assert list(df.columns) == ['filename', 'mark', 'label', 'offset', 'span', 'code']
+    assert sorted(df['filename'].unique()) == ['cc_onco1.ann', 'cc_onco3.ann']
+    assert df.shape[0] == 13
+
+
+def test_parallel_parsing_is_the_same(tmp_path, capsys):
+    for i in range(12):
+        text = ANN if i % 3 else ANN + 'T9\tMORFOLOGIA_NEOPLASIA 0 3;5 9\tab cd\n'
+        (tmp_path / 'cc{:02d}.ann'.format(i)).write_text(text)
+
+    serial = ann_parsing.parse_ann(str(tmp_path), LABELS, with_notes=True)
+    serial_out = capsys.readouterr().out
+    parallel = ann_parsing.parse_ann(str(tmp_path), LABELS, with_notes=True, jobs=3)
+    parallel_out = capsys.readouterr().out
+
+    assert parallel.equals(serial)
+    # Error messages of the workers are printed by the parent, in file order
+    assert parallel_out == serial_out
+    assert parallel_out.count('ERROR') == 4
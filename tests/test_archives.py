@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+.ann corpora in zip or tar archives (archives.py).
+"""
+
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+import archives
+from conftest import GS_DIR, PRED_DIR, run_script
+
+
+def write_archive(archive_path, directory, top=None):
+    '''
+    Archive the .ann files of directory, inside the directory top if given,
+    with a macOS resource fork of each of them.
+    '''
+    names = sorted(name for name in os.listdir(directory) if name.endswith('.ann'))
+    arcnames = [name if top is None else top + '/' + name for name in names]
+    if archive_path.suffix == '.zip':
+        with zipfile.ZipFile(archive_path, 'w') as archive:
+            for name, arcname in zip(names, arcnames):
+                archive.write(os.path.join(directory, name), arcname)
+                archive.writestr('__MACOSX/._' + name, b'\x00\x05\x16\x07')
+    else:
+        with tarfile.open(archive_path, 'w:gz') as archive:
+            for name, arcname in zip(names, arcnames):
+                archive.add(os.path.join(directory, name), arcname)
+    return str(archive_path)
+
+
+def test_members(tmp_path):
+    archive_path = write_archive(tmp_path / 'gs.zip', GS_DIR, top='gs-data')
+
+    assert archives.is_archive(archive_path)
+    assert archives.list_root_ann_files(archive_path) == ['cc_onco1.ann', 'cc_onco3.ann']
+    members = list(archives.iter_ann_members(archive_path))
+    assert [(name, filename) for name, filename, _ in members] == [
+        ('gs-data/cc_onco1.ann', 'cc_onco1.ann'), ('gs-data/cc_onco3.ann', 'cc_onco3.ann')]
+    with open(os.path.join(GS_DIR, 'cc_onco1.ann')) as f:
+        assert list(members[0][2]) == f.readlines()
+
+
+@pytest.mark.parametrize('suffix, top', [('.zip', 'gs-data'), ('.tar.gz', None)])
+@pytest.mark.parametrize('subtask', ['ner', 'norm'])
+def test_same_results_as_directories(tmp_path, suffix, top, subtask):
+    gs_path = write_archive(tmp_path / ('gs' + suffix), GS_DIR, top=top)
+    pred_path = write_archive(tmp_path / ('pred' + suffix), PRED_DIR)
+
+    expected = run_script('main.py', '-g', GS_DIR, '-p', PRED_DIR, '-s', subtask)
+    result = run_script('main.py', '-g', gs_path, '-p', pred_path, '-s', subtask)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == expected.stdout.replace(PRED_DIR, pred_path)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Batch mode: several prediction paths in one main.py run (batch.py).
+"""
+
+import pytest
+
+from conftest import GS_CODING, GS_DIR, PRED_CODING, PRED_DIR, run_script
+from test_ner_norm import PRED, write_corpus
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_one_line_per_run(tmp_path, jobs):
+    other_dir = write_corpus(tmp_path / 'pred', PRED)
+
+    result = run_script('main.py', '-g', GS_DIR, '-p', PRED_DIR, other_dir, PRED_DIR,
+                        '-s', 'norm', '-j', jobs)
+
+    # other_dir has no predictions for the GS files: it cannot be scored
+    # (as in a single run), and the other runs are
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines() == ['{}|0.769|0.833|0.8'.format(PRED_DIR),
+                                          '{}|error'.format(other_dir),
+                                          '{}|0.769|0.833|0.8'.format(PRED_DIR)]
+    assert '{} could not be scored'.format(other_dir) in result.stderr
+
+
+def test_coding(codes_path):
+    result = run_script('main.py', '-g', GS_CODING, '-p', PRED_CODING, PRED_CODING,
+                        '-c', codes_path, '-s', 'coding')
+
+    assert result.stdout.splitlines() == ['{}|0.5'.format(PRED_CODING)] * 2
+
+
+@pytest.mark.parametrize('option', [['--format', 'json'], ['--stream'], ['-i', 'cache'],
+                                    ['--summary-only']])
+def test_unsupported_options(option):
+    result = run_script('main.py', '-g', GS_DIR, '-p', PRED_DIR, PRED_DIR, '-s', 'ner',
+                        *option)
+
+    assert result.returncode == 2
+    assert 'not supported with several prediction paths' in result.stderr
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+P, R and F1 by code and code family (--breakdown; code_breakdown.py).
+"""
+
+import io
+import json
+import math
+
+import pandas as pd
+import pytest
+
+import code_breakdown
+import results_output
+from conftest import GS_CODING, GS_DIR, PRED_CODING, PRED_DIR, run_script
+
+KEYS = ['clinical_case', 'offset']
+
+
+def test_code_label():
+    assert [code_breakdown.code_label('8041/31', level)
+            for level in code_breakdown.LEVELS] == ['8041/31', '8041', '/3']
+    assert code_breakdown.code_label('8041/3/h', 'behaviour') == '/3'
+
+
+def test_multi_code_annotations():
+    # The GS annotation at 0 5 has two codes of the same morphology
+    gs = pd.DataFrame({'clinical_case': ['a', 'a', 'a'], 'offset': ['0 5', '0 5', '9 12'],
+                       'code': ['8000/6', '8000/3', '8140/3']})
+    pred = pd.DataFrame({'clinical_case': ['a', 'a'], 'offset': ['0 5', '9 12'],
+                         'code': ['8000/3', '8000/3']})
+    units = {'TP': pred.iloc[:1], 'Pred_Pos': pred, 'GS_Pos': gs}
+
+    counts = code_breakdown.count_labels(units, KEYS)
+
+    assert counts['code'].to_dict('index') == {
+        '8000/3': {'TP': 1, 'Pred_Pos': 2, 'GS_Pos': 1},
+        '8000/6': {'TP': 0, 'Pred_Pos': 0, 'GS_Pos': 1},
+        '8140/3': {'TP': 0, 'Pred_Pos': 0, 'GS_Pos': 1}}
+    # Once in a family
+    assert counts['morphology'].loc['8000'].tolist() == [1, 2, 1]
+    assert counts['behaviour'].loc['/3'].tolist() == [1, 2, 2]
+
+    table, macro = code_breakdown.metrics_from_counts(counts['code'])
+    assert math.isnan(table.loc['8000/6', 'P'])
+    assert table.loc['8000/6', 'F1'] == 0
+    assert macro == pytest.approx({'P': 0.5, 'R': 1 / 3, 'F1': (2 / 3) / 3})
+
+
+def level_sums(breakdown_path):
+    table = pd.read_csv(breakdown_path, dtype={'label': str})
+    labels = table.loc[table['label'] != code_breakdown.MACRO_AVERAGE_ROW]
+    return labels.groupby('level')[code_breakdown.COUNTS].sum()
+
+
+def test_toy_data(tmp_path, codes_path):
+    breakdown_path = tmp_path / 'breakdown.csv'
+    result = run_script('main.py', '-g', GS_DIR, '-p', PRED_DIR, '-s', 'norm', '-c', codes_path,
+                        '--format', 'csv', '--breakdown', breakdown_path)
+
+    assert result.returncode == 0, result.stderr
+    # Without multi-code annotations, every level adds up to the micro counts
+    assert level_sums(breakdown_path).values.tolist() == [[10, 13, 12]] * 3
+
+
+def test_comp_f1(tmp_path, codes_path):
+    breakdown_path = tmp_path / 'breakdown.csv'
+    test_files_path = tmp_path / 'test-files.txt'
+    test_files_path.write_text('cc_onco1\ncc_onco3\n')
+    result = run_script('comp_f1_diag_proc.py', '-g', GS_CODING, '-p', PRED_CODING,
+                        '-c', codes_path, '-f', test_files_path, '--format', 'csv',
+                        '--breakdown', breakdown_path)
+
+    assert result.returncode == 0, result.stderr
+    # Units are (clinical case, code): codes of one family in a clinical
+    # case are one unit of the family
+    sums = level_sums(breakdown_path)
+    assert sums.loc[['code', 'morphology']].values.tolist() == [[3, 4, 3], [2, 3, 2]]
+    TP, Pred_Pos, GS_Pos = sums.loc['code']
+    micro = pd.read_csv(io.StringIO(result.stdout), index_col=0).loc[
+        results_output.MICRO_AVERAGE_ROW]
+    assert (micro['P'], micro['R']) == pytest.approx((TP / Pred_Pos, TP / GS_Pos))
+
+
+def test_json(tmp_path):
+    breakdown_path = tmp_path / 'breakdown.json'
+    run_script('main.py', '-g', GS_DIR, '-p', PRED_DIR, '-s', 'norm', '--format', 'json',
+               '--breakdown', breakdown_path)
+
+    content = json.loads(breakdown_path.read_text())
+
+    assert set(content) == {'pred_path'} | set(code_breakdown.LEVELS)
+    assert content['code']['per_label']['8041/3'] == {
+        'TP': 1, 'Pred_Pos': 2, 'GS_Pos': 2, 'P': 0.5, 'R': 0.5, 'F1': 0.5}
+    assert content['code']['per_label']['1000/0']['R'] is None
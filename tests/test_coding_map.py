@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+MAP of subtask CODING: toy data, rank order and cross-check against the
+original trectools 0.0.44 evaluation (skipped if trectools is not
+installed).
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import cantemist_coding
+import valid_codes as vc
+from conftest import GS_CODING, PRED_CODING, ROOT, run_script
+
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+import check_map_trectools
+
+
+def test_toy_data(codes_path):
+    result = run_script('main.py', '-g', GS_CODING, '-p', PRED_CODING, '-c', codes_path,
+                        '-s', 'coding')
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines()[-1] == '{}|0.5'.format(PRED_CODING)
+
+
+def test_predictions_are_ranked_in_file_order(tmp_path):
+    gs_path, pred_path = tmp_path / 'gs.tsv', tmp_path / 'pred.tsv'
+    gs_path.write_text('clinical_case\tcode\ncc1\t8000/3\n')
+    pred_path.write_text('cc1\t8010/3\ncc2\t8000/3\ncc1\t8000/3\n')
+
+    gs, qid_gs = cantemist_coding.format_gs(str(gs_path))
+    pred = cantemist_coding.format_predictions(str(pred_path),
+                                               vc.codes_array(['8000/3', '8010/3']),
+                                               qid_gs)
+
+    # 8000/3 is ranked second, after 8010/3 (not by code name)
+    assert cantemist_coding.compute_map(gs, pred) == 0.5
+
+
+def write_random_run(tmp_path, seed, n_queries=300, n_codes=60):
+    '''
+    Write a random GS TSV and predictions TSV (mixed case codes, repeated
+    and invalid codes, clinical cases not in the GS) and return their paths
+    and the valid codes.
+    '''
+    rnd = np.random.RandomState(seed)
+    codes = np.array(['8{:03d}/{}/h'.format(i // 4, i % 4) for i in range(n_codes)])
+    queries = np.array(['cc_onco{}'.format(i) for i in range(n_queries)])
+
+    gs = pd.DataFrame({'clinical_case': queries[rnd.randint(0, n_queries, 4 * n_queries)],
+                       'code': codes[rnd.randint(0, 20, 4 * n_queries)]})
+    pred_queries = np.repeat(queries[rnd.rand(n_queries) < 0.9], 12)
+    pred = pd.DataFrame({'clinical_case': np.concatenate([pred_queries, ['cc_other'] * 3]),
+                         'code': codes[rnd.randint(0, n_codes, len(pred_queries) + 3)]})
+    upper = rnd.rand(pred.shape[0]) < 0.2
+    pred.loc[upper, 'code'] = pred.loc[upper, 'code'].str.upper()
+    pred = pd.concat([pred, pred.sample(frac=0.05, random_state=seed)])
+
+    gs_path, pred_path = tmp_path / 'gs.tsv', tmp_path / 'pred.tsv'
+    gs.to_csv(gs_path, sep='\t', index=False)
+    pred.to_csv(pred_path, sep='\t', index=False, header=False)
+
+    return str(gs_path), str(pred_path), vc.codes_array(codes[:-5])
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_map_matches_trectools(tmp_path, seed):
+    pytest.importorskip('trectools')
+    gs_path, pred_path, valid_codes = write_random_run(tmp_path, seed)
+    qrels_path, run_path = tmp_path / 'qrels.txt', tmp_path / 'run.txt'
+
+    # Files are read and formatted as by main.py, and the Qrel and Run files
+    # written by format_gs and format_predictions are read as trectools
+    # 0.0.44 read them in the original evaluation
+    gs, qid_gs = cantemist_coding.format_gs(gs_path, output_path=str(qrels_path))
+    pred = cantemist_coding.format_predictions(pred_path, valid_codes, qid_gs,
+                                               output_path=str(run_path))
+    expected = check_map_trectools.trectools_map_files(str(qrels_path), str(run_path))
+
+    assert cantemist_coding.compute_map(gs, pred) == pytest.approx(expected, rel=1e-12)
+    means, _ = cantemist_coding.compute_ranking_metrics(gs, pred, ['MAP'])
+    assert means['MAP'] == cantemist_coding.compute_map(gs, pred)
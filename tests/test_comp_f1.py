@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+P, R and F1 of coding predictions (comp_f1_diag_proc.py) on the toy data,
+whose results are those of the original evaluation.
+"""
+
+import json
+
+import pytest
+
+from conftest import GS_CODING, PRED_CODING, run_script
+
+
+@pytest.fixture
+def test_files_path(tmp_path):
+    path = tmp_path / 'test-files.txt'
+    path.write_text('cc_onco1\ncc_onco3\ncc_onco9\n')
+    return str(path)
+
+
+def test_toy_data(codes_path, test_files_path):
+    args = ['-g', GS_CODING, '-p', PRED_CODING, '-c', codes_path, '-f', test_files_path]
+
+    text = run_script('comp_f1_diag_proc.py', *args)
+    content = json.loads(run_script('comp_f1_diag_proc.py', *args, '--format', 'json').stdout)
+
+    assert text.stdout.splitlines()[-1] == '{}|0.75|1.0|0.857'.format(PRED_CODING)
+    assert (content['P'], content['R'], content['F1']) == pytest.approx((0.75, 1.0, 6 / 7))
+    assert content['per_case']['cc_onco1'] == pytest.approx({'P': 0.5, 'R': 1.0, 'F1': 2 / 3})
+    assert content['per_case']['cc_onco3'] == pytest.approx({'P': 1.0, 'R': 1.0, 'F1': 1.0})
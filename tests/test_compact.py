@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Categorical annotation DataFrames (ann_parsing.records_to_df,
+InternedRecords, share_categories, format_df).
+"""
+
+import pandas as pd
+
+import ann_parsing
+
+RECORDS = [('b.ann', 'T1', 'MORFOLOGIA_NEOPLASIA', '10 20', 'tumor', '8000/6'),
+           ('a.ann', 'T1', 'MORFOLOGIA_NEOPLASIA', '0 9', 'carcinoma', '8010/3'),
+           ('a.ann', 'T2', 'MORFOLOGIA_NEOPLASIA', '10 20', 'tumor', '8000/6')]
+
+
+def test_records_are_categoricals():
+    df = ann_parsing.records_to_df(RECORDS, with_notes=True)
+
+    assert all(isinstance(df[column].dtype, pd.CategoricalDtype) for column in df.columns)
+    assert df.astype(str).values.tolist() == [list(record) for record in RECORDS]
+    # Sorted categories: sorting by code is sorting by name
+    assert list(df['filename'].cat.categories) == ['a.ann', 'b.ann']
+    assert df['filename'].cat.codes.tolist() == [1, 0, 0]
+
+
+def test_interned_records():
+    records = ann_parsing.InternedRecords(6)
+    records.extend(RECORDS[:1])
+    worker = ann_parsing.InternedRecords(6)
+    worker.extend(RECORDS[1:])
+    records.extend_interned(worker)
+
+    # Each distinct value is stored once
+    assert len(records) == 3
+    assert [len(ids) for ids in records.ids] == [2, 2, 1, 2, 2, 2]
+    assert records.to_records() == RECORDS
+    pd.testing.assert_frame_equal(ann_parsing.records_to_df(records, with_notes=True),
+                                  ann_parsing.records_to_df(RECORDS, with_notes=True))
+
+
+def test_offsets_are_int32():
+    df = ann_parsing.format_df(ann_parsing.records_to_df(RECORDS, with_notes=True))
+
+    assert df['offset0'].dtype == df['offset1'].dtype == 'int32'
+    assert df['offset0'].tolist() == [10, 0, 10]
+    assert df['offset1'].tolist() == [20, 9, 20]
+
+
+def test_share_categories():
+    left = ann_parsing.records_to_df(RECORDS[:1], with_notes=True)
+    right = ann_parsing.records_to_df(RECORDS[1:], with_notes=True)
+
+    left, right = ann_parsing.share_categories(left, right, [('filename', 'filename'),
+                                                             ('code', 'code')])
+
+    for column in ['filename', 'code']:
+        assert list(left[column].cat.categories) == list(right[column].cat.categories)
+    assert left['filename'].cat.codes.tolist() == [1]
+    assert right['filename'].cat.codes.tolist() == [0, 0]
+    merged = pd.merge(left, right, on=['filename', 'code'])
+    assert merged.shape[0] == 0
+    assert pd.merge(left, right, on='code')['filename_y'].astype(str).tolist() == ['a.ann']
+
+
+def test_size_by():
+    df = ann_parsing.records_to_df(RECORDS, with_notes=True)
+
+    assert ann_parsing.size_by(df.iloc[1:], 'filename').to_dict() == {'a.ann': 2}
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled Gold Standard store (gs_store.py).
+"""
+
+import pytest
+
+import cantemist_ner_norm
+import gs_store
+from test_ner_norm import GS, PRED, write_corpus
+
+
+@pytest.fixture
+def store(tmp_path):
+    gs_dir = write_corpus(tmp_path / 'gs', GS)
+    store_path = str(tmp_path / 'gs.npz')
+    gs_store.compile_gs(gs_dir, store_path)
+    return gs_dir, store_path
+
+
+@pytest.mark.parametrize('subtask', ['ner', 'norm'])
+def test_store_is_the_parsed_gs(store, subtask):
+    gs_dir, store_path = store
+
+    parsed, ann_list = cantemist_ner_norm.load_gs(gs_dir, subtask)
+    stored, stored_ann_list = cantemist_ner_norm.load_gs(store_path, subtask)
+
+    assert stored.astype(object).equals(parsed.astype(object))
+    assert sorted(stored_ann_list) == sorted(ann_list)
+
+
+def test_stale_store_is_not_used(store, tmp_path):
+    gs_dir, store_path = store
+    pred_dir = write_corpus(tmp_path / 'pred', PRED)
+    with open(gs_dir + '/b.ann', 'w') as f:
+        f.write(GS['a.ann'])
+
+    with pytest.warns(UserWarning, match='stale'):
+        gs, ann_list_gs = cantemist_ner_norm.load_gs(store_path, 'ner')
+    _, P, _, R, _, F1 = cantemist_ner_norm.evaluate(
+        gs, ann_list_gs, cantemist_ner_norm.load_predictions(pred_dir, 'ner'), 'ner')
+
+    # The GS directory is parsed again: b.ann has now the annotations of a.ann
+    assert (P, R, F1) == pytest.approx((2 / 3, 2 / 4, 4 / 7))
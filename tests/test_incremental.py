@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental re-evaluation (incremental.py): results are those of a full
+evaluation after predicted or GS files change.
+"""
+
+import numpy as np
+import pytest
+
+import cantemist_ner_norm
+import incremental
+from test_ner_norm import GS, PRED, write_corpus
+
+
+def full_evaluation(gs_dir, pred_dir, subtask):
+    gs, ann_list_gs = cantemist_ner_norm.load_gs(gs_dir, subtask)
+    pred = cantemist_ner_norm.load_predictions(pred_dir, subtask)
+    return cantemist_ner_norm.evaluate(gs, ann_list_gs, pred, subtask)
+
+
+def assert_same_results(results, expected):
+    for value, expected_value in zip(results, expected):
+        if isinstance(expected_value, float):
+            assert value == pytest.approx(expected_value)
+        else:
+            assert value.sort_index().to_dict() == pytest.approx(
+                expected_value.sort_index().to_dict(), nan_ok=True)
+
+
+@pytest.mark.parametrize('subtask', ['ner', 'norm'])
+def test_reruns_after_changes(tmp_path, subtask):
+    gs_dir = write_corpus(tmp_path / 'gs', GS)
+    pred_dir = write_corpus(tmp_path / 'pred', PRED)
+    cache_dir = str(tmp_path / 'cache')
+
+    first = incremental.evaluate(gs_dir, pred_dir, subtask, cache_dir)
+    assert_same_results(first, full_evaluation(gs_dir, pred_dir, subtask))
+    assert_same_results(incremental.evaluate(gs_dir, pred_dir, subtask, cache_dir), first)
+
+    # A new predicted file
+    (tmp_path / 'pred' / 'b.ann').write_text(GS['b.ann'])
+    assert_same_results(incremental.evaluate(gs_dir, pred_dir, subtask, cache_dir),
+                        full_evaluation(gs_dir, pred_dir, subtask))
+
+    # A changed GS file
+    (tmp_path / 'gs' / 'b.ann').write_text(GS['a.ann'])
+    assert_same_results(incremental.evaluate(gs_dir, pred_dir, subtask, cache_dir),
+                        full_evaluation(gs_dir, pred_dir, subtask))
+
+
+def test_only_changed_files_are_parsed(tmp_path, monkeypatch):
+    gs_dir = write_corpus(tmp_path / 'gs', GS)
+    pred_dir = write_corpus(tmp_path / 'pred', {**PRED, 'b.ann': GS['b.ann']})
+    cache_dir = str(tmp_path / 'cache')
+    incremental.evaluate(gs_dir, pred_dir, 'norm', cache_dir)
+
+    parsed = []
+    parse_ann_chunk = incremental.ann_parsing.parse_ann_chunk
+    def recording_parse_ann_chunk(paths, *args, **kwargs):
+        parsed.extend(filename for _, filename in paths)
+        return parse_ann_chunk(paths, *args, **kwargs)
+    monkeypatch.setattr(incremental.ann_parsing, 'parse_ann_chunk', recording_parse_ann_chunk)
+
+    incremental.evaluate(gs_dir, pred_dir, 'norm', cache_dir)
+    assert parsed == []
+    (tmp_path / 'pred' / 'b.ann').write_text(PRED['a.ann'])
+    incremental.evaluate(gs_dir, pred_dir, 'norm', cache_dir)
+    assert parsed == ['b.ann']
+
+
+def test_state_is_not_pickled(tmp_path):
+    gs_dir = write_corpus(tmp_path / 'gs', GS)
+    pred_dir = write_corpus(tmp_path / 'pred', PRED)
+    cache_dir = tmp_path / 'cache'
+    expected = incremental.evaluate(gs_dir, pred_dir, 'norm', str(cache_dir))
+
+    with np.load(cache_dir / 'state-norm.npz', allow_pickle=False) as arrays:
+        assert arrays['counts'].dtype == np.int64
+    state = incremental.load_state(str(cache_dir / 'state-norm.npz'))
+    assert state['counts'].loc['a.ann'].tolist() == [1, 3, 2]
+    assert sorted(entry[3] for entry in state['files'].values()) == ['a.ann']
+
+    # A corrupt state is ignored: counts are computed again
+    (cache_dir / 'state-norm.npz').write_bytes(b'not a state')
+    assert incremental.load_state(str(cache_dir / 'state-norm.npz')) is None
+    assert_same_results(incremental.evaluate(gs_dir, pred_dir, 'norm', str(cache_dir)),
+                        expected)
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Lenient (overlap-based) matching (--match; interval_matching.py).
+"""
+
+import pytest
+
+import cantemist_ner_norm
+from conftest import GS_DIR, PRED_DIR, run_script
+from test_ner_norm import write_corpus
+
+GS = {'a.ann': 'T1\tMORFOLOGIA_NEOPLASIA 0 5\tabcde\n#1\tAnnotatorNotes T1\t8000/6\n'
+               'T2\tMORFOLOGIA_NEOPLASIA 10 20\tklmnopqrst\n#2\tAnnotatorNotes T2\t8010/3\n'}
+# Two overlaps of the first GS span (matched once), one overlap of the
+# second one with another code, and a False Positive
+PRED = {'a.ann': 'T1\tMORFOLOGIA_NEOPLASIA 1 4\tbcd\n#1\tAnnotatorNotes T1\t8000/6\n'
+                 'T2\tMORFOLOGIA_NEOPLASIA 2 3\tc\n#2\tAnnotatorNotes T2\t8000/6\n'
+                 'T3\tMORFOLOGIA_NEOPLASIA 12 25\tmnopqrstuvwxy\n#3\tAnnotatorNotes T3\t8000/6\n'
+                 'T4\tMORFOLOGIA_NEOPLASIA 30 35\tfghij\n#4\tAnnotatorNotes T4\t8000/6\n'}
+
+
+@pytest.mark.parametrize('subtask, expected', [('ner', (2 / 4, 2 / 2)),
+                                               ('norm', (1 / 4, 1 / 2))])
+def test_overlaps_are_matched_once(tmp_path, subtask, expected):
+    gs, ann_list_gs = cantemist_ner_norm.load_gs(write_corpus(tmp_path / 'gs', GS), subtask)
+    pred = cantemist_ner_norm.load_predictions(write_corpus(tmp_path / 'pred', PRED), subtask)
+
+    _, P, _, R, _, _ = cantemist_ner_norm.evaluate(gs, ann_list_gs, pred, subtask,
+                                                   match='lenient')
+    with pytest.warns(UserWarning, match='set to zero'):
+        _, strict_P, _, _, _, _ = cantemist_ner_norm.evaluate(gs, ann_list_gs, pred, subtask)
+
+    assert (P, R) == pytest.approx(expected)
+    assert strict_P == 0
+
+
+def test_both_modes():
+    both = run_script('main.py', '-g', GS_DIR, '-p', PRED_DIR, '-s', 'ner', '--match', 'both')
+    strict = run_script('main.py', '-g', GS_DIR, '-p', PRED_DIR, '-s', 'ner')
+
+    assert both.returncode == 0, both.stderr
+    assert strict.stdout.splitlines()[-1] in both.stdout
+    assert 'Lenient matching' in both.stdout
+
+
+def test_lenient_is_not_supported_for_coding():
+    result = run_script('main.py', '-g', GS_DIR, '-p', PRED_DIR, '-s', 'coding',
+                        '--match', 'lenient')
+
+    assert result.returncode == 2
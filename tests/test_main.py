@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+main.py on the toy data: results of subtasks NER and NORM (those of the
+original evaluation) and modules imported by every subtask.
+"""
+
+import json
+import subprocess
+import sys
+
+import pytest
+
+from conftest import GS_CODING, GS_DIR, PRED_CODING, PRED_DIR, SRC, run_script
+
+# Per clinical case P, R, F1 and micro-averages of the toy data
+EXPECTED = {
+    'ner': {'cc_onco1.ann': (0.5, 2 / 3, 4 / 7), 'cc_onco3.ann': (1.0, 1.0, 1.0),
+            'micro': (11 / 13, 11 / 12, 0.88)},
+    'norm': {'cc_onco1.ann': (0.25, 1 / 3, 2 / 7), 'cc_onco3.ann': (1.0, 1.0, 1.0),
+             'micro': (10 / 13, 10 / 12, 0.8)},
+}
+
+# Run main.py in this interpreter and print the subtask modules it imported
+IMPORTED_MODULES = '''
+import runpy, sys
+sys.argv = ['main.py'] + sys.argv[1:]
+runpy.run_path('main.py', run_name='__main__')
+print(sorted(name for name in ['cantemist_coding', 'cantemist_ner_norm', 'ann_parsing']
+             if name in sys.modules))
+'''
+
+
+@pytest.mark.parametrize('subtask', ['ner', 'norm'])
+def test_summary_line(subtask):
+    result = run_script('main.py', '-g', GS_DIR, '-p', PRED_DIR, '-s', subtask)
+
+    assert result.returncode == 0, result.stderr
+    P, R, F1 = EXPECTED[subtask]['micro']
+    assert result.stdout.splitlines()[-1] == '|'.join([PRED_DIR] + [str(round(x, 3))
+                                                                    for x in (P, R, F1)])
+
+
+@pytest.mark.parametrize('subtask', ['ner', 'norm'])
+def test_json_per_case(subtask):
+    result = run_script('main.py', '-g', GS_DIR, '-p', PRED_DIR, '-s', subtask,
+                        '--format', 'json')
+
+    assert result.returncode == 0, result.stderr
+    content = json.loads(result.stdout)
+    assert (content['P'], content['R'], content['F1']) == pytest.approx(EXPECTED[subtask]['micro'])
+    assert sorted(content['per_case']) == ['cc_onco1.ann', 'cc_onco3.ann']
+    for case, values in content['per_case'].items():
+        assert (values['P'], values['R'], values['F1']) == pytest.approx(EXPECTED[subtask][case])
+
+
+@pytest.mark.parametrize('subtask', ['ner', 'norm'])
+def test_ner_norm_do_not_import_coding(subtask):
+    result = subprocess.run([sys.executable, '-c', IMPORTED_MODULES, '-g', GS_DIR,
+                             '-p', PRED_DIR, '-s', subtask],
+                            cwd=SRC, capture_output=True, text=True)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines()[-1] == "['ann_parsing', 'cantemist_ner_norm']"
+
+
+def test_coding_does_not_import_ner_norm(codes_path):
+    result = subprocess.run([sys.executable, '-c', IMPORTED_MODULES, '-g', GS_CODING,
+                             '-p', PRED_CODING, '-c', codes_path, '-s', 'coding'],
+                            cwd=SRC, capture_output=True, text=True)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines()[-1] == "['cantemist_coding']"
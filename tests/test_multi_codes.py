@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+GS annotations with several valid codes (multi_codes.py, --multi-codes).
+"""
+
+import pandas as pd
+import pytest
+
+import cantemist_ner_norm
+import multi_codes
+from test_ner_norm import write_corpus
+
+# The annotation at 0 5 has two codes
+GS = {'a.ann': 'T1\tMORFOLOGIA_NEOPLASIA 0 5\tabcde\n#1\tAnnotatorNotes T1\t8000/6\n'
+               'T2\tMORFOLOGIA_NEOPLASIA 0 5\tabcde\n#2\tAnnotatorNotes T2\t8010/3\n'
+               'T3\tMORFOLOGIA_NEOPLASIA 10 15\tfghij\n#3\tAnnotatorNotes T3\t8140/3\n'}
+
+
+@pytest.fixture
+def gs(tmp_path):
+    return cantemist_ner_norm.load_gs(write_corpus(tmp_path / 'gs', GS), 'norm')[0]
+
+
+def test_table_is_derived_from_the_gs(gs, tmp_path):
+    table = multi_codes.build_table(gs)
+
+    assert table.astype(str).values.tolist() == [['a.ann', '0 5', '8000/6']]
+
+    keys_path = tmp_path / 'keys.tsv'
+    keys_path.write_text('a.ann\t10\t15\n')
+    keys = multi_codes.load_keys(keys_path)
+    assert keys.values.tolist() == [['a.ann', '10 15']]
+    # Only the listed annotations (which must have several codes)
+    assert multi_codes.build_table(gs, keys).shape[0] == 0
+
+
+@pytest.mark.parametrize('code_pred, is_valid', [('8010/3', True), ('8000/6', True),
+                                                 ('8140/3', False)])
+def test_annotation_is_counted_once(gs, code_pred, is_valid):
+    pred = pd.DataFrame({'clinical_case': ['a.ann', 'a.ann'], 'offset': ['0 5', '10 15'],
+                         'code_pred': [code_pred, '8140/3']})
+    df_sel = pd.merge(pred, gs.astype({'clinical_case': str, 'offset': str}),
+                      on=['clinical_case', 'offset'])
+    df_sel = df_sel.assign(is_valid=(df_sel['code_gs'].astype(str) == df_sel['code_pred']).values)
+
+    df_sel = multi_codes.apply_table(df_sel, multi_codes.build_table(gs))
+
+    assert df_sel[['offset', 'is_valid']].values.tolist() == [['0 5', is_valid],
+                                                              ['10 15', True]]
+
+
+def test_keys_file_must_have_three_columns(tmp_path):
+    keys_path = tmp_path / 'keys.tsv'
+    keys_path.write_text('a.ann\t0\n')
+
+    with pytest.raises(ImportError):
+        multi_codes.load_keys(keys_path)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Scoring of subtasks NER and NORM (cantemist_ner_norm.py) on a small corpus
+whose results are those of the original evaluation.
+"""
+
+import math
+
+import pytest
+
+import cantemist_ner_norm
+
+GS = {'a.ann': 'T1\tMORFOLOGIA_NEOPLASIA 0 5\tabcde\n#1\tAnnotatorNotes T1\t8000/6\n'
+               'T2\tMORFOLOGIA_NEOPLASIA 10 15\tfghij\n#2\tAnnotatorNotes T2\t8010/3\n',
+      'b.ann': 'T1\tMORFOLOGIA_NEOPLASIA 0 4\tabcd\n#1\tAnnotatorNotes T1\t8140/3\n'}
+# One exact match, one match of offsets with another code and one False
+# Positive in a.ann; no predictions in b.ann
+PRED = {'a.ann': 'T1\tMORFOLOGIA_NEOPLASIA 0 5\tabcde\n#1\tAnnotatorNotes T1\t8000/6\n'
+                 'T2\tMORFOLOGIA_NEOPLASIA 10 15\tfghij\n#2\tAnnotatorNotes T2\t8000/6\n'
+                 'T3\tMORFOLOGIA_NEOPLASIA 20 25\tklmno\n#3\tAnnotatorNotes T3\t8000/6\n'}
+
+# P, R, F1 of a.ann and b.ann and micro-averages
+EXPECTED = {'ner': ((2 / 3, 1.0, 0.8), (math.nan, 0.0, math.nan), (2 / 3, 2 / 3, 2 / 3)),
+            'norm': ((1 / 3, 0.5, 0.4), (math.nan, 0.0, math.nan), (1 / 3, 1 / 3, 1 / 3))}
+
+
+def write_corpus(directory, files):
+    directory.mkdir()
+    for name, text in files.items():
+        (directory / name).write_text(text)
+    return str(directory)
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    return write_corpus(tmp_path / 'gs', GS), write_corpus(tmp_path / 'pred', PRED)
+
+
+@pytest.mark.parametrize('subtask', ['ner', 'norm'])
+def test_evaluate(corpus, subtask):
+    gs_dir, pred_dir = corpus
+    gs, ann_list_gs = cantemist_ner_norm.load_gs(gs_dir, subtask)
+    pred = cantemist_ner_norm.load_predictions(pred_dir, subtask)
+
+    P_per_cc, P, R_per_cc, R, F1_per_cc, F1 = cantemist_ner_norm.evaluate(gs, ann_list_gs,
+                                                                           pred, subtask)
+
+    case_a, case_b, micro = EXPECTED[subtask]
+    assert (P, R, F1) == pytest.approx(micro)
+    for case, expected in [('a.ann', case_a), ('b.ann', case_b)]:
+        values = (P_per_cc[case], R_per_cc[case], F1_per_cc[case])
+        assert values == pytest.approx(expected, nan_ok=True)
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+Stage timers and counters (profiling.py, --profile).
+"""
+
+import json
+
+from conftest import GS_DIR, PRED_DIR, run_script
+
+
+def test_profile_report(tmp_path):
+    profile_path = tmp_path / 'profile.json'
+    plain = run_script('main.py', '-g', GS_DIR, '-p', PRED_DIR, '-s', 'norm')
+    profiled = run_script('main.py', '-g', GS_DIR, '-p', PRED_DIR, '-s', 'norm',
+                          '--profile', profile_path)
+
+    # The results are not changed
+    assert profiled.stdout == plain.stdout
+    report = json.loads(profile_path.read_text())
+    stages = {stage['name'] for stage in report['stages']}
+    assert {'import', 'load_gs', 'load_predictions'} <= stages
+    assert all(stage['wall_s'] >= 0 for stage in report['stages'])
+    assert report['counters']['ann_files'] == 4
+    assert report['peak_mem_mb'] > 0
+
+
+def test_profile_to_stderr():
+    result = run_script('main.py', '-g', GS_DIR, '-p', PRED_DIR, '-s', 'ner', '--profile')
+
+    assert result.returncode == 0
+    assert json.loads(result.stderr)['wall_s'] > 0
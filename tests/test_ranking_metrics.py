@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Ranking metrics of subtask CODING (cantemist_coding.ranking_metrics,
+--metrics).
+"""
+
+import json
+import math
+
+import pytest
+
+import cantemist_coding
+import valid_codes as vc
+from conftest import GS_CODING, PRED_CODING, run_script
+from test_coding_map import write_random_run
+
+METRICS = ['MAP', 'P@2', 'R@2', 'nDCG@3', 'Rprec', 'MRR']
+
+
+@pytest.fixture
+def toy_ranking(tmp_path):
+    '''
+    cc1: relevant codes at ranks 1 and 3 of 4 (predictions are ranked in
+    file order); cc2: no relevant predictions; cc3: no predictions.
+    '''
+    gs_path, pred_path = tmp_path / 'gs.tsv', tmp_path / 'pred.tsv'
+    gs_path.write_text('clinical_case\tcode\ncc1\t8000/1\ncc1\t8000/3\ncc2\t8000/4\n'
+                       'cc3\t8000/2\n')
+    pred_path.write_text('cc1\t8000/1\ncc1\t8000/4\ncc1\t8000/3\ncc1\t8000/2\n'
+                         'cc2\t8000/2\ncc2\t8000/1\n')
+    gs, qid_gs = cantemist_coding.format_gs(str(gs_path))
+    pred = cantemist_coding.format_predictions(
+        str(pred_path), vc.codes_array(['8000/{}'.format(i) for i in range(1, 5)]), qid_gs)
+    return gs, pred
+
+
+def test_values(toy_ranking):
+    means, per_query = cantemist_coding.compute_ranking_metrics(*toy_ranking, METRICS)
+
+    assert list(per_query.columns) == METRICS
+    assert per_query.loc['cc1'].tolist() == pytest.approx(
+        [(1 + 2 / 3) / 2, 1 / 2, 1 / 2, (1 + 1 / math.log2(4)) / (1 + 1 / math.log2(3)),
+         1 / 2, 1.0])
+    assert per_query.loc['cc2'].tolist() == [0.0] * len(METRICS)
+    # Means over the clinical cases with predictions, as MAP
+    assert list(per_query.index) == ['cc1', 'cc2']
+    assert means == pytest.approx(per_query.mean().to_dict())
+
+
+def test_map_is_compute_map(tmp_path):
+    gs_path, pred_path, valid_codes = write_random_run(tmp_path, seed=2)
+    gs, qid_gs = cantemist_coding.format_gs(gs_path)
+    pred = cantemist_coding.format_predictions(pred_path, valid_codes, qid_gs)
+
+    means, per_query = cantemist_coding.compute_ranking_metrics(gs, pred, METRICS)
+
+    assert means['MAP'] == cantemist_coding.compute_map(gs, pred)
+    assert ((per_query >= 0) & (per_query <= 1)).all().all()
+    # P@1 is 1 only where the first prediction is relevant (MRR of 1)
+    one, _ = cantemist_coding.compute_ranking_metrics(gs, pred, ['P@1', 'MRR'])
+    assert one['P@1'] <= one['MRR']
+
+
+def test_parse_metrics():
+    assert cantemist_coding.parse_metrics('MAP, P@5,nDCG@10,MAP') == ['MAP', 'P@5', 'nDCG@10']
+    for spec in ['P@0', 'P@x', 'P', 'MAP@5', 'F1']:
+        with pytest.raises(ValueError, match='Unknown ranking metric'):
+            cantemist_coding.parse_metrics(spec)
+
+
+def test_main(codes_path):
+    result = run_script('main.py', '-g', GS_CODING, '-p', PRED_CODING, '-c', codes_path,
+                        '-s', 'coding', '--metrics', 'MAP,P@1', '--format', 'json')
+
+    assert result.returncode == 0, result.stderr
+    content = json.loads(result.stdout)
+    assert content['MAP'] == 0.5
+    assert set(content['per_case']['cc_onco1']) == {'MAP', 'P@1'}
+    assert run_script('main.py', '-g', GS_CODING, '-p', PRED_CODING, '-s', 'coding',
+                      '--metrics', 'P@0').returncode == 2
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of evaluation results (result_cache.py,
+--result-cache).
+"""
+
+import math
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+import result_cache
+from conftest import GS_CODING, GS_DIR, PRED_CODING, PRED_DIR, run_script
+
+RESULTS = {'strict': (pd.Series({'a.ann': 0.5, 'b.ann': math.nan}), 0.5,
+                      pd.Series({'a.ann': 1.0, 'b.ann': 0.0}), 1 / 3,
+                      pd.Series({'a.ann': 2 / 3, 'b.ann': math.nan}), 0.4)}
+
+
+def test_entries(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+
+    assert result_cache.load_results(cache_dir, 'key') is None
+    result_cache.store_results(cache_dir, 'key', RESULTS)
+    results = result_cache.load_results(cache_dir, 'key')
+
+    assert list(results) == ['strict']
+    for value, expected in zip(results['strict'], RESULTS['strict']):
+        if isinstance(expected, pd.Series):
+            pd.testing.assert_series_equal(value, expected, check_index_type=False)
+        else:
+            assert value == expected
+
+    # A corrupt entry is a miss
+    with open(result_cache.entry_path(cache_dir, 'key'), 'wb') as f:
+        f.write(b'not an entry')
+    assert result_cache.load_results(cache_dir, 'key') is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    for key in ['a', 'b', 'c']:
+        result_cache.store_results(cache_dir, key, RESULTS)
+        path = result_cache.entry_path(cache_dir, key)
+        os.utime(path, ns=(len(os.listdir(cache_dir)) * 10 ** 9,) * 2)
+    result_cache.load_results(cache_dir, 'a')
+
+    result_cache.evict(cache_dir, max_bytes=2 * os.path.getsize(path))
+
+    assert sorted(os.listdir(cache_dir)) == ['a.npz', 'c.npz']
+
+
+def test_key(tmp_path, codes_path):
+    pred_path = tmp_path / 'pred'
+    shutil.copytree(PRED_DIR, pred_path)
+    key = result_cache.cache_key('norm', GS_DIR, str(pred_path), codes_path)
+
+    assert key == result_cache.cache_key('norm', GS_DIR, PRED_DIR, codes_path)
+    assert key != result_cache.cache_key('ner', GS_DIR, str(pred_path), codes_path)
+    assert key != result_cache.cache_key('norm', GS_DIR, str(pred_path), codes_path,
+                                         match='lenient')
+    with open(pred_path / 'cc_onco3.ann', 'a') as f:
+        f.write('T99\tMORFOLOGIA_NEOPLASIA 0 1\ta\n')
+    assert key != result_cache.cache_key('norm', GS_DIR, str(pred_path), codes_path)
+
+
+@pytest.mark.parametrize('args', [['-g', GS_DIR, '-p', PRED_DIR, '-s', 'ner'],
+                                  ['-g', GS_DIR, '-p', PRED_DIR, '-s', 'norm',
+                                   '--format', 'json'],
+                                  ['-g', GS_CODING, '-p', PRED_CODING, '-s', 'coding',
+                                   '--format', 'csv']])
+def test_hit_gives_the_same_output(tmp_path, args):
+    cache_dir = str(tmp_path / 'cache')
+    expected = run_script('main.py', *args)
+
+    miss = run_script('main.py', *args, '--result-cache', cache_dir)
+    hit = run_script('main.py', *args, '--result-cache', cache_dir)
+
+    assert len(os.listdir(cache_dir)) == 1
+    assert miss.stdout == hit.stdout == expected.stdout
+
+
+def test_hit_is_read_from_the_cache(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    args = ['-g', GS_DIR, '-p', PRED_DIR, '-s', 'ner', '--result-cache', cache_dir]
+    run_script('main.py', *args)
+    key = os.listdir(cache_dir)[0][:-len('.npz')]
+
+    result_cache.store_results(cache_dir, key, RESULTS)
+
+    assert run_script('main.py', *args).stdout.splitlines()[-1] == '{}|0.5|0.333|0.4'.format(
+        PRED_DIR)
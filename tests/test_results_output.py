@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Output formats (--format, --output, --summary-only; results_output.py).
+"""
+
+import io
+import json
+import math
+
+import pandas as pd
+import pytest
+
+import results_output
+from conftest import GS_DIR, PRED_DIR, run_script
+
+NORM = ['-g', GS_DIR, '-p', PRED_DIR, '-s', 'norm']
+
+
+def test_csv_rows():
+    result = run_script('main.py', *NORM, '--format', 'csv')
+
+    table = pd.read_csv(io.StringIO(result.stdout), index_col=0)
+    assert list(table.columns) == ['P', 'R', 'F1']
+    assert list(table.index) == ['cc_onco1.ann', 'cc_onco3.ann', results_output.MICRO_AVERAGE_ROW]
+    assert table.loc[results_output.MICRO_AVERAGE_ROW].tolist() == pytest.approx([10 / 13, 10 / 12, 0.8])
+
+
+def test_summary_only():
+    tsv = run_script('main.py', *NORM, '--format', 'tsv', '--summary-only')
+    content = json.loads(run_script('main.py', *NORM, '--format', 'json', '--summary-only').stdout)
+
+    assert tsv.stdout.splitlines()[0] == 'pred_path\tP\tR\tF1'
+    assert len(tsv.stdout.splitlines()) == 2
+    assert 'per_case' not in content
+    assert run_script('main.py', *NORM, '--summary-only').stdout.count('.ann') == 0
+
+
+def test_output_file(tmp_path):
+    output_path = tmp_path / 'results.json'
+    result = run_script('main.py', *NORM, '--format', 'json', '-o', output_path)
+
+    assert result.stdout == ''
+    assert output_path.read_text() == run_script('main.py', *NORM, '--format', 'json').stdout
+
+
+def test_undefined_metrics():
+    per_cc = {'P': pd.Series({'a': math.nan}), 'R': pd.Series({'a': 0.0}),
+              'F1': pd.Series({'a': math.nan})}
+    metrics = {'P': math.nan, 'R': 0.0, 'F1': math.nan}
+
+    content = json.loads(results_output.format_results('x', metrics, per_cc, fmt='json'))
+    csv = results_output.format_results('x', metrics, per_cc, fmt='csv')
+
+    assert content['P'] is None and content['per_case']['a'] == {'P': None, 'R': 0.0, 'F1': None}
+    assert csv.splitlines()[1] == 'a,,0.0,'
+
+
+def test_match_modes():
+    per_cc = {'P': pd.Series({'a': math.nan}), 'R': pd.Series({'a': 0.0}),
+              'F1': pd.Series({'a': math.nan})}
+    metrics = {'P': math.nan, 'R': 0.0, 'F1': math.nan}
+    results = {'strict': (metrics, per_cc), 'lenient': (metrics, None)}
+
+    content = json.loads(results_output.format_match_results('x', results, fmt='json'))
+    tsv = results_output.format_match_results('x', {'strict': (metrics, per_cc)}, fmt='tsv')
+
+    assert content['strict']['per_case']['a'] == {'P': None, 'R': 0.0, 'F1': None}
+    assert content['lenient'] == {'P': None, 'R': 0.0, 'F1': None}
+    assert tsv.splitlines() == ['match\tclinical_case\tP\tR\tF1', 'strict\ta\t\t0.0\t',
+                                'strict\t{}\t\t0.0\t'.format(results_output.MICRO_AVERAGE_ROW)]
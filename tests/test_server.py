@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Evaluation service (server.py): requests scored with the GS loaded once.
+"""
+
+import os
+
+import pytest
+
+import ann_parsing
+from conftest import GS_CODING, GS_DIR, PRED_CODING, PRED_DIR, ROOT, run_script
+from server import Evaluator
+
+
+@pytest.fixture(scope='module')
+def evaluator(tmp_path_factory):
+    codes_path = tmp_path_factory.mktemp('codes') / 'valid-codes.tsv'
+    with open(os.path.join(ROOT, 'valid-codes.tsv')) as f:
+        codes_path.write_text(f.read())
+    return Evaluator(GS_DIR, GS_CODING, str(codes_path))
+
+
+@pytest.mark.parametrize('subtask', ['ner', 'norm'])
+def test_annotations_and_path_give_the_same_results(evaluator, subtask):
+    annotations = {}
+    for name in os.listdir(PRED_DIR):
+        if name.endswith('.ann'):
+            with open(os.path.join(PRED_DIR, name)) as f:
+                annotations[name] = f.read()
+
+    from_path = evaluator.evaluate({'subtask': subtask, 'pred_path': PRED_DIR})
+    from_texts = evaluator.evaluate({'subtask': subtask, 'annotations': annotations})
+
+    assert from_texts['pred_path'] is None
+    assert {**from_texts, 'pred_path': PRED_DIR} == from_path
+
+
+def test_coding(evaluator):
+    with open(PRED_CODING) as f:
+        predictions = f.read()
+
+    assert evaluator.evaluate({'subtask': 'coding', 'pred_path': PRED_CODING})['MAP'] == 0.5
+    assert evaluator.evaluate({'subtask': 'coding', 'predictions': predictions})['MAP'] == 0.5
+
+
+def test_unknown_subtask(evaluator):
+    with pytest.raises(ValueError):
+        evaluator.evaluate({'subtask': 'other'})
+
+
+def test_texts_are_split_as_files(tmp_path):
+    # \x0b and \x85 end lines for str.splitlines, but not in files
+    text = ('T1\tMORFOLOGIA_NEOPLASIA 0 7\tab\x0bc\x85de\r\n'
+            '#1\tAnnotatorNotes T1\t8000/6\r\n')
+    (tmp_path / 'a.ann').write_text(text, newline='')
+
+    labels = ['MORFOLOGIA_NEOPLASIA']
+    from_texts = ann_parsing.parse_ann_texts({'a.ann': text}, labels, with_notes=True)
+    from_files = ann_parsing.parse_ann(str(tmp_path), labels, with_notes=True)
+
+    assert from_texts.shape[0] == 1
+    assert from_texts.astype(object).equals(from_files.astype(object))
+
+
+def test_only_loopback():
+    result = run_script('server.py', '-g', GS_DIR, '--host', '0.0.0.0')
+
+    assert result.returncode == 2
+    assert 'unrecognized arguments: --host' in result.stderr
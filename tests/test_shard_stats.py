@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Sharded scoring (--stats; shard_stats.py).
+"""
+
+import json
+import os
+import shutil
+
+import pytest
+
+from conftest import GS_CODING, GS_DIR, PRED_CODING, PRED_DIR, run_script
+
+CASES = ['cc_onco1', 'cc_onco3']
+
+
+def write_shards(tmp_path):
+    '''
+    One shard per clinical case of the toy data: .ann directories and
+    coding TSVs (the first GS line is its headers row).
+    '''
+    with open(GS_CODING) as f:
+        gs_lines = f.readlines()
+    with open(PRED_CODING) as f:
+        pred_lines = f.readlines()
+
+    shards = []
+    for case in CASES:
+        shard = tmp_path / case
+        for name, directory in [('gs', GS_DIR), ('pred', PRED_DIR)]:
+            (shard / name).mkdir(parents=True)
+            shutil.copy(os.path.join(directory, case + '.ann'), shard / name)
+        (shard / 'gs.tsv').write_text(''.join(
+            gs_lines[:1] + [line for line in gs_lines[1:] if line.split('\t')[0] == case]))
+        (shard / 'pred.tsv').write_text(''.join(
+            line for line in pred_lines if line.split('\t')[0] == case))
+        shards.append(shard)
+    return shards
+
+
+def merge(stats_paths):
+    result = run_script('shard_stats.py', *stats_paths, '--format', 'json', '-n', 'merged')
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout)
+
+
+@pytest.mark.parametrize('subtask', ['ner', 'norm'])
+def test_ner_norm_shards(tmp_path, subtask):
+    stats_paths = []
+    for shard in write_shards(tmp_path):
+        stats_paths.append(str(shard / 'stats.npz'))
+        run_script('main.py', '-g', shard / 'gs', '-p', shard / 'pred', '-s', subtask,
+                   '--stats', stats_paths[-1])
+
+    expected = json.loads(run_script('main.py', '-g', GS_DIR, '-p', PRED_DIR, '-s', subtask,
+                                     '--format', 'json').stdout)
+    merged = merge(stats_paths)
+
+    assert merged == dict(expected, pred_path='merged')
+
+
+def test_coding_shards(tmp_path):
+    stats_paths = []
+    for shard in write_shards(tmp_path):
+        stats_paths.append(str(shard / 'stats.npz'))
+        run_script('main.py', '-g', shard / 'gs.tsv', '-p', shard / 'pred.tsv', '-s', 'coding',
+                   '--stats', stats_paths[-1])
+
+    expected = json.loads(run_script('main.py', '-g', GS_CODING, '-p', PRED_CODING,
+                                     '-s', 'coding', '--format', 'json').stdout)
+    merged = merge(stats_paths)
+
+    assert merged['MAP'] == pytest.approx(expected['MAP'])
+
+
+def test_comp_f1_shards(tmp_path, codes_path):
+    stats_paths = []
+    for case in CASES:
+        paths = {}
+        for name, path in [('gs', GS_CODING), ('pred', PRED_CODING)]:
+            with open(path) as f:
+                lines = [line for line in f if line.split('\t')[0] == case]
+            paths[name] = tmp_path / '{}-{}.tsv'.format(case, name)
+            paths[name].write_text(''.join(lines))
+        paths['test_files'] = tmp_path / '{}-test-files.txt'.format(case)
+        paths['test_files'].write_text(case + '\n')
+        stats_paths.append(str(tmp_path / '{}.npz'.format(case)))
+        run_script('comp_f1_diag_proc.py', '-g', paths['gs'], '-p', paths['pred'],
+                   '-c', codes_path, '-f', paths['test_files'], '--stats', stats_paths[-1])
+
+    test_files_path = tmp_path / 'test-files.txt'
+    test_files_path.write_text('\n'.join(CASES) + '\n')
+    expected = json.loads(run_script('comp_f1_diag_proc.py', '-g', GS_CODING, '-p', PRED_CODING,
+                                     '-c', codes_path, '-f', test_files_path,
+                                     '--format', 'json').stdout)
+
+    assert merge(stats_paths) == dict(expected, pred_path='merged')
+
+
+def test_shards_must_not_share_clinical_cases(tmp_path):
+    stats_paths = [str(tmp_path / 'a.npz'), str(tmp_path / 'b.npz')]
+    for stats_path in stats_paths:
+        run_script('main.py', '-g', GS_DIR, '-p', PRED_DIR, '-s', 'ner', '--stats', stats_path)
+
+    result = run_script('shard_stats.py', *stats_paths)
+
+    assert result.returncode != 0
+    assert 'more than one shard' in result.stderr
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Bootstrap confidence intervals and paired randomization tests
+(significance.py).
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import significance
+from conftest import GS_DIR, PRED_DIR, run_script
+
+
+def random_table(rng, n_cases, tp_rate):
+    GS_Pos = rng.integers(1, 10, n_cases)
+    Pred_Pos = rng.integers(1, 10, n_cases)
+    TP = np.minimum(rng.binomial(GS_Pos, tp_rate), Pred_Pos)
+    return pd.DataFrame({'TP': TP, 'Pred_Pos': Pred_Pos, 'GS_Pos': GS_Pos},
+                        index=['cc{}'.format(i) for i in range(n_cases)])
+
+
+def test_bootstrap():
+    table = random_table(np.random.default_rng(0), 200, 0.6)
+    P = table['TP'].sum() / table['Pred_Pos'].sum()
+
+    intervals = significance.bootstrap('norm', table, n_resamples=2000)
+
+    assert set(intervals) == {'P', 'R', 'F1'}
+    assert intervals['P'][0] < P < intervals['P'][1]
+    # Same intervals as resampling the clinical cases one resample at a time
+    rng = np.random.default_rng(1)
+    samples = [table.iloc[rng.integers(0, 200, 200)].sum() for _ in range(2000)]
+    reference = np.percentile([sample['TP'] / sample['Pred_Pos'] for sample in samples],
+                              [2.5, 97.5])
+    assert intervals['P'] == pytest.approx(tuple(reference), abs=0.01)
+
+
+def test_blocks_do_not_change_the_results(monkeypatch):
+    table = random_table(np.random.default_rng(0), 50, 0.6)
+    expected = significance.bootstrap('ner', table, n_resamples=300)
+
+    monkeypatch.setattr(significance, 'BLOCK_ELEMENTS', 50 * 7)
+
+    assert significance.block_sizes(300, 50)[:2] == [7, 7]
+    assert significance.bootstrap('ner', table, n_resamples=300) == expected
+
+
+def test_randomization_test():
+    rng = np.random.default_rng(0)
+    table_a = random_table(rng, 300, 0.3)
+    table_b = table_a.assign(TP=np.minimum(table_a['GS_Pos'], table_a['Pred_Pos']))
+
+    same = significance.randomization_test('norm', table_a, table_a, n_resamples=200)
+    better = significance.randomization_test('norm', table_a, table_b, n_resamples=200)
+
+    assert same['F1'] == (0.0, 1.0)
+    assert better['F1'][0] > 0
+    assert better['F1'][1] == 1 / 201
+
+    with pytest.raises(Exception, match='same Gold Standard'):
+        significance.randomization_test('norm', table_a,
+                                        table_a.assign(GS_Pos=table_a['GS_Pos'] + 1))
+
+
+def test_coding_ignores_clinical_cases_without_predictions():
+    table_a = pd.DataFrame({'AP': [1.0, 0.5]}, index=['cc1', 'cc2'])
+    table_b = pd.DataFrame({'AP': [1.0]}, index=['cc1'])
+
+    tests = significance.randomization_test('coding', table_a, table_b, n_resamples=100)
+
+    assert tests['MAP'][0] == pytest.approx(1.0 - 0.75)
+
+
+def test_main(tmp_path):
+    stats_path = str(tmp_path / 'run.npz')
+    run_script('main.py', '-g', GS_DIR, '-p', PRED_DIR, '-s', 'norm', '--stats', stats_path)
+
+    result = run_script('significance.py', '-a', stats_path, '-b', stats_path,
+                        '-n', '100', '--format', 'json')
+
+    assert result.returncode == 0, result.stderr
+    content = json.loads(result.stdout)
+    assert content['a']['n_cases'] == 2
+    assert content['a']['F1']['value'] == pytest.approx(0.8)
+    assert content['randomization']['F1'] == {'difference': 0.0, 'p_value': 1.0}
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming evaluation of coding prediction TSVs (--stream;
+prediction_stream.py).
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import cantemist_coding
+import comp_f1_diag_proc
+import prediction_stream
+import valid_codes as vc
+from test_coding_map import write_random_run
+
+
+def write_contiguous_run(tmp_path, seed, n_queries):
+    '''
+    write_random_run with the rows of every clinical case made contiguous
+    (keeping their order).
+    '''
+    gs_path, pred_path, valid_codes = write_random_run(tmp_path, seed, n_queries=n_queries)
+    pred = pd.read_csv(pred_path, sep='\t', header=None, dtype=str)
+    pred.sort_values(0, kind='stable').to_csv(pred_path, sep='\t', index=False, header=False)
+    return gs_path, pred_path, valid_codes
+
+
+@pytest.mark.parametrize('chunk_rows', [1, 7, 100000])
+def test_chunks_have_complete_clinical_cases(tmp_path, chunk_rows):
+    _, pred_path, _ = write_contiguous_run(tmp_path, seed=0, n_queries=30)
+    pred = pd.read_csv(pred_path, sep='\t', header=None, dtype=str)
+
+    chunks = list(prediction_stream.iter_case_chunks(pred_path, chunk_rows=chunk_rows))
+
+    assert pd.concat(chunks, ignore_index=True).values.tolist() == pred.values.tolist()
+    cases = [set(chunk['clinical_case']) for chunk in chunks]
+    assert sum(len(chunk_cases) for chunk_cases in cases) == len(set.union(*cases))
+
+
+@pytest.mark.parametrize('chunk_rows', [5, 100000])
+def test_stream_gives_the_same_results(tmp_path, chunk_rows):
+    gs_path, pred_path, valid_codes = write_contiguous_run(tmp_path, seed=1, n_queries=50)
+    gs, qid_gs = cantemist_coding.format_gs(gs_path)
+    pred = cantemist_coding.format_predictions(pred_path, valid_codes, qid_gs)
+    metrics = ['MAP', 'P@3', 'nDCG@5', 'MRR']
+
+    assert cantemist_coding.compute_map_stream(pred_path, valid_codes, gs, qid_gs,
+                                               chunk_rows=chunk_rows) == pytest.approx(
+        cantemist_coding.compute_map(gs, pred))
+    means, per_query = cantemist_coding.compute_ranking_metrics_stream(
+        pred_path, valid_codes, gs, qid_gs, metrics, chunk_rows=chunk_rows)
+    expected_means, expected_per_query = cantemist_coding.compute_ranking_metrics(gs, pred,
+                                                                                  metrics)
+    assert means == pytest.approx(expected_means)
+    assert np.allclose(per_query.loc[expected_per_query.index], expected_per_query)
+
+    gs_codes = comp_f1_diag_proc.read_gs(gs_path)
+    test_files = list(qid_gs)
+    stream = comp_f1_diag_proc.calculate_metrics_stream(gs_codes, pred_path, valid_codes,
+                                                        test_files, chunk_rows=chunk_rows)
+    in_memory = comp_f1_diag_proc.calculate_metrics(
+        gs_codes, comp_f1_diag_proc.read_run(pred_path, valid_codes, test_files))
+    for values, expected in zip(stream, in_memory):
+        if isinstance(expected, float):
+            assert values == pytest.approx(expected)
+        else:
+            assert values.sort_index().to_dict() == pytest.approx(
+                expected.sort_index().to_dict(), nan_ok=True)
+
+
+def test_clinical_cases_must_be_contiguous(tmp_path):
+    pred_path = tmp_path / 'pred.tsv'
+    pred_path.write_text('cc1\t8000/6\ncc2\t8000/6\ncc1\t8010/3\n')
+
+    with pytest.raises(Exception, match='contiguous'):
+        cantemist_coding.compute_map_stream(str(pred_path), vc.codes_array(['8000/6']),
+                                            *cantemist_coding.format_gs(
+                                                _write_gs(tmp_path)), chunk_rows=2)
+
+
+def _write_gs(tmp_path):
+    gs_path = tmp_path / 'gs.tsv'
+    gs_path.write_text('clinical_case\tcode\ncc1\t8000/6\ncc2\t8000/6\n')
+    return str(gs_path)
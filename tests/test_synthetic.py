@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic corpus generator of the benchmarks (benchmarks/synthetic.py).
+"""
+
+import filecmp
+import os
+import sys
+
+from conftest import ROOT, run_script
+
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+import synthetic
+
+
+def test_same_seed_same_corpus(tmp_path):
+    first = synthetic.write_corpus(str(tmp_path / 'a'), 200, seed=3)
+    second = synthetic.write_corpus(str(tmp_path / 'b'), 200, seed=3)
+
+    for name in ['gs', 'pred']:
+        comparison = filecmp.dircmp(first[name], second[name])
+        assert comparison.left_only == comparison.right_only == comparison.diff_files == []
+        assert len(comparison.same_files) == 10
+    for name in ['gs_coding', 'pred_coding', 'test_files']:
+        assert filecmp.cmp(first[name], second[name], shallow=False)
+
+
+def test_corpus_is_valid_and_scored(tmp_path, codes_path):
+    paths = synthetic.write_corpus(str(tmp_path / 'corpus'), 200, seed=0)
+
+    check = run_script('validate.py', '-p', paths['gs'], paths['pred'], '-s', 'norm',
+                       '-c', codes_path, '--errors-only')
+    assert check.returncode == 0, check.stdout
+
+    for subtask in ['ner', 'norm']:
+        result = run_script('main.py', '-g', paths['gs'], '-p', paths['pred'], '-s', subtask)
+        assert result.returncode == 0, result.stderr
+        P, R, F1 = [float(x) for x in result.stdout.splitlines()[-1].split('|')[1:]]
+        assert 0 < P < 1 and 0 < R < 1
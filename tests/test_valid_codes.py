@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled index of the valid codes TSV (valid_codes.py).
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import valid_codes as vc
+from conftest import GS_DIR, PRED_DIR, run_script
+
+CODES = '8000/6\tdescription\n8010/3\n8140/3/H\n'
+
+
+@pytest.fixture
+def codes_path(tmp_path):
+    path = tmp_path / 'codes.tsv'
+    path.write_text(CODES)
+    return str(path)
+
+
+def test_index_is_built_and_memory_mapped(codes_path):
+    codes = vc.load_valid_codes(codes_path)
+
+    assert list(codes) == ['8000/6', '8010/3', '8140/3/h']
+    assert os.path.isfile(codes_path + vc.INDEX_SUFFIX)
+    assert isinstance(vc.load_valid_codes(codes_path), np.memmap)
+    assert list(vc.load_valid_codes(codes_path, use_index=False)) == list(codes)
+
+
+def test_lookups(codes_path):
+    codes = vc.load_valid_codes(codes_path)
+
+    assert list(vc.isin(pd.Series(['8010/3', '8010/6', None, '9999/9', '8140/3/h']), codes)) == [
+        True, False, False, False, True]
+    assert vc.contains(codes, '8000/6')
+    assert vc.contains(codes, '9999/9') == False
+    assert vc.isin(pd.Series(['8000/6']), vc.codes_array([])).tolist() == [False]
+
+
+def test_index_is_rebuilt_when_the_tsv_changes(codes_path):
+    vc.load_valid_codes(codes_path)
+    with open(codes_path, 'a') as f:
+        f.write('9999/9\n')
+
+    assert '9999/9' in list(vc.load_valid_codes(codes_path))
+
+
+@pytest.mark.parametrize('header', ['garbage', '',
+                                    vc.INDEX_MAGIC + '\tsize\tmtime\tsha1\tn\n'])
+def test_corrupt_header_is_rebuilt(codes_path, header):
+    vc.load_valid_codes(codes_path)
+    with open(codes_path + vc.INDEX_SUFFIX, 'w') as f:
+        f.write(header)
+
+    assert list(vc.load_valid_codes(codes_path)) == ['8000/6', '8010/3', '8140/3/h']
+    assert vc.read_header(codes_path + vc.INDEX_SUFFIX) is not None
+
+
+def test_corrupt_array_is_rebuilt(codes_path):
+    vc.load_valid_codes(codes_path)
+    array_path = codes_path + vc.CODES_SUFFIX
+    with open(array_path, 'rb') as f:
+        content = f.read()
+    with open(array_path, 'wb') as f:
+        f.write(content[:len(content) // 2])
+
+    assert list(vc.load_valid_codes(codes_path)) == ['8000/6', '8010/3', '8140/3/h']
+
+
+def test_norm_only_checks_codes_with_c(codes_path):
+    args = ['-g', GS_DIR, '-p', PRED_DIR, '-s', 'norm']
+
+    assert 'not included in the list of valid codes' not in run_script('main.py', *args).stderr
+    assert 'not included in the list of valid codes' in run_script('main.py', *args, '-c',
+                                                                   codes_path).stderr
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Submission linter (validate.py).
+"""
+
+import subprocess
+import sys
+
+import pytest
+
+import validate
+from conftest import GS_DIR, PRED_CODING, PRED_DIR, SRC, run_script
+from test_ner_norm import write_corpus
+
+NOTES = {'a.ann': 'T1\tMORFOLOGIA_NEOPLASIA 0 3\tabc\n'
+                  '#1\tAnnotatorNotes\t8000/6\n'
+                  '#2\tAnnotatorNotes T9\t8000/6\n'
+                  '#3\tAnnotatorNotes T1\t8000/6\n'}
+
+
+def test_toy_data(codes_path):
+    result = run_script('validate.py', '-p', PRED_DIR, GS_DIR, '-s', 'norm', '-c', codes_path)
+
+    assert result.returncode == 0
+    assert result.stdout.splitlines() == [
+        '{}/cc_onco1.ann:8: warning: code 1000/0 not in the valid codes'.format(PRED_DIR)]
+    assert result.stderr == '4 files checked: 0 errors, 1 warnings\n'
+
+
+@pytest.mark.parametrize('subtask, level, returncode', [('ner', 'warning', 0),
+                                                        ('norm', 'error', 1)])
+def test_annotator_notes(tmp_path, subtask, level, returncode):
+    pred_path = write_corpus(tmp_path / 'pred', NOTES)
+
+    result = run_script('validate.py', '-p', pred_path, '-s', subtask)
+
+    assert result.returncode == returncode
+    assert [line.split(': ')[1] for line in result.stdout.splitlines()] == [level, level]
+    assert [line.split(':')[1] for line in result.stdout.splitlines()] == ['2', '3']
+
+
+def test_ann_problems(tmp_path):
+    pred_path = write_corpus(tmp_path / 'pred', {
+        'a.ann': 'T1\tMORFOLOGIA_NEOPLASIA 0 3;5 7\tabc de\n'
+                 'T2\tMORFOLOGIA_NEOPLASIA 5 2\tab\n'
+                 'T3\tOTHER 0 3\tabc\n'
+                 'T4\tMORFOLOGIA_NEOPLASIA 0 3\txyz\n'
+                 'T5\tbad\n'
+                 'R1\tRel Arg1:T4\t\n'})
+    (tmp_path / 'pred' / 'a.txt').write_text('abcdefgh')
+
+    problems, n_files = validate.main([pred_path], 'ner')
+
+    assert n_files == 1
+    assert [(lineno, level) for _, lineno, level, _ in problems] == [
+        (1, validate.ERROR), (2, validate.WARNING), (3, validate.WARNING),
+        (4, validate.WARNING), (5, validate.ERROR), (6, validate.ERROR)]
+
+
+def test_tsv_problems(tmp_path, codes_path):
+    pred_path = tmp_path / 'pred.tsv'
+    pred_path.write_text('cc1\t8000/6\ncc1\nc c2\t\n\ncc3\t1000/0\n')
+
+    problems, _ = validate.main([str(pred_path)], 'coding', codes_path=codes_path)
+
+    assert [(lineno, level) for _, lineno, level, _ in problems] == [
+        (2, validate.ERROR), (3, validate.ERROR), (5, validate.WARNING)]
+    assert validate.main([PRED_CODING], 'coding', codes_path=codes_path)[0][0][1:3] == (
+        3, validate.WARNING)
+
+
+def test_jobs_give_the_same_problems(tmp_path):
+    pred_path = write_corpus(tmp_path / 'pred', {'{}.ann'.format(i): NOTES['a.ann']
+                                                 for i in range(10)})
+
+    assert validate.main([pred_path], 'norm', jobs=3) == validate.main([pred_path], 'norm')
+
+
+def test_pandas_is_not_imported():
+    result = subprocess.run([sys.executable, '-c', 'import sys, validate; '
+                             'print(sorted({"pandas", "numpy"} & set(sys.modules)))'],
+                            cwd=SRC, capture_output=True, text=True)
+
+    assert result.stdout == '[]\n', result.stderr